@@ -0,0 +1,170 @@
+"""Offline export benchmark for the latency and carbon agents.
+
+Each run imports one agent in a fresh process, registers enough targets to produce
+the requested number of series, stubs the probes (latency) or points the agent at a
+local ElectricityMaps stand-in (carbon), and exports to a local OTLP receiver through
+the agent's own MeterProvider and reader. One JSON object per run is printed:
+
+    python benchmarks/bench_export.py --agents latency carbon --series 10 1000 100000
+    python benchmarks/bench_export.py --output new.jsonl --compare old.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+AGENT_METRICS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(AGENT_METRICS)
+sys.path.append(os.path.join(AGENT_METRICS, "carbon"))
+
+AGENT_DIRS = {"latency": "latency", "carbon": "carbon"}
+FORECAST_LENGTH = 24
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _setup_latency(series):
+    import metric_latency as agent
+
+    async def fake_probe(node_ip):
+        return random.uniform(0.1, 50)
+
+    agent.scheduler.probe_fn = fake_probe
+    clusters = [{"domain": "bench", "cluster": f"cluster{i % 50}", "node_ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"} for i in range(series)]
+    agent.cluster_registry.add_many(clusters)
+    for cluster in clusters:
+        agent.scheduler.add_target(cluster["node_ip"])
+    deadline = time.monotonic() + 120
+    while any(agent.scheduler.latest(c["node_ip"]) is None for c in clusters) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return agent
+
+
+def _setup_carbon(series):
+    import metrics_carbon as agent
+
+    # One live series plus one per forecast index per location in the default raw mode
+    locations = [{"lat": str(round(-80 + i * 0.001, 3)), "lon": "2.35"} for i in range(max(1, series // (FORECAST_LENGTH + 1)))]
+    agent.location_registry.add_many(locations)
+    # Warm the ElectricityMaps caches so the runs measure collection and export only
+    list(agent.get_live_carbon(None))
+    list(agent.get_forecast_carbon(None))
+    return agent
+
+
+def run_worker(agent_name, series, iterations):
+    """Runs inside the benchmark subprocess, returns the measurements."""
+    sys.path.insert(0, os.path.join(AGENT_METRICS, AGENT_DIRS[agent_name]))
+    agent = _setup_latency(series) if agent_name == "latency" else _setup_carbon(series)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    durations = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        flush_start = time.perf_counter()
+        agent.metric_reader.force_flush()
+        durations.append((time.perf_counter() - flush_start) * 1000)
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "elapsed_s": elapsed,
+        "export_p50_ms": _percentile(durations, 50),
+        "export_p99_ms": _percentile(durations, 99),
+        "cpu_s": (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime),
+        "peak_rss_mb": usage_after.ru_maxrss / 1024,
+    }
+
+
+def run(agent_name, series, iterations, protocol, sink, upstream_url):
+    env = dict(
+        os.environ,
+        COLLECTOR_ENDPOINT=sink.grpc_endpoint if protocol == "grpc" else sink.http_endpoint,
+        COLLECTOR_PROTOCOL=protocol,
+        INTERVAL_MS=str(24 * 3600 * 1000),  # only the benchmark's flushes export
+        ELECTRICITYMAPS_URL=upstream_url,
+        FLUSH_DEBOUNCE_MS="0",
+        PROBE_START_JITTER_S="0",
+    )
+    before = sink.stats()
+    worker = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", agent_name, str(series), str(iterations)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    measured = json.loads(worker.stdout.strip().splitlines()[-1])
+    after = sink.stats()
+    return {
+        "agent": agent_name,
+        "protocol": protocol,
+        "series": series,
+        "iterations": iterations,
+        "exported_points_per_s": (after["data_points"] - before["data_points"]) / measured["elapsed_s"],
+        "bytes_per_export": (after["bytes"] - before["bytes"]) / iterations,
+        **measured,
+    }
+
+
+def compare(results, baseline_path):
+    """Print the relative change against a previous --output file, matched by agent, protocol and series."""
+    with open(baseline_path) as baseline_file:
+        baseline = {(r["agent"], r["protocol"], r["series"]): r for r in map(json.loads, baseline_file)}
+    for result in results:
+        old = baseline.get((result["agent"], result["protocol"], result["series"]))
+        if old is None:
+            continue
+        change = {
+            key: round(result[key] / old[key] - 1, 3) if old[key] else None
+            for key in ("exported_points_per_s", "export_p50_ms", "export_p99_ms", "cpu_s", "peak_rss_mb")
+        }
+        print(json.dumps({"compare": [result["agent"], result["protocol"], result["series"]], **change}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline OTLP export benchmark for the agents")
+    parser.add_argument("--agents", nargs="+", choices=list(AGENT_DIRS), default=list(AGENT_DIRS))
+    parser.add_argument("--series", nargs="+", type=int, default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--protocols", nargs="+", choices=["grpc", "http"], default=["grpc", "http"])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="also write the results as JSON lines to this file")
+    parser.add_argument("--compare", help="JSON lines file from a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    from common.otlp_sink import OTLPSink
+    from stub_electricitymaps import StubElectricityMaps
+
+    sink = OTLPSink().start()
+    upstream = StubElectricityMaps().start()
+    results = []
+    try:
+        for agent_name in args.agents:
+            for protocol in args.protocols:
+                for series in args.series:
+                    result = run(agent_name, series, args.iterations, protocol, sink, upstream.url)
+                    results.append(result)
+                    print(json.dumps(result), flush=True)
+    finally:
+        sink.stop()
+        upstream.stop()
+    if args.output:
+        with open(args.output, "w") as output:
+            output.writelines(json.dumps(result) + "\n" for result in results)
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        print(json.dumps(run_worker(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))), flush=True)
+        # Skip the agent's shutdown export so the sink only counts the measured iterations
+        os._exit(0)
+    else:
+        main()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ttl_s seconds.
+
+    Concurrent misses for the same key share a single call to the loader, and an
+    expired entry keeps being served while one background refresh replaces it.
+    Loader results of None are treated as failures and never cached. With max_stale_s,
+    an entry whose refreshes kept failing is dropped max_stale_s after it expired, and
+    get() loads it again like a miss, returning None while the loader fails.
+    """
+
+    def __init__(self, ttl_s, max_entries=1024, refresh_workers=4, clock=time.monotonic, max_stale_s=None):
+        self.ttl_s = ttl_s
+        self.max_stale_s = max_stale_s
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (value, fetched_at)
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                value, fetched_at = entry
+                age = self.clock() - fetched_at
+                if self.max_stale_s is not None and age >= self.ttl_s + self.max_stale_s:
+                    # Too old to stand in for the current value any more
+                    del self._entries[key]
+                else:
+                    if age >= self.ttl_s and key not in self._in_flight:
+                        future = self._in_flight[key] = Future()
+                        self._refresher.submit(self._load, key, loader, future)
+                    return value
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if leader:
+            self._load(key, loader, future)
+        return future.result()
+
+    def put(self, key, value):
+        """Store a value obtained some other way, as if the loader had just returned it."""
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _load(self, key, loader, future):
+        try:
+            value = loader()
+        except Exception:
+            logging.exception(f"Error loading cache entry {key}")
+            value = None
+        with self._lock:
+            if value is not None:
+                self._entries[key] = (value, self.clock())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._in_flight.pop(key, None)
+        future.set_result(value)
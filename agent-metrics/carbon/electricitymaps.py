@@ -0,0 +1,186 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import TTLCache
+from zones import ZoneIndex
+
+load_dotenv()
+
+BASE_URL = os.getenv("ELECTRICITYMAPS_URL", "https://api.electricitymap.org/v3")
+API_KEY = os.getenv("API_KEY")
+# Upstream data changes hourly, the forecast even less often than the live value
+LIVE_TTL_S = float(os.getenv("LIVE_TTL_S", "300"))
+FORECAST_TTL_S = float(os.getenv("FORECAST_TTL_S", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "4096"))
+# While refreshes fail expired values are still served, for at most this long
+LIVE_MAX_STALE_S = float(os.getenv("LIVE_MAX_STALE_S", 2 * LIVE_TTL_S))
+FORECAST_MAX_STALE_S = float(os.getenv("FORECAST_MAX_STALE_S", 2 * FORECAST_TTL_S))
+# HTTP client
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "32"))
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "5"))
+RETRY_TOTAL = int(os.getenv("RETRY_TOTAL", "3"))
+RETRY_BACKOFF_S = float(os.getenv("RETRY_BACKOFF_S", "0.5"))
+
+# Locations in the same grid zone get the same answer, so data is fetched once per zone
+ZONE_DEDUP = os.getenv("ZONE_DEDUP", "true").lower() == "true"
+ZONE_INDEX_PATH = os.getenv("ZONE_INDEX_PATH")
+
+live_cache = TTLCache(LIVE_TTL_S, CACHE_MAX_ENTRIES, max_stale_s=LIVE_MAX_STALE_S)
+forecast_cache = TTLCache(FORECAST_TTL_S, CACHE_MAX_ENTRIES, max_stale_s=FORECAST_MAX_STALE_S)
+zone_index = ZoneIndex(ZONE_INDEX_PATH)
+# Only coalesces concurrent resolutions of one coordinate, the result is kept in zone_index
+zone_cache = TTLCache(float("inf"), CACHE_MAX_ENTRIES)
+
+
+def create_session(pool_size=FETCH_CONCURRENCY, retries=RETRY_TOTAL, backoff_s=RETRY_BACKOFF_S):
+    """Keep-alive session shared by every fetch, retrying 429/5xx with jittered exponential backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_s,
+        backoff_jitter=backoff_s,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    new_session = requests.Session()
+    new_session.headers['auth-token'] = str(API_KEY)
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    return new_session
+
+
+session = create_session()
+# Called as on_request(endpoint, target, duration_s, status) after every request when set
+on_request = None
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix="carbon-fetch")
+
+
+def _get(url, params):
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = session.get(url, params=params, timeout=REQUEST_TIMEOUT_S)
+        status = response.status_code
+        return response
+    except requests.RequestException as e:
+        logging.error(f"Error requesting {url} {params}: {e}")
+        return None
+    finally:
+        if on_request is not None:
+            target = params.get('zone') or f"{params.get('lat')},{params.get('lon')}"
+            on_request(url.rsplit("/", 1)[-1], target, time.perf_counter() - start, status)
+
+
+def _params(lat, lon, zone):
+    return {'zone': zone} if zone else {'lat': lat, 'lon': lon}
+
+
+def fetch_live(lat=None, lon=None, zone=None):
+    """Body of the latest carbon intensity for a zone or a coordinate, None on failure."""
+    url = f"{BASE_URL}/carbon-intensity/latest"
+    params = _params(lat, lon, zone)
+
+    logging.debug(f"Request URL: {url}")
+    logging.debug(f"Request params: {params}")
+
+    response = _get(url, params)
+    if response is None:
+        return None
+
+    logging.debug(f"Response status code: {response.status_code}")
+    logging.debug(f"Response content: {response.content}")
+
+    if response.status_code == 200:
+        return response.json()
+    else:
+        return None
+
+
+def fetch_live_carbon_intensity(lat: str = None, lon: str = None, zone: str = None):
+    body = fetch_live(lat, lon, zone)
+    return body["carbonIntensity"] if body is not None else None
+
+
+def fetch_forecasted_carbon_intensity(lat: str = None, lon: str = None, zone: str = None):
+    url = f"{BASE_URL}/carbon-intensity/forecast"
+    params = _params(lat, lon, zone)
+    response = _get(url, params)
+    if response is None:
+        return None
+    if response.status_code == 200:
+        forecast_values = []
+        for forecast_item in response.json()["forecast"]:
+            forecast_values.append(forecast_item['carbonIntensity'])
+        return forecast_values
+    else:
+        logging.exception(f"Error fetching forecasted data: {response.status_code}")
+        logging.exception(f"Error: {response.reason}")
+        return None
+
+
+def _resolve_zone(lat, lon):
+    body = fetch_live(lat, lon)
+    if body is None:
+        return None
+    zone = body.get("zone") or ""
+    zone_index.set(lat, lon, zone)
+    # The answer that told us the zone is also the zone's live value
+    if zone and body.get("carbonIntensity") is not None:
+        live_cache.put(("latest", zone), body["carbonIntensity"])
+    return zone
+
+
+def resolve_zone(lat: str, lon: str):
+    """Grid zone of a coordinate, asked to the API once and then read from zone_index.
+
+    Returns "" when the API gives no zone for it and None when it could not be asked.
+    """
+    zone = zone_index.get(lat, lon)
+    if zone is None:
+        zone = zone_cache.get(("zone", lat, lon), lambda: _resolve_zone(lat, lon))
+    return zone
+
+
+def get_live_carbon_intensity(lat: str, lon: str):
+    if not ZONE_DEDUP:
+        return live_cache.get(("latest", lat, lon), lambda: fetch_live_carbon_intensity(lat, lon))
+    zone = resolve_zone(lat, lon)
+    if zone is None:
+        return None
+    return live_cache.get(("latest", zone or (lat, lon)), lambda: fetch_live_carbon_intensity(lat, lon, zone))
+
+
+def get_forecasted_carbon_intensity(lat: str, lon: str):
+    if not ZONE_DEDUP:
+        return forecast_cache.get(("forecast", lat, lon), lambda: fetch_forecasted_carbon_intensity(lat, lon))
+    zone = resolve_zone(lat, lon)
+    if zone is None:
+        return None
+    return forecast_cache.get(("forecast", zone or (lat, lon)), lambda: fetch_forecasted_carbon_intensity(lat, lon, zone))
+
+
+def get_many(getter, locations):
+    """Run getter(lat, lon) concurrently once per grid zone, results in the order of locations.
+
+    Every location of a zone gets the zone's result. Locations whose zone is not known
+    yet are run on their own and resolve it, so they are grouped from the next call;
+    the zones they resolved are saved to zone_index's file once, at the end.
+    """
+    keys = [(zone_index.get(loc['lat'], loc['lon']) if ZONE_DEDUP else None) or (loc['lat'], loc['lon']) for loc in locations]
+    futures = {}
+    for key, loc in zip(keys, locations):
+        if key not in futures:
+            futures[key] = fetch_pool.submit(getter, loc['lat'], loc['lon'])
+    try:
+        return [futures[key].result() for key in keys]
+    finally:
+        zone_index.save()
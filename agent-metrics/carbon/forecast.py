@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def parse_hours(value):
+    """Parse a comma separated list of hours such as "0,1,3,6,12,24"."""
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def horizon_buckets(values, edges):
+    """Mean forecast per horizon bucket [edges[i], edges[i+1]) in hours.
+
+    Returns (label, mean) pairs. Buckets starting past the end of the forecast are
+    left out and the last one is truncated, labels always come from the configured
+    edges so the exported series stay the same from one collection to the next.
+    """
+    arr = np.asarray(values, dtype=float)
+    edges = np.asarray(edges, dtype=int)
+    cumsum = np.concatenate(([0.0], np.cumsum(arr)))
+    lo, hi = edges[:-1], np.minimum(edges[1:], len(arr))
+    valid = lo < hi
+    means = (cumsum[hi[valid]] - cumsum[lo[valid]]) / (hi[valid] - lo[valid])
+    labels = [f"{start}-{end}h" for start, end in zip(edges[:-1][valid], edges[1:][valid])]
+    return list(zip(labels, means.tolist()))
+
+
+def summarize(values, window_lengths):
+    """Min, mean and the lowest-carbon window of each length, from a single cumulative sum.
+
+    Returns a dict with "min", "mean" and "windows", the latter mapping each window
+    length in hours to (start hour, mean intensity over the window). Windows longer
+    than the forecast are skipped. An empty forecast has no summary and gives None.
+    """
+    arr = np.asarray(values, dtype=float)
+    if arr.size == 0:
+        return None
+    cumsum = np.concatenate(([0.0], np.cumsum(arr)))
+    windows = {}
+    for length in window_lengths:
+        if 0 < length <= len(arr):
+            sums = cumsum[length:] - cumsum[:-length]
+            start = int(np.argmin(sums))
+            windows[length] = (start, float(sums[start] / length))
+    return {"min": float(arr.min()), "mean": float(cumsum[-1] / len(arr)), "windows": windows}
@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from typing import List, Dict
-from opentelemetry import metrics
 from opentelemetry.metrics import Observation, CallbackOptions
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.resources import SERVICE_NAME, SERVICE_NAMESPACE, SERVICE_VERSION, Resource
 from dotenv import load_dotenv
 from datetime import datetime
+import math
 import time
 import os
-import requests
+import sys
 import logging
-import threading
+import electricitymaps
+from electricitymaps import get_live_carbon_intensity, get_forecasted_carbon_intensity, get_many, zone_index
+from forecast import horizon_buckets, parse_hours, summarize
+from store import CarbonStore
+
+# Shared agent modules live next to this directory (copied to /app/common in the image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.registry import Registry
+from common.sharding import Shard
+from common.snapshot import CycleSnapshot
+from common.runtime import AgentRuntime, current, install
+from common import profiler
+from common.profiler import format_collapsed
+from common.pull import CONTENT_TYPE
 
 
 load_dotenv()
@@ -25,72 +35,50 @@ logging.basicConfig(level=logging.DEBUG)
 
 LATITUDE = os.getenv("LATITUDE")
 LONGITUDE = os.getenv("LONGITUDE")
-API_KEY = os.getenv("API_KEY")
-COLLECTOR_ENDPOINT = os.getenv("COLLECTOR_ENDPOINT")
-INTERVAL_MS = os.getenv("INTERVAL_MS")
-
-# In-memory list to store latitudes and longitudes
-lat_lon_list = []
-
-# Configure OpenTelemetry
-resource = Resource(attributes={
-    SERVICE_NAME: "cluster-monitor",
-    SERVICE_NAMESPACE: "fluidos",
-    SERVICE_VERSION: "1.0.0"
-})
-
-metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=COLLECTOR_ENDPOINT, insecure=True), int(INTERVAL_MS))
-provider = MeterProvider(metric_readers=[metric_reader], resource=resource)
-metrics.set_meter_provider(provider)
-meter = metrics.get_meter("cluster-monitor", "1.0.0")
-
-def get_live_carbon_intensity(lat: str, lon: str):
-    BASE_URL = 'https://api.electricitymap.org/v3'
-    HEADERS = {'auth-token': str(API_KEY)}
-    url = f"{BASE_URL}/carbon-intensity/latest"
-    params = {'lat': lat, 'lon': lon}
+# "raw" exports one series per forecast index stamped with the current date,
+# "bucketed" exports a constant set of series per location: horizon buckets plus a summary
+FORECAST_EXPORT_MODE = os.getenv("FORECAST_EXPORT_MODE", "raw")
+FORECAST_BUCKET_EDGES_H = parse_hours(os.getenv("FORECAST_BUCKET_EDGES_H", "0,1,3,6,12,24"))
+FORECAST_WINDOWS_H = parse_hours(os.getenv("FORECAST_WINDOWS_H", "1,3,6"))
+# Fetched live and forecast values are kept per location for the /history/ and /greenest/ queries
+STORE_RETENTION_H = int(os.getenv("STORE_RETENTION_H", "168"))
+STORE_HORIZON_H = int(os.getenv("STORE_HORIZON_H", "72"))
+STORE_PATH = os.getenv("STORE_PATH")
+STORE_SNAPSHOT_S = float(os.getenv("STORE_SNAPSHOT_S", "300"))
 
-    logging.debug(f"Request URL: {url}")
-    logging.debug(f"Request params: {params}")
+# In-memory registry of latitudes and longitudes, callbacks iterate over location_registry.snapshot()
+location_registry = Registry(lambda loc: (loc['lat'], loc['lon']))
+# With SHARD_MEMBERS set, each replica only fetches the locations it owns (SHARD_ID, default hostname)
+shard = Shard.from_env()
+carbon_store = CarbonStore(STORE_RETENTION_H, STORE_HORIZON_H, path=STORE_PATH)
+carbon_store.start_snapshots(STORE_SNAPSHOT_S)
 
-    response = requests.get(url, headers=HEADERS, params=params)
-
-    logging.debug(f"Response status code: {response.status_code}")
-    logging.debug(f"Response content: {response.content}")
-
-    if response.status_code == 200:
-        return response.json()["carbonIntensity"]
-    else:
-        return None
-
-def get_forecasted_carbon_intensity(lat: str, lon: str):
-    BASE_URL = 'https://api.electricitymap.org/v3'
-    HEADERS = {'auth-token': str(API_KEY)}
-    url = f"{BASE_URL}/carbon-intensity/forecast"
-    params = {'lat': lat, 'lon': lon}
-    response = requests.get(url, headers=HEADERS, params=params)
-    if response.status_code == 200:
-        forecast_values = []
-        for forecast_item in response.json()["forecast"]:
-            forecast_values.append(forecast_item['carbonIntensity'])
-        return forecast_values
-    else:
-        logging.exception(f"Error fetching forecasted data: {response.status_code}")
-        logging.exception(f"Error: {response.reason}")
-        return None
+# Configure OpenTelemetry: exporter, reader and MeterProvider, shared with the other collectors when hosted by agent_runtime.py
+runtime = current() or install(AgentRuntime.from_env("fluidos_carbon.prom", "carbon"))
+metric_exporter, metric_reader, provider, flusher = runtime.exporter, runtime.reader, runtime.provider, runtime.flusher
+meter = runtime.meter("cluster-monitor", "1.0.0")
+# The agent's own metrics: ElectricityMaps request durations per zone and the number of registered locations
+electricitymaps.on_request = runtime.self_metrics.record_upstream
+runtime.self_metrics.watch_registry("carbon", location_registry)
 
 def get_live_carbon(_: CallbackOptions):
-    for loc in lat_lon_list:
+    locations = shard.select(location_registry.snapshot(), location_registry.key)
+    for loc, carbon in zip(locations, get_many(get_live_carbon_intensity, locations)):
         lat, lon = loc['lat'], loc['lon']
-        carbon = get_live_carbon_intensity(lat, lon)
         attributes = {'latitude': lat, 'longitude': lon}
         if carbon is not None:
+            carbon_store.record_live((lat, lon), carbon)
             yield Observation(carbon, attributes)
 
 def get_forecast_carbon(_: CallbackOptions):
-    for loc in lat_lon_list:
+    if FORECAST_EXPORT_MODE == "bucketed":
+        yield from forecast_snapshot_observations("bucket", FORECAST_BUCKETS, "horizon")
+        return
+    locations = shard.select(location_registry.snapshot(), location_registry.key)
+    for loc, carbon in zip(locations, get_many(get_forecasted_carbon_intensity, locations)):
         lat, lon = loc['lat'], loc['lon']
-        carbon = get_forecasted_carbon_intensity(lat, lon)
+        if carbon:
+            carbon_store.record_forecast((lat, lon), carbon)
         date = datetime.now()
         formatted_date = date.strftime("%m/%d/%Y-%H:%M")
         if carbon is not None:
@@ -99,6 +87,47 @@ def get_forecast_carbon(_: CallbackOptions):
                 attributes['forecast'] = idx
                 yield Observation(carbon[idx], attributes)
 
+# Bucketed mode: forecasts are fetched once per cycle, bucketed and summarised in one row per location
+FORECAST_BUCKETS = [f"{start}-{end}h" for start, end in zip(FORECAST_BUCKET_EDGES_H[:-1], FORECAST_BUCKET_EDGES_H[1:])]
+FORECAST_COLUMNS = (
+    [f"bucket:{label}" for label in FORECAST_BUCKETS] + ["stat:min", "stat:mean"]
+    + [f"{column}:{window}" for window in FORECAST_WINDOWS_H for column in ("window_start", "window_mean")]
+)
+
+def read_forecasts():
+    attributes, rows = [], []
+    locations = shard.select(location_registry.snapshot(), location_registry.key)
+    for loc, carbon in zip(locations, get_many(get_forecasted_carbon_intensity, locations)):
+        if not carbon:
+            continue
+        lat, lon = loc['lat'], loc['lon']
+        carbon_store.record_forecast((lat, lon), carbon)
+        buckets = dict(horizon_buckets(carbon, FORECAST_BUCKET_EDGES_H))
+        summary = summarize(carbon, FORECAST_WINDOWS_H)
+        # NaN for buckets and windows past the end of the forecast, the snapshot leaves them out
+        row = [buckets.get(label, math.nan) for label in FORECAST_BUCKETS] + [summary['min'], summary['mean']]
+        for window in FORECAST_WINDOWS_H:
+            row.extend(summary['windows'].get(window, (math.nan, math.nan)))
+        attributes.append({'latitude': lat, 'longitude': lon})
+        rows.append(row)
+    return attributes, rows
+
+forecast_snapshot = CycleSnapshot(read_forecasts, FORECAST_COLUMNS)
+
+def forecast_snapshot_observations(column, labels, label_name):
+    # One column of the snapshot per label, e.g. bucket:0-1h with horizon="0-1h"
+    for label in labels:
+        for observation in forecast_snapshot.observe(f"{column}:{label}"):
+            yield Observation(observation.value, {**observation.attributes, label_name: label})
+
+def get_forecast_summary(_: CallbackOptions):
+    yield from forecast_snapshot_observations("stat", ["min", "mean"], "stat")
+    for observation in forecast_snapshot_observations("window_mean", FORECAST_WINDOWS_H, "window_h"):
+        yield Observation(observation.value, {**observation.attributes, 'stat': 'best_window_mean'})
+
+def get_forecast_best_window_start(_: CallbackOptions):
+    yield from forecast_snapshot_observations("window_start", FORECAST_WINDOWS_H, "window_h")
+
 
 
 meter.create_observable_gauge(
@@ -115,39 +144,137 @@ meter.create_observable_gauge(
     callbacks=[get_forecast_carbon],
 )
 
-@app.post('/cluster/')
-def add_cluster(new_location: Dict):
-    print(new_location)
+if FORECAST_EXPORT_MODE == "bucketed":
+    meter.create_observable_gauge(
+        name=f"node.fluidos.carbon_forecast_summary",
+        description="Forecasted carbon intensity summary: min, mean and mean of the lowest-carbon window per length",
+        unit="gCO2/kWh",
+        callbacks=[get_forecast_summary],
+    )
+    meter.create_observable_gauge(
+        name=f"node.fluidos.carbon_forecast_best_window_start",
+        description="Hours from now to the start of the lowest-carbon forecast window per length",
+        unit="h",
+        callbacks=[get_forecast_best_window_start],
+    )
+
+def _parse_location(new_location: Dict):
     try:
         lat = new_location['lat']
         lon = new_location['lon']
     except:
         raise HTTPException(status_code=400, detail="Bad Format")
+    return lat, lon
+
+@app.post('/cluster/')
+def add_cluster(new_location: Dict, wait: bool = False):
+    print(new_location)
+    lat, lon = _parse_location(new_location)
     if lat and lon:
-        lat_lon_list.append({'lat': lat, 'lon': lon})
+        if not location_registry.add({'lat': lat, 'lon': lon}):
+            raise HTTPException(status_code=400, detail="Location already exists")
         logging.info(f"Added cluster: lat={lat}, lon={lon}")
-        thread = threading.Thread(target=metric_reader.force_flush)
-        thread.start()
-        return {"status": "success", "lat": lat, "lon": lon}
+        response = {"status": "success", "lat": lat, "lon": lon}
+        flushed = flusher.request(wait=wait)
+        if wait:
+            response["flushed"] = bool(flushed)
+        return response
     else:
         raise HTTPException(status_code=400, detail="Error adding")
 
+@app.post('/clusters/')
+def add_clusters(new_locations: List[Dict], wait: bool = False):
+    locations = [_parse_location(new_location) for new_location in new_locations]
+    if not all(lat and lon for lat, lon in locations):
+        raise HTTPException(status_code=400, detail="Error adding")
+    added = location_registry.add_many([{'lat': lat, 'lon': lon} for lat, lon in locations])
+    logging.info(f"Added {len(added)} clusters")
+    response = {"added": len(added), "skipped": len(locations) - len(added)}
+    if added:
+        flushed = flusher.request(wait=wait)
+        if wait:
+            response["flushed"] = bool(flushed)
+    return response
+
 @app.get('/clusters/')
 def list_clusters():
-    return lat_lon_list
+    return list(location_registry.snapshot())
 
 @app.delete('/cluster/')
 def delete_cluster(new_location: Dict):
-    try:
-        lat = new_location['lat']
-        lon = new_location['lon']
-    except:
-        raise HTTPException(status_code=400, detail="Bad Format")
-    lat_lon_list_aux = [loc for loc in lat_lon_list if not (loc['lat'] == lat and loc['lon'] == lon)]
-    if len(lat_lon_list) == len(lat_lon_list_aux):
+    lat, lon = _parse_location(new_location)
+    if location_registry.remove((lat, lon)) is None:
         raise HTTPException(status_code=400, detail="Not deleted, no exists")
+    carbon_store.remove((lat, lon))
     return {"message": (f"Deleted cluster: lat={lat}, lon={lon}")}
 
+@app.delete('/clusters/')
+def delete_clusters(locations: List[Dict]):
+    keys = [_parse_location(location) for location in locations]
+    removed = location_registry.remove_many(keys)
+    for location in removed:
+        carbon_store.remove(location_registry.key(location))
+    return {"removed": len(removed), "not_found": len(keys) - len(removed)}
+
+@app.get('/history/')
+def get_history(lat: str, lon: str, start: float = None, end: float = None):
+    # Hourly live and forecast values of one location, default the last 24 hours and the forecast ahead
+    now = time.time()
+    history = carbon_store.range((lat, lon), now - 24 * 3600 if start is None else start, now + STORE_HORIZON_H * 3600 if end is None else end)
+    if history is None:
+        raise HTTPException(status_code=404, detail="No data for this location")
+    return history
+
+@app.get('/greenest/')
+def get_greenest(hours: int = 1, within_h: int = 24, top: int = 10):
+    # Lowest-carbon window of `hours` starting in the next within_h hours, per location, greenest first
+    if hours < 1 or within_h < 1:
+        raise HTTPException(status_code=400, detail="hours and within_h must be positive")
+    keys = [location_registry.key(loc) for loc in shard.select(location_registry.snapshot(), location_registry.key)]
+    return [
+        {"lat": lat, "lon": lon, "start": start, "mean": mean}
+        for (lat, lon), start, mean in carbon_store.greenest_windows(hours, within_h, keys, top=top)
+    ]
+
+@app.get('/zones/')
+def list_zones():
+    # Grid zone of each resolved location, "" for locations ElectricityMaps gave no zone for
+    return {"zones": zone_index.zones(), "locations": len(zone_index)}
+
+@app.get('/shard/')
+def get_shard():
+    owned = shard.select(location_registry.snapshot(), location_registry.key)
+    return {"self": shard.self_id, "members": list(shard.members), "owned": len(owned), "total": len(location_registry)}
+
+@app.put('/shard/')
+def set_shard_members(members: List[str]):
+    try:
+        shard.set_members(members)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_shard()
+
+@app.get('/debug/profile', response_class=PlainTextResponse)
+def get_profile(seconds: float = 5, interval_ms: float = 10):
+    # Stacks of every thread sampled while the request lasts, in collapsed (flamegraph) format
+    if not 0 < seconds <= 60 or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 60] and interval_ms at least 1")
+    try:
+        return format_collapsed(profiler.sample(seconds, interval_ms / 1000))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get('/metrics')
+def get_metrics(request: Request):
+    # Exposition rendered at the last collection, scrapes never run the callbacks
+    if runtime.exposition is None:
+        raise HTTPException(status_code=404, detail="Pull mode is off, set EXPORT_MODE=pull or PULL_METRICS=true")
+    body, encoding = runtime.exposition.body(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=CONTENT_TYPE, headers=headers)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
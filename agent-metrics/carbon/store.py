@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class CarbonStore:
+    """Live and forecast carbon intensity per location, in two float32 (location x hour) arrays.
+
+    Column c holds hour base + c (hours since the epoch, step_s long). Live values fill
+    the history array at the hour they were fetched, a forecast overwrites the forecast
+    array from its first hour on. When a write goes past the last column, hours older
+    than retention_h are dropped by shifting the arrays left, so memory stays at
+    locations x (retention_h + horizon_h + slack) whatever the uptime. Rows of removed
+    locations are reused. Missing values are NaN.
+
+    With a path, snapshot() writes both arrays to <path>.npy (read back memory-mapped
+    when the store is created) and the hours and locations to <path>.json.
+    """
+
+    def __init__(self, retention_h=168, horizon_h=72, step_s=3600, path=None, clock=time.time):
+        self.retention_h = retention_h
+        self.horizon_h = horizon_h
+        self.step_s = step_s
+        self.path = path
+        self.clock = clock
+        # Shift a day at a time rather than every hour
+        self._slack = max(24, horizon_h // 2)
+        self._columns = retention_h + horizon_h + self._slack
+        self._base = None  # hour of column 0
+        self._rows = {}  # location key -> row
+        self._data = np.full((2, 16, self._columns), np.nan, dtype=np.float32)  # history, forecast
+        self._free = list(range(self._data.shape[1] - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._snapshot_thread = None
+        if path and os.path.exists(path + ".npy"):
+            self._load()
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __len__(self):
+        return len(self._rows)
+
+    def hour(self, timestamp):
+        return int(timestamp // self.step_s)
+
+    def _row(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            if not self._free:
+                grown = np.full((2, 2 * self._data.shape[1], self._columns), np.nan, dtype=np.float32)
+                grown[:, :self._data.shape[1]] = self._data
+                self._free = list(range(self._data.shape[1], grown.shape[1]))[::-1]
+                self._data = grown
+            row = self._rows[key] = self._free.pop()
+        return row
+
+    def _column(self, hour, length=1):
+        """Column of hour, after making room for length hours from it; None if it is older than the window."""
+        if self._base is None:
+            self._base = hour - self.retention_h
+        if hour < self._base:
+            return None
+        end = hour + length - self._base
+        if end > self._columns:
+            # Compaction: keep retention_h hours of history before the newest hour written
+            shift = end - self._columns + self._slack
+            if shift >= self._columns:
+                self._data[:] = np.nan  # nothing recent enough to keep
+                self._base = hour - self.retention_h
+            else:
+                self._data[:, :, :-shift] = self._data[:, :, shift:]
+                self._data[:, :, -shift:] = np.nan
+                self._base += shift
+        return hour - self._base
+
+    def record_live(self, key, value, now=None):
+        with self._lock:
+            column = self._column(self.hour(now or self.clock()))
+            if column is not None:
+                row = self._row(key)  # may grow self._data
+                self._data[0, row, column] = value
+
+    def record_forecast(self, key, values, now=None):
+        """values[i] is the forecast for the hour i hours after the current one."""
+        values = np.asarray(values, dtype=np.float32)[:self.horizon_h]
+        if values.size == 0:
+            return
+        with self._lock:
+            column = self._column(self.hour(now or self.clock()), values.size)
+            if column is not None:
+                row = self._row(key)  # may grow self._data
+                self._data[1, row, column:column + values.size] = values
+
+    def remove(self, key):
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._data[:, row] = np.nan
+                self._free.append(row)
+
+    def range(self, key, start, end):
+        """Hourly timestamps with the live and forecast values of key between start and end (seconds), None if unknown."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None or self._base is None:
+                return None
+            first = max(self.hour(start), self._base)
+            last = min(self.hour(end), self._base + self._columns - 1)
+            if last < first:
+                return {"timestamps": [], "live": [], "forecast": []}
+            values = self._data[:, row, first - self._base:last - self._base + 1].astype(object)
+        values[np.isnan(values.astype(float))] = None
+        return {
+            "timestamps": list(range(first * self.step_s, (last + 1) * self.step_s, self.step_s)),
+            "live": values[0].tolist(),
+            "forecast": values[1].tolist(),
+        }
+
+    def greenest_windows(self, hours, within_h, keys=None, now=None, top=None):
+        """Lowest-carbon window of `hours` consecutive forecast hours starting in the next within_h hours.
+
+        One (key, start timestamp, mean intensity) per location, lowest mean first. Windows
+        with a missing hour are skipped, and so are locations without any complete window.
+        """
+        with self._lock:
+            if self._base is None or hours <= 0:
+                return []
+            keys = [key for key in (self._rows if keys is None else keys) if key in self._rows]
+            if not keys:
+                return []
+            first = self.hour(now or self.clock()) - self._base
+            last = min(first + within_h + hours - 1, self._columns)
+            if first < 0 or last - first < hours:
+                return []
+            values = self._data[1, [self._rows[key] for key in keys], first:last]
+        # Window sums from cumulative sums, counting missing hours the same way
+        missing = np.isnan(values)
+        sums = np.cumsum(np.where(missing, 0.0, values), axis=1, dtype=np.float64)
+        gaps = np.cumsum(missing, axis=1)
+        sums = np.concatenate((np.zeros((len(keys), 1)), sums), axis=1)
+        gaps = np.concatenate((np.zeros((len(keys), 1), dtype=gaps.dtype), gaps), axis=1)
+        windows = sums[:, hours:] - sums[:, :-hours]
+        windows[(gaps[:, hours:] - gaps[:, :-hours]) > 0] = np.inf
+        starts = np.argmin(windows, axis=1)
+        best = windows[np.arange(len(keys)), starts]
+        order = np.argsort(best, kind="stable")[:np.isfinite(best).sum()][:top].tolist()
+        return [(keys[i], (self._base + first + int(starts[i])) * self.step_s, float(best[i] / hours)) for i in order]
+
+    def snapshot(self):
+        """Write the store to <path>.npy and <path>.json, each replaced atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._base is None:
+                return
+            data = self._data.copy()
+            meta = {"base": self._base, "step_s": self.step_s, "rows": [[list(key), row] for key, row in self._rows.items()]}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            snapshot = np.lib.format.open_memmap(self.path + ".npy.tmp", mode="w+", dtype=np.float32, shape=data.shape)
+            snapshot[:] = data
+            snapshot.flush()
+            del snapshot
+            with open(self.path + ".json.tmp", "w") as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(self.path + ".npy.tmp", self.path + ".npy")
+            os.replace(self.path + ".json.tmp", self.path + ".json")
+        except OSError as e:
+            logging.error(f"Error writing carbon store snapshot {self.path}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path + ".json") as meta_file:
+                meta = json.load(meta_file)
+            snapshot = np.load(self.path + ".npy", mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable carbon store snapshot {self.path}: {e}")
+            return
+        if meta["step_s"] != self.step_s or snapshot.ndim != 3 or snapshot.shape[0] != 2:
+            logging.warning(f"Ignoring carbon store snapshot {self.path} written with other settings")
+            return
+        rows = {tuple(key): row for key, row in meta["rows"]}
+        self._data = np.full((2, max(16, snapshot.shape[1]), self._columns), np.nan, dtype=np.float32)
+        # Align the snapshot's hours with this store's columns, a smaller window keeps the newest hours
+        columns = min(snapshot.shape[2], self._columns)
+        self._data[:, :snapshot.shape[1], :columns] = snapshot[:, :, snapshot.shape[2] - columns:]
+        self._base = meta["base"] + snapshot.shape[2] - columns
+        self._rows = rows
+        used = set(rows.values())
+        self._free = [row for row in range(self._data.shape[1] - 1, -1, -1) if row not in used]
+        logging.info(f"Loaded {len(rows)} locations from carbon store snapshot {self.path}")
+
+    def start_snapshots(self, interval_s):
+        """Call snapshot() every interval_s seconds from a daemon thread."""
+        if self.path and self._snapshot_thread is None:
+            def run():
+                while True:
+                    time.sleep(interval_s)
+                    self.snapshot()
+            self._snapshot_thread = threading.Thread(target=run, daemon=True, name="carbon-store-snapshot")
+            self._snapshot_thread.start()
@@ -0,0 +1,110 @@
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FORECAST_LENGTH = 24
+ZONE_DEGREES = 1.0  # the stub's grid zones are squares of this many degrees
+
+
+class StubElectricityMaps(ThreadingHTTPServer):
+    """Local stand-in for the ElectricityMaps v3 API, used by tests and offline runs.
+
+    Every request is counted per path in `hits`. `delay_s` slows each response down and
+    `fail_next` makes the next N requests answer with `fail_status`. Data is per grid zone
+    (zone_for): requests take either lat and lon or a zone, and answers name their zone.
+    `zone_requests` counts the requests made by zone rather than by coordinates.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address=("127.0.0.1", 0), delay_s=0.0):
+        super().__init__(address, _Handler)
+        self.delay_s = delay_s
+        self.fail_next = 0
+        self.fail_status = 503
+        self.hits = {}
+        self.zone_requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def total_hits(self):
+        return sum(self.hits.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def zone_for(lat, lon):
+    return f"Z{math.floor(float(lat) / ZONE_DEGREES)}_{math.floor(float(lon) / ZONE_DEGREES)}"
+
+
+def zone_carbon(zone):
+    # Deterministic per zone so tests can check which answer went where
+    lat_index, lon_index = zone[1:].rsplit("_", 1)
+    return round(abs(int(lat_index)) * 3 + abs(int(lon_index)) + 0.5, 2)
+
+
+def carbon_for(lat, lon):
+    return zone_carbon(zone_for(lat, lon))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        with server._lock:
+            server.hits[parsed.path] = server.hits.get(parsed.path, 0) + 1
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+            if "zone" in query:
+                server.zone_requests += 1
+        if server.delay_s:
+            time.sleep(server.delay_s)
+        if failing:
+            return self._send(server.fail_status, {"error": "stub failure"})
+
+        zone = query.get("zone") or zone_for(query["lat"], query["lon"])
+        base = zone_carbon(zone)
+        if parsed.path.endswith("/carbon-intensity/latest"):
+            body = {"zone": zone, "carbonIntensity": base}
+        elif parsed.path.endswith("/carbon-intensity/forecast"):
+            body = {"zone": zone, "forecast": [{"carbonIntensity": base + (i % 12) * 10 - 60} for i in range(FORECAST_LENGTH)]}
+        else:
+            return self._send(404, {"error": "not found"})
+        self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == "__main__":
+    server = StubElectricityMaps(("0.0.0.0", 8091))
+    print(f"Stub ElectricityMaps API on {server.url}")
+    server.serve_forever()
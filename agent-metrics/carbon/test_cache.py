@@ -0,0 +1,98 @@
+import threading
+import time
+
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_within_ttl_does_not_reload():
+    calls = []
+    cache = TTLCache(ttl_s=10, clock=FakeClock())
+    assert cache.get("k", lambda: calls.append(1) or "v") == "v"
+    assert cache.get("k", lambda: calls.append(1) or "v2") == "v"
+    assert len(calls) == 1
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+    release = threading.Event()
+
+    def slow_loader():
+        calls.append(1)
+        release.wait(2)
+        return 42
+
+    cache = TTLCache(ttl_s=10)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", slow_loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+
+def test_stale_entry_served_while_refreshing():
+    clock = FakeClock()
+    cache = TTLCache(ttl_s=10, clock=clock)
+    cache.get("k", lambda: "old")
+    clock.now = 11
+    release = threading.Event()
+
+    def slow_refresh():
+        release.wait(2)
+        return "new"
+
+    assert cache.get("k", slow_refresh) == "old"
+    assert cache.get("k", slow_refresh) == "old"
+    release.set()
+    deadline = time.time() + 2
+    while cache.get("k", slow_refresh) != "new" and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("k", slow_refresh) == "new"
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache(ttl_s=10, clock=FakeClock())
+    assert cache.get("k", lambda: None) is None
+    assert cache.get("k", lambda: 1) == 1
+
+
+def test_stale_entry_dropped_after_max_stale_when_refresh_fails():
+    clock = FakeClock()
+    cache = TTLCache(ttl_s=10, clock=clock, max_stale_s=20)
+    cache.get("k", lambda: "old")
+
+    def failing_loader():
+        raise ConnectionError("upstream down")
+
+    clock.now = 15
+    assert cache.get("k", failing_loader) == "old"
+    deadline = time.time() + 2
+    while cache._in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("k", failing_loader) == "old"
+    clock.now = 30
+    assert cache.get("k", failing_loader) is None
+    assert len(cache) == 0
+    assert cache.get("k", lambda: "new") == "new"
+
+
+def test_eviction_is_bounded_lru():
+    cache = TTLCache(ttl_s=10, max_entries=2, clock=FakeClock())
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("a", lambda: 1)
+    cache.get("c", lambda: 3)
+    assert len(cache) == 2
+    assert cache.get("b", lambda: "reloaded") == "reloaded"
@@ -28,6 +28,19 @@ def test_delete_cluster():
 def test_delete_nonexistent_cluster():
     response = requests.delete(f"{BASE_URL}/cluster/", json={"lat": "0.0", "lon": "0.0"})
     assert response.status_code == 400
+def test_add_clusters_bulk():
+    locations = [{"lat": str(40 + i / 100), "lon": "2.0"} for i in range(200)]
+    response = requests.post(f"{BASE_URL}/clusters/", json=locations)
+    assert response.status_code == 200
+    assert response.json()["added"] + response.json()["skipped"] == 200
+
+def test_delete_clusters_bulk():
+    locations = [{"lat": str(40 + i / 100), "lon": "2.0"} for i in range(200)]
+    response = requests.delete(f"{BASE_URL}/clusters/", json=locations)
+    assert response.status_code == 200
+    remaining = requests.get(f"{BASE_URL}/clusters/").json()
+    assert not any(loc in locations for loc in remaining)
+
 if __name__ == "__main__":
     test_add_cluster()
     test_add_cluster_invalid_input()
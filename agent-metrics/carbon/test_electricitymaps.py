@@ -0,0 +1,113 @@
+import os
+import time
+
+import pytest
+
+import electricitymaps
+import zones as zones_module
+from cache import TTLCache
+from stub_electricitymaps import FORECAST_LENGTH, StubElectricityMaps, carbon_for
+from zones import ZoneIndex
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubElectricityMaps().start()
+    monkeypatch.setattr(electricitymaps, "BASE_URL", server.url)
+    monkeypatch.setattr(electricitymaps, "live_cache", TTLCache(60))
+    monkeypatch.setattr(electricitymaps, "forecast_cache", TTLCache(3600))
+    monkeypatch.setattr(electricitymaps, "zone_index", ZoneIndex())
+    monkeypatch.setattr(electricitymaps, "zone_cache", TTLCache(float("inf")))
+    monkeypatch.setattr(electricitymaps, "session", electricitymaps.create_session(retries=2, backoff_s=0.01))
+    yield server
+    server.stop()
+
+
+def test_live_intensity_is_cached_per_location(stub):
+    for _ in range(5):
+        assert electricitymaps.get_live_carbon_intensity("48.86", "2.35") == carbon_for("48.86", "2.35")
+    assert electricitymaps.get_live_carbon_intensity("37.98", "-1.13") == carbon_for("37.98", "-1.13")
+    assert stub.hits["/carbon-intensity/latest"] == 2
+
+
+def test_forecast_is_cached_separately_from_live(stub):
+    forecast = electricitymaps.get_forecasted_carbon_intensity("48.86", "2.35")
+    electricitymaps.get_forecasted_carbon_intensity("48.86", "2.35")
+    electricitymaps.get_live_carbon_intensity("48.86", "2.35")
+    assert len(forecast) == FORECAST_LENGTH
+    assert stub.hits == {"/carbon-intensity/forecast": 1, "/carbon-intensity/latest": 1}
+
+
+def test_upstream_error_is_not_cached(stub):
+    stub.fail_next = 3
+    assert electricitymaps.get_live_carbon_intensity("48.86", "2.35") is None
+    assert electricitymaps.get_live_carbon_intensity("48.86", "2.35") == carbon_for("48.86", "2.35")
+
+
+def test_retries_5xx_and_429_with_backoff(stub):
+    stub.fail_next = 2
+    stub.fail_status = 429
+    assert electricitymaps.get_live_carbon_intensity("48.86", "2.35") == carbon_for("48.86", "2.35")
+    assert stub.hits["/carbon-intensity/latest"] == 3
+
+
+def test_slow_upstream_times_out(stub, monkeypatch):
+    monkeypatch.setattr(electricitymaps, "session", electricitymaps.create_session(retries=0))
+    monkeypatch.setattr(electricitymaps, "REQUEST_TIMEOUT_S", 0.1)
+    stub.delay_s = 0.5
+    start = time.perf_counter()
+    assert electricitymaps.get_live_carbon_intensity("48.86", "2.35") is None
+    assert time.perf_counter() - start < 0.4
+
+
+def test_locations_are_fetched_concurrently(stub):
+    stub.delay_s = 0.2
+    locations = [{"lat": str(i), "lon": str(i)} for i in range(30)]
+    start = time.perf_counter()
+    results = electricitymaps.get_many(electricitymaps.get_live_carbon_intensity, locations)
+    elapsed = time.perf_counter() - start
+    assert results == [carbon_for(i, i) for i in range(30)]
+    assert elapsed < 1.0
+
+
+def test_locations_in_one_zone_share_upstream_calls(stub):
+    # 40 locations in two 1 degree zones
+    locations = [{"lat": str(48 + (i % 2) + i / 100), "lon": "2.35"} for i in range(40)]
+    live = electricitymaps.get_many(electricitymaps.get_live_carbon_intensity, locations)
+    forecast = electricitymaps.get_many(electricitymaps.get_forecasted_carbon_intensity, locations)
+    assert live == [carbon_for(loc["lat"], loc["lon"]) for loc in locations]
+    assert [f[0] for f in forecast] == [carbon_for(loc["lat"], loc["lon"]) - 60 for loc in locations]
+    # One lookup per new coordinate to learn its zone, then one call per zone
+    assert stub.hits == {"/carbon-intensity/latest": 40, "/carbon-intensity/forecast": 2}
+    assert len(electricitymaps.zone_index.zones()) == 2
+
+
+def test_zone_index_survives_restart(stub, tmp_path, monkeypatch):
+    path = str(tmp_path / "zones.json")
+    monkeypatch.setattr(electricitymaps, "zone_index", ZoneIndex(path))
+    locations = [{"lat": str(48 + i / 100), "lon": "2.35"} for i in range(20)]
+    electricitymaps.get_many(electricitymaps.get_live_carbon_intensity, locations)
+
+    # Restarted agent: empty caches, index loaded from disk
+    monkeypatch.setattr(electricitymaps, "zone_index", ZoneIndex(path))
+    monkeypatch.setattr(electricitymaps, "live_cache", TTLCache(60))
+    monkeypatch.setattr(electricitymaps, "zone_cache", TTLCache(float("inf")))
+    stub.hits.clear()
+    stub.zone_requests = 0
+    live = electricitymaps.get_many(electricitymaps.get_live_carbon_intensity, locations)
+    assert live == [carbon_for(loc["lat"], loc["lon"]) for loc in locations]
+    assert stub.hits == {"/carbon-intensity/latest": 1}
+    assert stub.zone_requests == 1
+
+
+def test_zone_index_is_written_once_per_batch(tmp_path, monkeypatch):
+    path = tmp_path / "zones.json"
+    index = ZoneIndex(str(path))
+    replaced = []
+    monkeypatch.setattr(zones_module.os, "replace", lambda src, dst: (replaced.append(dst), os.rename(src, dst)))
+    for i in range(100):
+        index.set(str(48 + i / 100), "2.35", f"Z{i}")
+    assert not path.exists()
+    index.save()
+    index.save()
+    assert len(replaced) == 1 and len(ZoneIndex(str(path))) == 100
@@ -0,0 +1,33 @@
+import numpy as np
+
+from forecast import horizon_buckets, parse_hours, summarize
+
+
+def test_parse_hours():
+    assert parse_hours("0, 1,3,") == [0, 1, 3]
+
+
+def test_horizon_buckets_are_means_with_stable_labels():
+    values = list(range(24))
+    buckets = horizon_buckets(values, [0, 1, 3, 6, 12, 24])
+    assert [label for label, _ in buckets] == ["0-1h", "1-3h", "3-6h", "6-12h", "12-24h"]
+    assert [value for _, value in buckets] == [0.0, 1.5, 4.0, 8.5, 17.5]
+
+
+def test_horizon_buckets_truncate_short_forecasts():
+    buckets = horizon_buckets([10, 20, 30, 40], [0, 1, 3, 6, 12])
+    assert buckets == [("0-1h", 10.0), ("1-3h", 25.0), ("3-6h", 40.0)]
+
+
+def test_summarize_finds_lowest_window():
+    values = [300, 280, 120, 100, 110, 250, 90, 400]
+    summary = summarize(values, [1, 3, 20])
+    assert summary["min"] == 90
+    assert summary["mean"] == np.mean(values)
+    assert summary["windows"][1] == (6, 90.0)
+    assert summary["windows"][3] == (2, 110.0)
+    assert 20 not in summary["windows"]
+
+
+def test_summarize_empty_forecast():
+    assert summarize([], [1]) is None
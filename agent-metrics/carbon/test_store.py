@@ -0,0 +1,85 @@
+import math
+
+from forecast import summarize
+from store import CarbonStore
+
+HOUR = 3600
+NOW = 1_000_000 * HOUR + 120  # two minutes into an hour
+
+
+def test_range_returns_live_and_forecast_per_hour():
+    store = CarbonStore(retention_h=48, horizon_h=24)
+    store.record_live(("48.86", "2.35"), 120.0, now=NOW - HOUR)
+    store.record_live(("48.86", "2.35"), 110.0, now=NOW)
+    store.record_forecast(("48.86", "2.35"), [100.0, 90.0, 80.0], now=NOW)
+    result = store.range(("48.86", "2.35"), NOW - 2 * HOUR, NOW + 3 * HOUR)
+    assert result["timestamps"] == [(NOW // HOUR + i) * HOUR for i in range(-2, 4)]
+    assert result["live"] == [None, 120.0, 110.0, None, None, None]
+    assert result["forecast"] == [None, None, 100.0, 90.0, 80.0, None]
+    assert store.range(("0", "0"), NOW, NOW + HOUR) is None
+
+
+def test_greenest_windows_match_forecast_summary_and_rank_locations():
+    store = CarbonStore()
+    forecasts = {
+        ("a", "0"): [300, 280, 120, 100, 110, 250, 90, 400],
+        ("b", "0"): [50, 60, 70, 80, 90, 100, 110, 120],
+        ("c", "0"): [500] * 8,
+    }
+    for key, values in forecasts.items():
+        store.record_forecast(key, values, now=NOW)
+    ranked = store.greenest_windows(3, 6, now=NOW)
+    assert [key for key, _, _ in ranked] == [("b", "0"), ("a", "0"), ("c", "0")]
+    start, mean = summarize(forecasts[("a", "0")], [3])["windows"][3]
+    assert ranked[1][1:] == ((NOW // HOUR + start) * HOUR, mean)
+    assert store.greenest_windows(3, 6, keys=[("c", "0"), ("x", "0")], now=NOW, top=1) == [(("c", "0"), NOW // HOUR * HOUR, 500.0)]
+
+
+def test_windows_with_missing_hours_are_skipped():
+    store = CarbonStore()
+    store.record_forecast(("a", "0"), [10, 10, 10], now=NOW)
+    store.record_forecast(("a", "0"), [500, 500], now=NOW + 4 * HOUR)
+    # Hour 3 has no forecast, so the cheap hours 0-2 cannot join the 500s
+    assert store.greenest_windows(4, 4, now=NOW) == []
+    assert store.greenest_windows(3, 4, now=NOW)[0][2] == 10.0
+
+
+def test_old_hours_are_compacted_away_at_constant_size():
+    store = CarbonStore(retention_h=24, horizon_h=24)
+    nbytes = store.nbytes
+    for hour in range(24 * 30):
+        store.record_live(("a", "0"), float(hour), now=NOW + hour * HOUR)
+        store.record_forecast(("a", "0"), [float(hour)] * 24, now=NOW + hour * HOUR)
+    last = NOW + (24 * 30 - 1) * HOUR
+    assert store.nbytes == nbytes
+    history = store.range(("a", "0"), last - 24 * HOUR, last)["live"]
+    assert history == [float(hour) for hour in range(24 * 30 - 25, 24 * 30)]
+    assert store.range(("a", "0"), NOW, NOW + HOUR)["live"] == []
+
+
+def test_writes_older_than_the_window_are_ignored():
+    store = CarbonStore(retention_h=24, horizon_h=24)
+    store.record_live(("a", "0"), 1.0, now=NOW)
+    # Clock stepped back past the start of the window
+    store.record_live(("b", "0"), 2.0, now=NOW - 48 * HOUR)
+    store.record_forecast(("b", "0"), [3.0, 4.0], now=NOW - 48 * HOUR)
+    assert len(store) == 1
+    assert store.range(("a", "0"), NOW, NOW)["live"] == [1.0]
+
+
+def test_snapshot_is_reloaded_and_rows_are_reused(tmp_path):
+    path = str(tmp_path / "store" / "carbon")
+    store = CarbonStore(path=path)
+    for i in range(40):
+        store.record_forecast((str(i), "0"), [float(i), float(i) + 1], now=NOW)
+    store.remove(("3", "0"))
+    store.snapshot()
+
+    restored = CarbonStore(path=path)
+    assert len(restored) == 39
+    assert restored.range(("7", "0"), NOW, NOW + HOUR)["forecast"] == [7.0, 8.0]
+    assert restored.range(("3", "0"), NOW, NOW) is None
+    nbytes = restored.nbytes
+    restored.record_live(("new", "0"), 1.0, now=NOW)
+    assert restored.nbytes == nbytes
+    assert math.isclose(restored.greenest_windows(2, 1, now=NOW)[0][2], 0.5)
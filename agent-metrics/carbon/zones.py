@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import threading
+
+
+class ZoneIndex:
+    """Grid zone of every coordinate resolved so far, saved to a JSON file when it changes.
+
+    A coordinate never moves to another zone, so entries are kept for good and the file
+    lets a restarted agent skip resolving its locations again. An empty zone records a
+    coordinate the API gave no zone for, to be looked up by coordinates. Without a path
+    the index only lives in memory. set() only marks the index dirty, save() writes it,
+    so a batch of new coordinates costs one write rather than one per coordinate.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._zones = {}  # (lat, lon) -> zone
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._save_lock = threading.Lock()  # one writer of the file at a time
+        if path and os.path.exists(path):
+            try:
+                with open(path) as index_file:
+                    self._zones = {(lat, lon): zone for lat, lon, zone in json.load(index_file)}
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable zone index {path}: {e}")
+
+    def __len__(self):
+        return len(self._zones)
+
+    def get(self, lat, lon):
+        return self._zones.get((lat, lon))
+
+    def set(self, lat, lon, zone):
+        with self._lock:
+            if self._zones.get((lat, lon)) == zone:
+                return
+            self._zones[(lat, lon)] = zone
+            self._dirty = True
+
+    def zones(self):
+        """{zone: number of coordinates in it}."""
+        counts = {}
+        for zone in list(self._zones.values()):
+            counts[zone] = counts.get(zone, 0) + 1
+        return counts
+
+    def save(self):
+        """Write the index to its file, atomically, if it changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty or not self.path:
+                    return
+                entries = [[lat, lon, zone] for (lat, lon), zone in self._zones.items()]
+                self._dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp_path, "w") as index_file:
+                    json.dump(entries, index_file)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                self._dirty = True
+                logging.error(f"Error saving zone index {self.path}: {e}")
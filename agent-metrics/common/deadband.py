@@ -0,0 +1,122 @@
+import threading
+import time
+
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.metrics.export import (
+    Gauge, Metric, MetricExporter, MetricExportResult, MetricsData, ResourceMetrics, ScopeMetrics,
+)
+
+# Encoded OTLP size of a gauge point: start and end time and value (fixed 64 bits each) with
+# their tags and the point's framing, and per attribute the KeyValue and AnyValue framing
+POINT_BYTES = 29
+ATTRIBUTE_BYTES = 6
+
+
+def encoded_point_size(point):
+    """OTLP size of a gauge point estimated from its attributes, within a few percent of the encoder's."""
+    size = POINT_BYTES
+    for key, value in (point.attributes or {}).items():
+        size += ATTRIBUTE_BYTES + len(key) + len(str(value))
+    return size
+
+
+class DeadbandExporter(MetricExporter):
+    """Wraps an exporter and leaves out gauge points that did not move since they were last sent.
+
+    A gauge point is sent when its series is new, when its value differs from the last
+    exported one by more than abs_deadband or rel_deadband (a fraction of the last value),
+    or when the series was last sent heartbeat_s or more ago, so it never goes stale in
+    Prometheus. Sums and histograms are always sent. The encoded size of the points left
+    out, estimated with encoded_point_size rather than encoded again, is added to saved_bytes.
+    """
+
+    def __init__(self, exporter, abs_deadband=0.0, rel_deadband=0.0, heartbeat_s=240.0, clock=time.monotonic):
+        super().__init__(preferred_temporality=exporter._preferred_temporality, preferred_aggregation=exporter._preferred_aggregation)
+        self.exporter = exporter
+        self.abs_deadband = abs_deadband
+        self.rel_deadband = rel_deadband
+        self.heartbeat_s = heartbeat_s
+        self.clock = clock
+        self.sent_points = 0
+        self.suppressed_points = 0
+        self.saved_bytes = 0
+        self._last = {}  # (metric name, attributes) -> (value, sent_at)
+        self._lock = threading.Lock()
+
+    def _changed(self, key, value, now):
+        last = self._last.get(key)
+        if last is None or now - last[1] >= self.heartbeat_s:
+            return True
+        difference = abs(value - last[0])
+        return difference > self.abs_deadband and difference > self.rel_deadband * abs(last[0])
+
+    def _split(self, metrics_data, now):
+        """(MetricsData to send, number of points left out, their estimated size, {series key: value} sent)."""
+        sent = {}
+        suppressed = saved = 0
+        keep_resources = []
+        for resource_metrics in metrics_data.resource_metrics:
+            keep_scopes = []
+            for scope_metrics in resource_metrics.scope_metrics:
+                keep_metrics = []
+                for metric in scope_metrics.metrics:
+                    if not isinstance(metric.data, Gauge):
+                        keep_metrics.append(metric)
+                        continue
+                    keep = []
+                    for point in metric.data.data_points:
+                        key = (metric.name, tuple(sorted(point.attributes.items())) if point.attributes else ())
+                        if self._changed(key, point.value, now):
+                            keep.append(point)
+                            sent[key] = point.value
+                        else:
+                            suppressed += 1
+                            saved += encoded_point_size(point)
+                    if keep:
+                        keep_metrics.append(Metric(metric.name, metric.description, metric.unit, Gauge(keep)))
+                if keep_metrics:
+                    keep_scopes.append(ScopeMetrics(scope_metrics.scope, keep_metrics, scope_metrics.schema_url))
+            if keep_scopes:
+                keep_resources.append(ResourceMetrics(resource_metrics.resource, keep_scopes, resource_metrics.schema_url))
+        return MetricsData(keep_resources), suppressed, saved, sent
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        now = self.clock()
+        with self._lock:
+            keep, suppressed, saved, sent = self._split(metrics_data, now)
+        result = MetricExportResult.SUCCESS
+        if keep.resource_metrics:
+            result = self.exporter.export(keep, timeout_millis=timeout_millis, **kwargs)
+        if result != MetricExportResult.SUCCESS:
+            return result
+        with self._lock:
+            for key, value in sent.items():
+                self._last[key] = (value, now)
+            self.sent_points += len(sent)
+            self.suppressed_points += suppressed
+            self.saved_bytes += saved
+            # Forget series that have not been seen for a while (removed targets)
+            if len(self._last) > 2 * len(sent) + 1024:
+                self._last = {key: last for key, last in self._last.items() if now - last[1] < 2 * self.heartbeat_s}
+        return result
+
+    def force_flush(self, timeout_millis=10_000):
+        return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+def create_deadband_counters(meter, exporter):
+    """Report the exporter's suppressed points and saved bytes as the agent's own metrics."""
+    meter.create_observable_counter(
+        name="fluidos.agent.export.suppressed_points",
+        description="Gauge points left out of the export because they stayed within the deadband",
+        callbacks=[lambda _: [Observation(exporter.suppressed_points)]],
+    )
+    meter.create_observable_counter(
+        name="fluidos.agent.export.saved_bytes",
+        description="Encoded OTLP size of the gauge points left out of the export",
+        unit="By",
+        callbacks=[lambda _: [Observation(exporter.saved_bytes)]],
+    )
@@ -0,0 +1,136 @@
+import logging
+import math
+import re
+
+from opentelemetry.sdk.metrics.export import Gauge, Histogram, Sum
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+_INVALID_LABEL_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(name):
+    """OTel instrument name as a Prometheus metric name, e.g. node.fluidos.latency -> node_fluidos_latency."""
+    return _INVALID_NAME_CHARS.sub("_", name)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(attributes):
+    if not attributes:
+        return ""
+    labels = []
+    for key, value in attributes:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        labels.append(f'{_INVALID_LABEL_CHARS.sub("_", str(key))}="{value}"')
+    return "{" + ",".join(labels) + "}"
+
+
+class ExpositionRenderer:
+    """Renders MetricsData as Prometheus text exposition, reusing lines of unchanged series.
+
+    Series are cached by (metric, attributes). A line is only formatted again when its
+    value changed, and render() tells whether anything changed since the previous call,
+    so callers can skip rewriting or resending identical output. Changes to metrics
+    whose name starts with one of `volatile` (e.g. ages or the agent's own timings,
+    which change every cycle) are rendered but do not count as a change. Metrics that
+    would take the output past max_bytes are left out with a warning.
+    """
+
+    def __init__(self, max_bytes=None, volatile=()):
+        self.max_bytes = max_bytes
+        self.volatile = tuple(metric_name(prefix) for prefix in volatile)
+        self.truncated = False
+        self._headers = {}
+        self._lines = {}
+        self._labels = {}
+
+    def _header(self, name, description, kind):
+        header = self._headers.get(name)
+        if header is None:
+            description = (description or "").replace("\\", "\\\\").replace("\n", "\\n")
+            header = self._headers[name] = f"# HELP {name} {description}\n# TYPE {name} {kind}\n".encode()
+        return header
+
+    def _label_string(self, attributes, extra=()):
+        key = (attributes, extra)
+        labels = self._labels.get(key)
+        if labels is None:
+            labels = self._labels[key] = format_labels(attributes + extra)
+        return labels
+
+    def _line(self, seen, cache_key, name, attributes, value, extra=()):
+        """Cached exposition line, and whether the series is new or changed value."""
+        seen.add(cache_key)
+        cached = self._lines.get(cache_key)
+        if cached is not None and cached[0] == value:
+            return cached[1], False
+        line = f"{name}{self._label_string(attributes, extra)} {format_value(value)}\n".encode()
+        self._lines[cache_key] = (value, line)
+        return line, True
+
+    def _series(self, seen, metric, name, point):
+        """Yield (line, changed) for every sample of one data point."""
+        attributes = tuple(point.attributes.items()) if point.attributes else ()
+        if isinstance(metric.data, Histogram):
+            cumulative = 0
+            bounds = list(point.explicit_bounds) + [math.inf]
+            for bound, count in zip(bounds, point.bucket_counts):
+                cumulative += count
+                yield self._line(seen, (name, "bucket", attributes, bound), f"{name}_bucket", attributes, cumulative, (("le", format_value(float(bound))),))
+            yield self._line(seen, (name, "sum", attributes), f"{name}_sum", attributes, point.sum)
+            yield self._line(seen, (name, "count", attributes), f"{name}_count", attributes, point.count)
+        else:
+            yield self._line(seen, (name, attributes), name, attributes, point.value)
+
+    def render(self, metrics_data):
+        """Return (exposition bytes, changed since the previous render)."""
+        chunks = []
+        size = 0
+        changed = False
+        truncated = False
+        seen = set()
+        for resource_metrics in metrics_data.resource_metrics if metrics_data else ():
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    data = metric.data
+                    if isinstance(data, Histogram):
+                        kind = "histogram"
+                    elif isinstance(data, Sum) and data.is_monotonic:
+                        kind = "counter"
+                    elif isinstance(data, (Gauge, Sum)):
+                        kind = "gauge"
+                    else:
+                        logging.debug(f"Skipping {metric.name}: {type(data).__name__} has no text exposition")
+                        continue
+                    name = metric_name(metric.name)
+                    header = self._header(name, metric.description, kind)
+                    counted = not name.startswith(self.volatile)
+                    lines = []
+                    for point in data.data_points:
+                        for line, line_changed in self._series(seen, metric, name, point):
+                            lines.append(line)
+                            changed = changed or (line_changed and counted)
+                    block = header + b"".join(lines) + b"\n"
+                    if self.max_bytes is not None and size + len(block) > self.max_bytes:
+                        truncated = True
+                        continue
+                    chunks.append(block)
+                    size += len(block)
+        # A series that disappeared changes the output as much as a new value does
+        if len(seen) != len(self._lines):
+            changed = changed or any(not key[0].startswith(self.volatile) for key in self._lines.keys() - seen)
+            self._lines = {key: self._lines[key] for key in seen}
+            if len(self._labels) > 2 * len(self._lines) + 1024:
+                self._labels.clear()
+        if truncated and not self.truncated:
+            logging.warning(f"Exposition larger than {self.max_bytes} bytes, dropping the metrics that do not fit")
+        changed = changed or truncated != self.truncated
+        self.truncated = truncated
+        return b"".join(chunks), changed
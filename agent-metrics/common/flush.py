@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+
+
+class FlushCoordinator:
+    """Merges flush requests into as few early collections as possible.
+
+    The first request opens a debounce window, every request arriving inside it is
+    served by the same flush, and flushes never run more than max_per_s times a second.
+    Callers may block until the flush covering their request has finished.
+    """
+
+    def __init__(self, flush, debounce_s=0.5, max_per_s=1.0):
+        self.flush = flush
+        self.debounce_s = debounce_s
+        self.min_gap_s = 1 / max_per_s if max_per_s else 0
+        self.flushes = 0
+        self._requested = 0
+        self._completed = 0
+        self._last_result = None
+        self._last_flush = float("-inf")
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def pending(self):
+        """Requests not yet covered by a finished flush."""
+        return self._requested - self._completed
+
+    def request(self, wait=False, timeout=None):
+        """Ask for an early flush, returning its result when wait is set, else None."""
+        with self._cond:
+            self._requested += 1
+            ticket = self._requested
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="flush-coordinator", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            if not wait:
+                return None
+            if not self._cond.wait_for(lambda: self._completed >= ticket, timeout):
+                return None
+            return self._last_result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._requested > self._completed)
+            time.sleep(max(self.debounce_s, self._last_flush + self.min_gap_s - time.monotonic()))
+            with self._cond:
+                covered = self._requested
+            try:
+                result = self.flush()
+            except Exception:
+                logging.exception("Error flushing metrics")
+                result = False
+            self._last_flush = time.monotonic()
+            with self._cond:
+                self.flushes += 1
+                self._completed = covered
+                self._last_result = result
+                self._cond.notify_all()
@@ -0,0 +1,46 @@
+import os
+
+COLLECTOR_PROTOCOL = os.getenv("COLLECTOR_PROTOCOL", "grpc")
+# The OTLP exporters' own defaults, used when COLLECTOR_ENDPOINT is not set
+DEFAULT_ENDPOINTS = {"grpc": "localhost:4317", "http": "http://localhost:4318/v1/metrics"}
+
+
+def create_exporter(endpoint, protocol=None):
+    """OTLP metric exporter for the collector, over gRPC (default) or HTTP/protobuf.
+
+    For HTTP the endpoint is the collector's base URL, /v1/metrics is appended when missing.
+    """
+    protocol = protocol or COLLECTOR_PROTOCOL
+    if protocol == "http":
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        if endpoint and not endpoint.rstrip("/").endswith("/v1/metrics"):
+            endpoint = endpoint.rstrip("/") + "/v1/metrics"
+        return OTLPMetricExporter(endpoint=endpoint)
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+    return OTLPMetricExporter(endpoint=endpoint, insecure=True)
+
+
+def create_sender(endpoint, protocol=None, timeout_s=10):
+    """Callable sending an already encoded ExportMetricsServiceRequest to the collector, raising on failure.
+
+    Used to replay spooled batches without decoding them again. Without an endpoint it
+    sends where the OTLP exporter would, DEFAULT_ENDPOINTS.
+    """
+    protocol = protocol or COLLECTOR_PROTOCOL
+    endpoint = endpoint or DEFAULT_ENDPOINTS["http" if protocol == "http" else "grpc"]
+    if protocol == "http":
+        import requests
+        if endpoint and not endpoint.rstrip("/").endswith("/v1/metrics"):
+            endpoint = endpoint.rstrip("/") + "/v1/metrics"
+        session = requests.Session()
+        headers = {"Content-Type": "application/x-protobuf"}
+        return lambda payload: session.post(endpoint, data=payload, headers=headers, timeout=timeout_s).raise_for_status()
+    import grpc
+    from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceResponse
+    channel = grpc.insecure_channel(endpoint.split("://", 1)[-1])
+    # No request serializer: the payload is sent as the encoded bytes it already is
+    export = channel.unary_unary(
+        "/opentelemetry.proto.collector.metrics.v1.MetricsService/Export",
+        response_deserializer=ExportMetricsServiceResponse.FromString,
+    )
+    return lambda payload: export(payload, timeout=timeout_s)
@@ -0,0 +1,136 @@
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2, metrics_service_pb2_grpc
+
+POINT_KINDS = ("gauge", "sum", "histogram", "exponential_histogram", "summary")
+
+
+def count_data_points(request):
+    """Number of data points in an ExportMetricsServiceRequest."""
+    total = 0
+    for resource_metrics in request.resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                kind = metric.WhichOneof("data")
+                if kind in POINT_KINDS:
+                    total += len(getattr(metric, kind).data_points)
+    return total
+
+
+class OTLPSink:
+    """Local stand-in for the OTel collector's OTLP metrics receivers, for tests and offline runs.
+
+    Serves OTLP/gRPC and OTLP/HTTP (protobuf) on 127.0.0.1, counts what it receives and
+    optionally keeps the decoded requests. Ports default to free ones picked by the OS.
+    Setting `enabled` to False makes it answer like a collector that is down or
+    restarting (UNAVAILABLE over gRPC, 503 over HTTP) without closing the ports.
+    """
+
+    def __init__(self, grpc_port=0, http_port=0, host="127.0.0.1", keep_requests=False):
+        self.host = host
+        self.keep_requests = keep_requests
+        self.requests = []
+        self.request_count = 0
+        self.data_points = 0
+        self.bytes = 0
+        self.enabled = True
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # Large agents export more than gRPC's default 4 MiB per request
+        self._grpc_server = grpc.server(ThreadPoolExecutor(max_workers=16), options=[("grpc.max_receive_message_length", 256 * 1024 * 1024)])
+        metrics_service_pb2_grpc.add_MetricsServiceServicer_to_server(_MetricsService(self), self._grpc_server)
+        self.grpc_port = self._grpc_server.add_insecure_port(f"{host}:{grpc_port}")
+        self._http_server = ThreadingHTTPServer((host, http_port), _HttpHandler)
+        self._http_server.sink = self
+        self._http_server.daemon_threads = True
+        self.http_port = self._http_server.server_address[1]
+        self._http_thread = None
+
+    @property
+    def grpc_endpoint(self):
+        return f"{self.host}:{self.grpc_port}"
+
+    @property
+    def http_endpoint(self):
+        return f"http://{self.host}:{self.http_port}/v1/metrics"
+
+    def start(self):
+        self._grpc_server.start()
+        self._http_thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+        self._http_thread.start()
+        return self
+
+    def stop(self):
+        self._grpc_server.stop(grace=None)
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.request_count, "data_points": self.data_points, "bytes": self.bytes}
+
+    def wait_for_points(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.data_points >= count:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def record(self, request, size):
+        points = count_data_points(request)
+        with self._lock:
+            self.request_count += 1
+            self.data_points += points
+            self.bytes += size
+            if self.keep_requests:
+                self.requests.append(request)
+
+
+class _MetricsService(metrics_service_pb2_grpc.MetricsServiceServicer):
+    def __init__(self, sink):
+        self.sink = sink
+
+    def Export(self, request, context):
+        if not self.sink.enabled:
+            self.sink.rejected += 1
+            context.abort(grpc.StatusCode.UNAVAILABLE, "collector disabled")
+        self.sink.record(request, request.ByteSize())
+        return metrics_service_pb2.ExportMetricsServiceResponse()
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        size = len(body)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        if self.path != "/v1/metrics":
+            return self._send(404, b"")
+        if not self.server.sink.enabled:
+            self.server.sink.rejected += 1
+            return self._send(503, b"")
+        request = metrics_service_pb2.ExportMetricsServiceRequest()
+        try:
+            request.ParseFromString(body)
+        except Exception:
+            return self._send(400, b"")
+        self.server.sink.record(request, size)
+        self._send(200, metrics_service_pb2.ExportMetricsServiceResponse().SerializeToString())
+
+    def _send(self, status, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
@@ -0,0 +1,47 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample(duration_s, interval_s=0.01):
+    """Sample the stack of every other thread every interval_s for duration_s seconds.
+
+    Returns a Counter of collapsed stacks ("outer;...;inner" -> samples), the input of
+    flamegraph tools. Nothing runs between calls, so the profiler costs nothing until
+    asked. Only one sampling runs at a time, a second call raises ProfilerBusy.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already being taken")
+    try:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        deadline = time.monotonic() + duration_s
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[f"{names.get(ident, ident)};{_stack(frame)}"] += 1
+            time.sleep(interval_s)
+        return stacks
+    finally:
+        _busy.release()
+
+
+def format_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,144 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+# Prometheus refuses range queries returning more than 11,000 points per series
+MAX_POINTS_PER_QUERY = 11000
+
+
+class PrometheusQueryError(Exception):
+    pass
+
+
+class RangeResult(NamedTuple):
+    timestamps: np.ndarray  # evaluation times in seconds, one per step
+    labels: List[Dict[str, str]]  # one label set per series
+    values: np.ndarray  # series x timestamps, NaN where a series has no sample
+
+    def series(self, **match):
+        """Rows whose labels contain every given label value."""
+        rows = [i for i, labels in enumerate(self.labels) if all(labels.get(k) == v for k, v in match.items())]
+        return self.values[rows]
+
+
+class PrometheusQueryClient:
+    """Prometheus HTTP API client for long range queries.
+
+    A range query is split into chunks aligned to a fixed grid of multiples of the
+    step, fetched in parallel over one pooled session and merged into NumPy arrays.
+    Chunks that ended more than `settle_s` ago no longer change, so they are cached by
+    (query, chunk window, step) and repeated or sliding-window queries only fetch the
+    chunks they have not seen yet.
+    """
+
+    def __init__(self, url, chunk_points=1000, max_workers=8, cache_entries=4096, settle_s=300, timeout_s=30, clock=time.time):
+        self.url = url.rstrip("/")
+        self.chunk_points = min(chunk_points, MAX_POINTS_PER_QUERY)
+        self.settle_s = settle_s
+        self.timeout_s = timeout_s
+        self.clock = clock
+        self.cache_entries = cache_entries
+        self.fetches = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prom-query")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get(self, path, params):
+        response = self.session.get(f"{self.url}/api/v1/{path}", params=params, timeout=self.timeout_s)
+        try:
+            body = response.json()
+        except ValueError:
+            raise PrometheusQueryError(f"{response.status_code} {response.reason}")
+        if body.get("status") != "success":
+            raise PrometheusQueryError(f"{body.get('errorType')}: {body.get('error')}")
+        return body["data"]
+
+    def query(self, promql, at=None):
+        """Instant query, returning a list of (labels, value) pairs."""
+        params = {"query": promql}
+        if at is not None:
+            params["time"] = at
+        data = self._get("query", params)
+        if data["resultType"] == "scalar":
+            return [({}, float(data["result"][1]))]
+        return [(item["metric"], float(item["value"][1])) for item in data["result"]]
+
+    def _fetch_chunk(self, promql, start, end, step):
+        with self._lock:
+            self.fetches += 1
+        data = self._get("query_range", {"query": promql, "start": start, "end": end, "step": step})
+        chunk = []
+        for item in data["result"]:
+            samples = np.asarray(item["values"], dtype=object)
+            chunk.append((item["metric"], samples[:, 0].astype(float), samples[:, 1].astype(float)))
+        return chunk
+
+    def _chunk(self, promql, start, end, step, now):
+        key = (promql, start, end, step)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        chunk = self._fetch_chunk(promql, start, end, step)
+        if end <= now - self.settle_s:
+            with self._lock:
+                self._cache[key] = chunk
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return chunk
+
+    def query_range(self, promql, start, end, step):
+        """Range query over [start, end] (seconds) at `step` seconds resolution."""
+        step = float(step)
+        first = math.ceil(start / step) * step
+        last = math.floor(end / step) * step
+        if last < first:
+            return RangeResult(np.empty(0), [], np.empty((0, 0)))
+        span = self.chunk_points * step
+        now = self.clock()
+
+        # Whole grid chunks, so that the same windows come back on later queries
+        windows = []
+        chunk_start = math.floor(first / span) * span
+        while chunk_start <= last:
+            chunk_end = chunk_start + span - step
+            if chunk_end > now - self.settle_s:
+                # The open chunk still changes, fetch only what was asked for
+                windows.append((max(chunk_start, first), min(chunk_end, last)))
+            else:
+                windows.append((chunk_start, chunk_end))
+            chunk_start += span
+        chunks = list(self._pool.map(lambda window: self._chunk(promql, window[0], window[1], step, now), windows))
+
+        timestamps = np.arange(first, last + step / 2, step)
+        rows = {}
+        labels = []
+        columns = []
+        for chunk in chunks:
+            for metric, times, values in chunk:
+                key = tuple(sorted(metric.items()))
+                if key not in rows:
+                    rows[key] = len(labels)
+                    labels.append(metric)
+                    columns.append([])
+                columns[rows[key]].append((times, values))
+        matrix = np.full((len(labels), len(timestamps)), np.nan)
+        for row, parts in enumerate(columns):
+            times = np.concatenate([times for times, _ in parts])
+            values = np.concatenate([values for _, values in parts])
+            index = np.rint((times - first) / step).astype(int)
+            inside = (index >= 0) & (index < len(timestamps))
+            matrix[row, index[inside]] = values[inside]
+        return RangeResult(timestamps, labels, matrix)
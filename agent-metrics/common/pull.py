@@ -0,0 +1,72 @@
+import gzip
+import threading
+import time
+
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+from common.exposition import ExpositionRenderer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip (a q=0 entry refuses it)."""
+    for entry in (accept_encoding or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class ExpositionCache(MetricExporter):
+    """Keeps the last collection rendered as Prometheus text, for GET /metrics to serve.
+
+    The reader hands every collection to export(), which renders it once; scrapes only
+    read the cached bytes and never trigger a collection, so the callbacks run once per
+    INTERVAL_MS however many scrapers there are and however many targets are
+    registered. The gzip copy is made on the first scrape asking for it after a change
+    and shared by the following ones. With an exporter, every collection is also passed
+    on to it, to serve and push the same metrics.
+    """
+
+    def __init__(self, exporter=None, max_bytes=None, gzip_level=6):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality if exporter else None,
+            preferred_aggregation=exporter._preferred_aggregation if exporter else None,
+        )
+        self.exporter = exporter
+        self.gzip_level = gzip_level
+        self.renderer = ExpositionRenderer(max_bytes)
+        self.rendered_at = None
+        self.renders = 0
+        self._payload = b""
+        self._gzipped = None
+        self._lock = threading.Lock()
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        payload, changed = self.renderer.render(metrics_data)
+        with self._lock:
+            if changed:
+                self._payload = payload
+                self._gzipped = None
+            self.rendered_at = time.time()
+            self.renders += 1
+        if self.exporter is None:
+            return MetricExportResult.SUCCESS
+        return self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+
+    def body(self, accept_encoding=""):
+        """(bytes, content encoding or None) of the last rendered exposition, empty before the first collection."""
+        if not accepts_gzip(accept_encoding):
+            return self._payload, None
+        with self._lock:
+            if self._gzipped is None:
+                self._gzipped = gzip.compress(self._payload, self.gzip_level, mtime=0)
+            return self._gzipped, "gzip"
+
+    def force_flush(self, timeout_millis=10_000):
+        return self.exporter.force_flush(timeout_millis) if self.exporter else True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        if self.exporter:
+            self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
@@ -0,0 +1,82 @@
+import threading
+
+
+class Registry:
+    """Targets indexed by key, with O(1) add, remove and lookup.
+
+    Writers serialize on a lock. Readers such as collection callbacks call snapshot(),
+    which returns an immutable tuple and never waits on a writer: the tuple is only
+    rebuilt after the registry changed, so bulk updates cost one copy at the next read.
+    """
+
+    def __init__(self, key):
+        self._key = key
+        self._items = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = ((), 0)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def key(self, item):
+        return self._key(item)
+
+    def get(self, key):
+        return self._items.get(key)
+
+    def add(self, item):
+        """Add item, returning False if its key is already registered."""
+        key = self._key(item)
+        with self._lock:
+            if key in self._items:
+                return False
+            self._items[key] = item
+            self._version += 1
+        return True
+
+    def add_many(self, items):
+        """Add every item whose key is not registered yet, returning the added ones."""
+        added = []
+        with self._lock:
+            for item in items:
+                key = self._key(item)
+                if key not in self._items:
+                    self._items[key] = item
+                    added.append(item)
+            if added:
+                self._version += 1
+        return added
+
+    def remove(self, key):
+        """Remove and return the item registered under key, or None."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._version += 1
+        return item
+
+    def remove_many(self, keys):
+        """Remove every registered key, returning the removed items."""
+        removed = []
+        with self._lock:
+            for key in keys:
+                item = self._items.pop(key, None)
+                if item is not None:
+                    removed.append(item)
+            if removed:
+                self._version += 1
+        return removed
+
+    def snapshot(self):
+        items, version = self._snapshot
+        current = self._version
+        if version != current:
+            # Copying the dict values is a single C-level operation under the GIL,
+            # so it cannot observe a half-applied write
+            items = tuple(self._items.values())
+            self._snapshot = (items, current)
+        return items
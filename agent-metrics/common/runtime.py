@@ -0,0 +1,140 @@
+import importlib
+import logging
+import os
+import sys
+
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.resources import SERVICE_NAME, SERVICE_NAMESPACE, SERVICE_VERSION, Resource
+
+from common.deadband import DeadbandExporter, create_deadband_counters
+from common.flush import FlushCoordinator
+from common.otlp import create_exporter, create_sender
+from common.pull import ExpositionCache
+from common.selfmetrics import InstrumentedExporter, SelfMetrics
+from common.spool import DiskSpool, SpoolingExporter
+from common.textfile import PrometheusTextfileExporter, TEXTFILE_DIR
+
+RESOURCE = Resource(attributes={
+    SERVICE_NAME: "cluster-monitor",
+    SERVICE_NAMESPACE: "fluidos",
+    SERVICE_VERSION: "1.0.0"
+})
+
+_current = None
+
+
+def create_metric_exporter(textfile_name):
+    """The agents' exporter as configured by the environment: textfile, or OTLP with optional spool and deadband.
+
+    EXPORT_MODE=textfile writes TEXTFILE_PATH (default <TEXTFILE_DIR>/<textfile_name>),
+    EXPORT_MODE=pull pushes nothing (None, metrics are only scraped), otherwise metrics
+    go to COLLECTOR_ENDPOINT, through a DiskSpool when SPOOL_DIR is set and a
+    DeadbandExporter when DEADBAND=true.
+    """
+    if os.getenv("EXPORT_MODE", "otlp") == "pull":
+        return None
+    if os.getenv("EXPORT_MODE", "otlp") == "textfile":
+        return PrometheusTextfileExporter(
+            os.getenv("TEXTFILE_PATH", os.path.join(TEXTFILE_DIR, textfile_name)),
+            int(os.getenv("TEXTFILE_MAX_BYTES", 4 * 1024 * 1024)),
+            heartbeat_s=float(os.getenv("TEXTFILE_HEARTBEAT_S", "60")),
+        )
+    endpoint = os.getenv("COLLECTOR_ENDPOINT")
+    exporter = create_exporter(endpoint)
+    if os.getenv("SPOOL_DIR"):
+        exporter = SpoolingExporter(
+            exporter,
+            DiskSpool(os.getenv("SPOOL_DIR"), int(os.getenv("SPOOL_MAX_BYTES", 64 * 1024 * 1024))),
+            create_sender(endpoint),
+            int(os.getenv("SPOOL_REPLAY_BATCH_BYTES", 2 * 1024 * 1024)),
+            int(os.getenv("SPOOL_REPLAY_MAX_BYTES_PER_S", 4 * 1024 * 1024)),
+        )
+    if os.getenv("DEADBAND", "false").lower() == "true":
+        exporter = DeadbandExporter(
+            exporter,
+            float(os.getenv("DEADBAND_ABS", "0")),
+            float(os.getenv("DEADBAND_REL", "0")),
+            float(os.getenv("DEADBAND_HEARTBEAT_S", "240")),
+        )
+    return exporter
+
+
+class AgentRuntime:
+    """One exporter, reader and MeterProvider for every collector running in the process.
+
+    Each collector gets its meter from the runtime, so all their gauges are read in the
+    same collection and leave in one export over one collector connection. Early
+    collections requested by any collector go through the shared FlushCoordinator.
+    The runtime also owns the agent's SelfMetrics, labelled with `agent`: meters it
+    hands out time their callbacks, and every export is timed.
+
+    With pull, every collection is also rendered into `exposition` (an ExpositionCache)
+    for the agents' GET /metrics; exporter may then be None to only be scraped.
+    """
+
+    def __init__(self, exporter, interval_ms, resource=RESOURCE, flush_debounce_s=0.5, flush_max_per_s=1.0, self_metrics=True,
+                 self_metrics_per_target=True, pull=False, agent="agent"):
+        self.exporter = exporter
+        self.exposition = ExpositionCache(exporter) if pull or exporter is None else None
+        instrumented = InstrumentedExporter(self.exposition or exporter)
+        self.reader = PeriodicExportingMetricReader(instrumented, interval_ms)
+        # Registrations arriving close together share one early collection instead of a thread each
+        self.flusher = FlushCoordinator(self.reader.force_flush, flush_debounce_s, flush_max_per_s)
+        self.provider = MeterProvider(metric_readers=[self.reader], resource=resource)
+        self.self_metrics = SelfMetrics(self.provider.get_meter("fluidos-agent", "1.0.0"), self.flusher, self_metrics, self_metrics_per_target, agent)
+        instrumented.self_metrics = self.self_metrics
+        if isinstance(exporter, DeadbandExporter):
+            create_deadband_counters(self.meter("cluster-monitor", "1.0.0"), exporter)
+
+    @classmethod
+    def from_env(cls, textfile_name, agent="agent"):
+        return cls(
+            create_metric_exporter(textfile_name),
+            int(os.getenv("INTERVAL_MS", "30000")),
+            flush_debounce_s=int(os.getenv("FLUSH_DEBOUNCE_MS", "500")) / 1000,
+            flush_max_per_s=float(os.getenv("FLUSH_MAX_PER_S", "1")),
+            self_metrics=os.getenv("SELF_METRICS", "true").lower() == "true",
+            self_metrics_per_target=os.getenv("SELF_METRICS_PER_TARGET", "true").lower() == "true",
+            pull=os.getenv("PULL_METRICS", "false").lower() == "true",
+            agent=agent,
+        )
+
+    def meter(self, name, version=None):
+        return self.self_metrics.wrap_meter(self.provider.get_meter(name, version))
+
+    def shutdown(self):
+        self.provider.shutdown()
+
+
+def current():
+    """The runtime hosting this process' collectors, None until one is installed."""
+    return _current
+
+
+def install(runtime):
+    """Make runtime the one collectors pick up with current(), and the global MeterProvider."""
+    global _current
+    _current = runtime
+    metrics.set_meter_provider(runtime.provider)
+    return runtime
+
+
+def load_plugins(names, plugins):
+    """Import the collector modules for names, only those, and return {name: module}.
+
+    `plugins` maps a collector name to (directory, module name); the directory is put on
+    sys.path first. Install the runtime before calling this, the modules register their
+    gauges with current() when imported.
+    """
+    modules = {}
+    for name in names:
+        if name not in plugins:
+            raise ValueError(f"Unknown collector {name!r}, expected one of {', '.join(sorted(plugins))}")
+        directory, module_name = plugins[name]
+        if directory not in sys.path:
+            sys.path.append(directory)
+        modules[name] = importlib.import_module(module_name)
+        logging.info(f"Collector {name} loaded from {module_name}")
+    return modules
@@ -0,0 +1,137 @@
+import time
+
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+# Milliseconds, from sub-millisecond callbacks to requests near their timeout
+DURATION_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class SelfMetrics:
+    """The agent's own metrics, exported with the others under fluidos.agent.*.
+
+    Covers the time spent in every collection callback (through the meters returned by
+    wrap_meter), probe and upstream request durations per target, export duration and
+    failures, registry sizes and the flush backlog. When disabled every method is a no-op
+    and wrap_meter returns the meter unchanged. Without per_target, probe and upstream
+    durations are one histogram each instead of one per target. Every series carries
+    an `agent` label, so agents writing next to each other (textfiles in one directory,
+    scrapes without pod labels) do not produce the same series.
+    """
+
+    def __init__(self, meter, flusher=None, enabled=True, per_target=True, agent="agent"):
+        self.enabled = enabled
+        self.agent = agent
+        self.per_target = per_target
+        self.flusher = flusher
+        self._registries = {}  # collector name -> sized object
+        if not enabled:
+            return
+        histogram = lambda name, description: meter.create_histogram(
+            name, unit="ms", description=description, explicit_bucket_boundaries_advisory=DURATION_BUCKETS_MS,
+        )
+        self.callback_duration = histogram("fluidos.agent.callback.duration", "Time spent in each instrument's collection callback")
+        self.probe_duration = histogram("fluidos.agent.probe.duration", "Time taken by each probe of a target, all attempts included")
+        self.upstream_duration = histogram("fluidos.agent.upstream.duration", "Time taken by each request to an upstream API")
+        self.export_duration = histogram("fluidos.agent.export.duration", "Time taken by each export, retries included")
+        self.export_failures = meter.create_counter("fluidos.agent.export.failures", description="Exports that did not succeed")
+        meter.create_observable_gauge(
+            "fluidos.agent.registry.size",
+            callbacks=[lambda _: [Observation(len(registry), {"agent": agent, "collector": name}) for name, registry in self._registries.items()]],
+            description="Targets registered with each collector",
+        )
+        meter.create_observable_gauge(
+            "fluidos.agent.flush.pending",
+            callbacks=[lambda _: [Observation(self.flusher.pending, {"agent": agent})] if self.flusher is not None else []],
+            description="Flush requests not yet covered by a finished early collection",
+        )
+
+    def timed(self, instrument, callback):
+        """callback, recording how long each call takes (observations are taken from it right away)."""
+        if not self.enabled:
+            return callback
+        attributes = {"agent": self.agent, "instrument": instrument}
+
+        def timed_callback(options):
+            start = time.perf_counter()
+            try:
+                return list(callback(options))
+            finally:
+                self.callback_duration.record((time.perf_counter() - start) * 1000, attributes)
+        return timed_callback
+
+    def wrap_meter(self, meter):
+        return _TimedMeter(meter, self) if self.enabled else meter
+
+    def record_probe(self, target, duration_s, ok=True):
+        if self.enabled:
+            attributes = {"agent": self.agent, "target": target, "ok": ok} if self.per_target else {"agent": self.agent, "ok": ok}
+            self.probe_duration.record(duration_s * 1000, attributes)
+
+    def record_upstream(self, endpoint, target, duration_s, status):
+        if self.enabled:
+            attributes = {"agent": self.agent, "endpoint": endpoint, "status": str(status)}
+            if self.per_target:
+                attributes["target"] = target
+            self.upstream_duration.record(duration_s * 1000, attributes)
+
+    def record_export(self, duration_s, result):
+        if self.enabled:
+            attributes = {"agent": self.agent}
+            self.export_duration.record(duration_s * 1000, attributes)
+            if result != MetricExportResult.SUCCESS:
+                self.export_failures.add(1, attributes)
+
+    def watch_registry(self, collector, registry):
+        self._registries[collector] = registry
+
+
+class _TimedMeter:
+    """Meter whose observable instruments time their callbacks with SelfMetrics.timed."""
+
+    def __init__(self, meter, self_metrics):
+        self._meter = meter
+        self._self_metrics = self_metrics
+
+    def __getattr__(self, name):
+        return getattr(self._meter, name)
+
+    def _timed(self, name, callbacks):
+        return [self._self_metrics.timed(name, callback) for callback in callbacks or ()]
+
+    def create_observable_gauge(self, name, callbacks=None, **kwargs):
+        return self._meter.create_observable_gauge(name, callbacks=self._timed(name, callbacks), **kwargs)
+
+    def create_observable_counter(self, name, callbacks=None, **kwargs):
+        return self._meter.create_observable_counter(name, callbacks=self._timed(name, callbacks), **kwargs)
+
+    def create_observable_up_down_counter(self, name, callbacks=None, **kwargs):
+        return self._meter.create_observable_up_down_counter(name, callbacks=self._timed(name, callbacks), **kwargs)
+
+
+class InstrumentedExporter(MetricExporter):
+    """Wraps the agent's exporter and records the duration and result of each export.
+
+    `self_metrics` is set once the MeterProvider exists, exports before that are not recorded.
+    """
+
+    def __init__(self, exporter, self_metrics=None):
+        super().__init__(preferred_temporality=exporter._preferred_temporality, preferred_aggregation=exporter._preferred_aggregation)
+        self.exporter = exporter
+        self.self_metrics = self_metrics
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        start = time.perf_counter()
+        result = MetricExportResult.FAILURE
+        try:
+            result = self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+            return result
+        finally:
+            if self.self_metrics is not None:
+                self.self_metrics.record_export(time.perf_counter() - start, result)
+
+    def force_flush(self, timeout_millis=10_000):
+        return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
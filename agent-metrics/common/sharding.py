@@ -0,0 +1,70 @@
+import hashlib
+import os
+import socket
+import threading
+
+
+def parse_members(value):
+    """Parse a comma separated member list such as "metric-latency-0,metric-latency-1"."""
+    return [member.strip() for member in (value or "").split(",") if member.strip()]
+
+
+def _score(member, key):
+    if isinstance(key, tuple):
+        key = "|".join(str(part) for part in key)
+    digest = hashlib.blake2b(f"{member}/{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def owner(key, members):
+    """Rendezvous (highest random weight) hashing: the member with the best score owns key.
+
+    When a member joins or leaves only the keys it wins or owned change hands,
+    about 1/N of them, and every process computes the same answer.
+    """
+    return max(members, key=lambda member: _score(member, key))
+
+
+class Shard:
+    """This replica's share of the targets, given the full member list.
+
+    With no members configured sharding is off and every target is owned.
+    """
+
+    def __init__(self, members=None, self_id=None):
+        self.self_id = self_id or socket.gethostname()
+        self._lock = threading.Lock()
+        self._selected = (None, None, ())  # (snapshot, members, owned items) of the last select()
+        self.set_members(members or [])
+
+    @classmethod
+    def from_env(cls):
+        return cls(parse_members(os.getenv("SHARD_MEMBERS")), os.getenv("SHARD_ID"))
+
+    @property
+    def enabled(self):
+        return bool(self.members)
+
+    def set_members(self, members):
+        members = tuple(dict.fromkeys(members))
+        if members and self.self_id not in members:
+            raise ValueError(f"{self.self_id} is not in the shard member list")
+        with self._lock:
+            self.members = members
+
+    def owns(self, key):
+        members = self.members
+        return not members or owner(key, members) == self.self_id
+
+    def select(self, snapshot, key):
+        """Items of a registry snapshot owned by this replica, reused until either changes."""
+        members = self.members
+        last_snapshot, last_members, owned = self._selected
+        if last_snapshot is snapshot and last_members == members:
+            return owned
+        if not members:
+            owned = snapshot
+        else:
+            owned = tuple(item for item in snapshot if owner(key(item), members) == self.self_id)
+        self._selected = (snapshot, members, owned)
+        return owned
@@ -0,0 +1,54 @@
+import math
+import threading
+
+import numpy as np
+from opentelemetry.metrics import CallbackOptions, Observation
+
+
+class CycleSnapshot:
+    """Reads a multi-metric source once per collection cycle for a group of gauges.
+
+    `read()` returns (attributes, values): one attribute dict per device and a
+    devices x metrics array. Each gauge's callback yields only its own column.
+    A new cycle starts when a gauge asks again for a column it already reported,
+    so the source is read once per collection whatever the number of gauges.
+    A NaN value marks a metric the device has no value for, it is left out.
+    """
+
+    def __init__(self, read, names):
+        self.read = read
+        self.names = list(names)
+        self.reads = 0
+        self._slots = {name: slot for slot, name in enumerate(self.names)}
+        self._served = np.ones(len(self.names), dtype=bool)
+        self._attributes = []
+        self._values = np.empty((0, len(self.names)))
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        attributes, values = self.read()
+        self._attributes = list(attributes)
+        self._values = np.asarray(values, dtype=float).reshape(len(self._attributes), len(self.names))
+        self._served[:] = False
+        self.reads += 1
+
+    def observe(self, name):
+        slot = self._slots[name]
+        with self._lock:
+            if self._served[slot]:
+                self._refresh()
+            self._served[slot] = True
+            attributes, column = self._attributes, self._values[:, slot].tolist()
+        return [Observation(value, attrs) for value, attrs in zip(column, attributes) if not math.isnan(value)]
+
+    def callback(self, name):
+        def observe(_: CallbackOptions):
+            return self.observe(name)
+        return observe
+
+    def create_gauges(self, meter, specs):
+        """Create one observable gauge per (name, description, unit) in specs, in the snapshot's order."""
+        return [
+            meter.create_observable_gauge(name=name, description=description, unit=unit, callbacks=[self.callback(name)])
+            for name, description, unit in specs
+        ]
@@ -0,0 +1,232 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from opentelemetry.exporter.otlp.proto.common._internal.metrics_encoder import encode_metrics
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+_HEADER = struct.Struct(">II")  # record length, crc32
+
+
+class _Segment:
+    def __init__(self, seq, size=0, records=0):
+        self.seq = seq
+        self.size = size
+        self.records = records
+
+
+class DiskSpool:
+    """Bounded on-disk FIFO of encoded records, kept in append-only segment files.
+
+    Records are appended to the newest segment and read from a cursor that is saved
+    after every commit, so pending records survive a restart. When the spool grows past
+    max_bytes the oldest segment is deleted, pending records included, and counted in
+    `dropped`. A torn record at the end of the last segment (crash while appending) is
+    cut off when the spool is opened.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max(max_bytes // 4, 1))
+        self.dropped = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._segments = [self._scan(int(name[:-4])) for name in sorted(os.listdir(directory)) if name.endswith(".log")]
+        if not self._segments:
+            self._segments.append(_Segment(0))
+        # Cursor: segment, byte offset and record index within it of the next record to send
+        self._cursor = self._load_cursor()
+        self._writer = open(self._path(self._segments[-1].seq), "ab")
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:016d}.log")
+
+    def _scan(self, seq):
+        segment = _Segment(seq)
+        path = self._path(seq)
+        with open(path, "rb") as segment_file:
+            while True:
+                header = segment_file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                record = segment_file.read(length)
+                if len(record) < length or zlib.crc32(record) != crc:
+                    break
+                segment.size += _HEADER.size + length
+                segment.records += 1
+        if segment.size != os.path.getsize(path):
+            logging.warning(f"Truncating torn record at the end of {path}")
+            with open(path, "r+b") as segment_file:
+                segment_file.truncate(segment.size)
+        return segment
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, "cursor")) as cursor_file:
+                seq, offset, index = map(int, cursor_file.read().split())
+        except (OSError, ValueError):
+            return (self._segments[0].seq, 0, 0)
+        if seq < self._segments[0].seq:
+            return (self._segments[0].seq, 0, 0)
+        return (seq, offset, index)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as cursor_file:
+            cursor_file.write("%d %d %d" % self._cursor)
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        seq, _, index = self._cursor
+        return sum(segment.records for segment in self._segments if segment.seq >= seq) - index
+
+    @property
+    def size(self):
+        with self._lock:
+            return sum(segment.size for segment in self._segments)
+
+    def append(self, record):
+        with self._lock:
+            if self._segments[-1].size and self._segments[-1].size + len(record) > self.segment_bytes:
+                self._writer.close()
+                self._segments.append(_Segment(self._segments[-1].seq + 1))
+                self._writer = open(self._path(self._segments[-1].seq), "ab")
+            self._writer.write(_HEADER.pack(len(record), zlib.crc32(record)) + record)
+            self._writer.flush()
+            self._segments[-1].size += _HEADER.size + len(record)
+            self._segments[-1].records += 1
+            while len(self._segments) > 1 and sum(segment.size for segment in self._segments) > self.max_bytes:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        oldest = self._segments.pop(0)
+        seq, _, index = self._cursor
+        if seq <= oldest.seq:
+            self.dropped += oldest.records - (index if seq == oldest.seq else 0)
+            self._cursor = (self._segments[0].seq, 0, 0)
+            self._save_cursor()
+        os.remove(self._path(oldest.seq))
+        logging.warning(f"Spool over {self.max_bytes} bytes, dropped its oldest segment")
+
+    def peek(self, max_bytes):
+        """Oldest pending records up to max_bytes (at least one), and the position to commit after sending them."""
+        with self._lock:
+            records = []
+            size = 0
+            seq, offset, index = self._cursor
+            for segment in self._segments:
+                if segment.seq < seq:
+                    continue
+                if segment.seq > seq:
+                    seq, offset, index = segment.seq, 0, 0
+                if index >= segment.records:
+                    continue
+                with open(self._path(seq), "rb") as segment_file:
+                    segment_file.seek(offset)
+                    while index < segment.records:
+                        length, _ = _HEADER.unpack(segment_file.read(_HEADER.size))
+                        if records and size + length > max_bytes:
+                            return records, (seq, offset, index)
+                        records.append(segment_file.read(length))
+                        size += length
+                        offset += _HEADER.size + length
+                        index += 1
+            return records, (seq, offset, index)
+
+    def commit(self, position):
+        """Mark everything before position (from peek) as sent and delete the segments left behind."""
+        with self._lock:
+            if position <= self._cursor:
+                return  # the records were dropped meanwhile
+            self._cursor = position
+            while len(self._segments) > 1 and self._segments[0].seq < position[0]:
+                os.remove(self._path(self._segments.pop(0).seq))
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+
+
+class SpoolingExporter(MetricExporter):
+    """Wraps an OTLP exporter and keeps the batches it could not deliver in a DiskSpool.
+
+    While the spool holds data, new batches are appended behind it instead of being
+    sent, so the collector receives them in order. A background thread retries every
+    retry_s seconds and, once the collector answers, replays the spool in batches of up
+    to batch_bytes (the encoded requests are concatenated, which protobuf reads as one
+    request) at no more than max_bytes_per_s. `send` takes the encoded request bytes.
+    """
+
+    def __init__(self, exporter, spool, send, batch_bytes=2 * 1024 * 1024, max_bytes_per_s=4 * 1024 * 1024, retry_s=5.0):
+        super().__init__(preferred_temporality=exporter._preferred_temporality, preferred_aggregation=exporter._preferred_aggregation)
+        self.exporter = exporter
+        self.spool = spool
+        self.send = send
+        self.batch_bytes = batch_bytes
+        self.max_bytes_per_s = max_bytes_per_s
+        self.retry_s = retry_s
+        self.spooled = 0
+        self.replayed = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._replay, daemon=True, name="spool-replay")
+        self._thread.start()
+        if len(spool):
+            logging.info(f"Spool holds {len(spool)} batches from a previous run, replaying")
+            self._wake.set()
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        if not len(self.spool):
+            result = self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+            if result == MetricExportResult.SUCCESS:
+                return result
+            logging.warning("Collector unreachable, spooling metrics to disk until it is back")
+        try:
+            self.spool.append(encode_metrics(metrics_data).SerializeToString())
+        except OSError as e:
+            logging.error(f"Error spooling metrics: {e}")
+            return MetricExportResult.FAILURE
+        self.spooled += 1
+        self._wake.set()
+        return MetricExportResult.SUCCESS
+
+    def _replay(self):
+        while not self._stopped:
+            self._wake.wait(self.retry_s)
+            self._wake.clear()
+            while len(self.spool) and not self._stopped:
+                records, position = self.spool.peek(self.batch_bytes)
+                payload = b"".join(records)
+                start = time.monotonic()
+                try:
+                    self.send(payload)
+                except Exception as e:
+                    logging.debug(f"Spool replay failed, retrying in {self.retry_s}s: {e}")
+                    break
+                self.spool.commit(position)
+                self.replayed += len(records)
+                if not len(self.spool):
+                    logging.info("Spool replayed, exporting directly again")
+                # Rate limit so the catch-up does not swamp a collector that just came back
+                delay = len(payload) / self.max_bytes_per_s - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def force_flush(self, timeout_millis=10_000):
+        return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        self._stopped = True
+        self._wake.set()
+        self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+        self.spool.close()
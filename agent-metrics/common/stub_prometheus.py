@@ -0,0 +1,94 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_POINTS_PER_QUERY = 11000
+
+
+def sample_value(instance, timestamp):
+    # Deterministic per series and time so tests can check where every sample landed
+    return instance * 1000000 + timestamp
+
+
+class StubPrometheus(ThreadingHTTPServer):
+    """Local stand-in for the Prometheus HTTP query API, used by tests and offline runs.
+
+    Every query returns `series` series labelled instance="0", "1", ... with the values
+    of sample_value(). Range queries are recorded in `range_queries` as (query, start,
+    end, step) and are refused above Prometheus' points-per-series limit, like the real
+    server. Series only have samples from `first_sample` on.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address=("127.0.0.1", 0), series=2, first_sample=0):
+        super().__init__(address, _Handler)
+        self.series = series
+        self.first_sample = first_sample
+        self.range_queries = []
+        self.instant_queries = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path == "/api/v1/query_range":
+            start, end, step = float(query["start"]), float(query["end"]), float(query["step"])
+            with server._lock:
+                server.range_queries.append((query["query"], start, end, step))
+            if (end - start) / step + 1 > MAX_POINTS_PER_QUERY:
+                return self._error(400, "bad_data", "exceeded maximum resolution of 11,000 points per timeseries")
+            times = []
+            t = start
+            while t <= end:
+                if t >= server.first_sample:
+                    times.append(t)
+                t += step
+            result = [
+                {"metric": {"instance": str(i)}, "values": [[t, str(sample_value(i, t))] for t in times]}
+                for i in range(server.series)
+            ]
+            return self._send(200, {"status": "success", "data": {"resultType": "matrix", "result": [r for r in result if r["values"]]}})
+        if parsed.path == "/api/v1/query":
+            at = float(query.get("time", 0))
+            with server._lock:
+                server.instant_queries.append((query["query"], at))
+            result = [{"metric": {"instance": str(i)}, "value": [at, str(sample_value(i, at))]} for i in range(server.series)]
+            return self._send(200, {"status": "success", "data": {"resultType": "vector", "result": result}})
+        self._send(404, {"status": "error", "errorType": "not_found", "error": "not found"})
+
+    def _error(self, status, error_type, message):
+        self._send(status, {"status": "error", "errorType": error_type, "error": message})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
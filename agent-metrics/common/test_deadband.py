@@ -0,0 +1,93 @@
+from opentelemetry.exporter.otlp.proto.common._internal.metrics_encoder import encode_metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader, MetricExporter, MetricExportResult, PeriodicExportingMetricReader
+from opentelemetry.metrics import Observation
+
+from common.deadband import DeadbandExporter, create_deadband_counters, encoded_point_size
+
+
+class RecordingExporter(MetricExporter):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        self.batches.append({
+            (metric.name, tuple(sorted(point.attributes.items()))): point.value
+            for resource in metrics_data.resource_metrics for scope in resource.scope_metrics for metric in scope.metrics
+            for point in metric.data.data_points
+        })
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10_000):
+        return True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        pass
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def setup(values, **kwargs):
+    clock = Clock()
+    recorder = RecordingExporter()
+    exporter = DeadbandExporter(recorder, clock=clock, **kwargs)
+    reader = PeriodicExportingMetricReader(exporter, 3600 * 1000)
+    provider = MeterProvider(metric_readers=[reader])
+    meter = provider.get_meter("test")
+    meter.create_observable_gauge("latency", callbacks=[lambda _: [Observation(v, {"to": to}) for to, v in values.items()]])
+    return clock, recorder, exporter, reader, meter
+
+
+def test_unchanged_points_are_suppressed_until_the_heartbeat():
+    values = {"a": 10.0, "b": 20.0}
+    clock, recorder, exporter, reader, _ = setup(values, heartbeat_s=60)
+    reader.force_flush()
+    values["a"] = 11.0
+    clock.now = 30
+    reader.force_flush()
+    assert recorder.batches[-1] == {("latency", (("to", "a"),)): 11.0}
+    clock.now = 61
+    reader.force_flush()
+    # b was last sent at 0, a at 30
+    assert recorder.batches[-1] == {("latency", (("to", "b"),)): 20.0}
+    assert exporter.suppressed_points == 2 and exporter.saved_bytes > 0
+
+
+def test_deadband():
+    values = {"a": 100.0}
+    clock, recorder, exporter, reader, _ = setup(values, abs_deadband=0.5, rel_deadband=0.02)
+    reader.force_flush()
+    for value, sent in ((100.4, False), (101.5, False), (103.0, True), (102.0, False)):
+        values["a"] = value
+        batches = len(recorder.batches)
+        reader.force_flush()
+        assert (len(recorder.batches) > batches) == sent
+
+
+def test_savings_are_reported_as_agent_metrics():
+    values = {"a": 1.0}
+    clock, recorder, exporter, reader, meter = setup(values)
+    create_deadband_counters(meter, exporter)
+    reader.force_flush()
+    reader.force_flush()
+    reader.force_flush()
+    last = recorder.batches[-1]
+    assert last[("fluidos.agent.export.suppressed_points", ())] == 1
+    assert last[("fluidos.agent.export.saved_bytes", ())] > 0
+
+
+def test_saved_bytes_estimate_matches_the_encoder():
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    attributes = lambda i: {"from_node": "10.208.99.108", "to_cluster": f"cluster-{i}", "to_node": f"10.0.{i // 250}.{i % 250}"}
+    meter.create_observable_gauge("node.fluidos.latency", callbacks=[lambda _: [Observation(1.5 + i, attributes(i)) for i in range(1000)]])
+    metrics_data = reader.get_metrics_data()
+    points = metrics_data.resource_metrics[0].scope_metrics[0].metrics[0].data.data_points
+    estimate = sum(encoded_point_size(point) for point in points)
+    assert abs(estimate / encode_metrics(metrics_data).ByteSize() - 1) < 0.05
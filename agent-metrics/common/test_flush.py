@@ -0,0 +1,50 @@
+import threading
+import time
+
+from common.flush import FlushCoordinator
+
+
+def test_burst_of_requests_triggers_one_flush():
+    calls = []
+    coordinator = FlushCoordinator(lambda: calls.append(time.monotonic()) or True, debounce_s=0.05)
+    for _ in range(1000):
+        coordinator.request()
+    assert coordinator.request(wait=True, timeout=2) is True
+    assert len(calls) == 1
+    assert coordinator.pending == 0
+
+
+def test_waiters_see_the_flush_that_covers_them():
+    coordinator = FlushCoordinator(lambda: True, debounce_s=0.02)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coordinator.request(wait=True, timeout=2))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [True] * 20
+    assert coordinator.flushes <= 2
+
+
+def test_flush_rate_is_capped():
+    calls = []
+    coordinator = FlushCoordinator(lambda: calls.append(time.monotonic()), debounce_s=0, max_per_s=10)
+    for _ in range(4):
+        coordinator.request(wait=True, timeout=2)
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert len(calls) == 4
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+def test_failing_flush_does_not_stop_the_coordinator():
+    outcomes = iter([RuntimeError("boom"), True])
+
+    def flaky():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    coordinator = FlushCoordinator(flaky, debounce_s=0, max_per_s=0)
+    assert coordinator.request(wait=True, timeout=2) is False
+    assert coordinator.request(wait=True, timeout=2) is True
@@ -0,0 +1,35 @@
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter as GrpcExporter
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter as HttpExporter
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+from common.otlp import create_exporter, create_sender
+from common.otlp_sink import OTLPSink
+
+
+def test_create_exporter_protocols():
+    assert isinstance(create_exporter("http://127.0.0.1:4317", "grpc"), GrpcExporter)
+    exporter = create_exporter("http://127.0.0.1:4318", "http")
+    assert isinstance(exporter, HttpExporter)
+    assert exporter._endpoint == "http://127.0.0.1:4318/v1/metrics"
+
+
+def test_sender_without_endpoint_uses_the_exporter_defaults():
+    # SPOOL_DIR without COLLECTOR_ENDPOINT, like the exporter itself
+    assert callable(create_sender(None, "grpc"))
+    assert callable(create_sender(None, "http"))
+
+
+def test_both_protocols_reach_the_local_sink():
+    sink = OTLPSink().start()
+    try:
+        for protocol, endpoint in (("grpc", sink.grpc_endpoint), ("http", sink.http_endpoint)):
+            reader = PeriodicExportingMetricReader(create_exporter(endpoint, protocol), 3600 * 1000)
+            provider = MeterProvider(metric_readers=[reader])
+            provider.get_meter("test").create_counter("requests").add(1)
+            reader.force_flush()
+            provider.shutdown()
+        assert sink.stats()["requests"] >= 2
+        assert sink.data_points >= 2
+    finally:
+        sink.stop()
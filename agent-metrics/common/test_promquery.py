@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from common.promquery import PrometheusQueryClient, PrometheusQueryError
+from common.stub_prometheus import StubPrometheus, sample_value
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def prometheus():
+    server = StubPrometheus().start()
+    yield server
+    server.stop()
+
+
+def client_for(server, **kwargs):
+    return PrometheusQueryClient(server.url, clock=lambda: NOW, **kwargs)
+
+
+def test_long_range_is_split_into_aligned_chunks(prometheus):
+    client = client_for(prometheus, chunk_points=100)
+    result = client.query_range("up", 1003, 5000, 10)
+    assert result.timestamps[0] == 1010 and result.timestamps[-1] == 5000
+    assert len(result.timestamps) == 400
+    assert [labels["instance"] for labels in result.labels] == ["0", "1"]
+    np.testing.assert_array_equal(result.values[1], sample_value(1, result.timestamps))
+    # Chunks start on multiples of chunk_points * step and stay under the server's limit
+    assert all(start % 1000 == 0 and (end - start) / step < 100 for _, start, end, step in prometheus.range_queries)
+    assert len(prometheus.range_queries) == 5
+
+
+def test_range_over_the_prometheus_point_limit(prometheus):
+    client = client_for(prometheus, chunk_points=50000)
+    result = client.query_range("up", 0, 30000, 1)
+    assert len(result.timestamps) == 30001
+    assert not np.isnan(result.values).any()
+
+
+def test_finished_chunks_are_cached(prometheus):
+    client = client_for(prometheus, chunk_points=100)
+    client.query_range("up", 0, 5000, 10)
+    fetched = len(prometheus.range_queries)
+    # Sliding the window forward only fetches the chunks not seen yet
+    result = client.query_range("up", 2000, 7000, 10)
+    assert len(prometheus.range_queries) == fetched + 2
+    np.testing.assert_array_equal(result.values[0], sample_value(0, result.timestamps))
+    # A different step or query is a different chunk
+    client.query_range("up", 0, 5000, 20)
+    client.query_range("down", 0, 5000, 10)
+    assert len(prometheus.range_queries) == fetched + 2 + 3 + 6
+
+
+def test_recent_chunk_is_not_cached(prometheus):
+    client = client_for(prometheus, chunk_points=100, settle_s=300)
+    client.query_range("up", NOW - 3600, NOW, 10)
+    client.query_range("up", NOW - 3600, NOW, 10)
+    # The last two chunks end within settle_s of now and are fetched again
+    recent = sorted(q[1:3] for q in prometheus.range_queries if q[2] > NOW - 300)
+    assert recent == [(NOW - 1000, NOW - 10)] * 2 + [(NOW, NOW)] * 2
+    assert len(prometheus.range_queries) == 5 + 2
+
+
+def test_missing_samples_are_nan(prometheus):
+    prometheus.first_sample = 500
+    result = client_for(prometheus).query_range("up", 0, 1000, 100)
+    assert np.isnan(result.values[:, :5]).all()
+    assert not np.isnan(result.values[:, 5:]).any()
+    assert result.series(instance="1").shape == (1, 11)
+
+
+def test_errors_and_instant_queries(prometheus):
+    client = client_for(prometheus)
+    assert client.query("up", at=10) == [({"instance": "0"}, 10.0), ({"instance": "1"}, 1000010.0)]
+    with pytest.raises(PrometheusQueryError):
+        PrometheusQueryClient(prometheus.url + "/missing").query("up")
@@ -0,0 +1,51 @@
+import gzip
+
+from opentelemetry.metrics import Observation
+
+from common.pull import accepts_gzip
+from common.runtime import AgentRuntime
+from common.textfile import PrometheusTextfileExporter
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip")
+    assert accepts_gzip("deflate, gzip;q=0.5")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("gzip;q=0")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip(None)
+
+
+def test_scrapes_serve_the_last_collection_without_collecting():
+    runtime = AgentRuntime(None, 3_600_000, self_metrics=False)
+    calls = []
+
+    def callback(_):
+        calls.append(1)
+        return [Observation(1.5, {"to_node": "10.0.0.1"})]
+    runtime.meter("test").create_observable_gauge("node.fluidos.latency", callbacks=[callback])
+    try:
+        assert runtime.exposition.body() == (b"", None)
+        runtime.reader.force_flush()
+        plain, encoding = runtime.exposition.body()
+        assert encoding is None
+        assert b'node_fluidos_latency{to_node="10.0.0.1"} 1.5\n' in plain
+        for _ in range(10):
+            gzipped, encoding = runtime.exposition.body("gzip")
+        assert encoding == "gzip" and gzip.decompress(gzipped) == plain
+        assert len(calls) == 1 and runtime.exposition.renders == 1
+    finally:
+        runtime.shutdown()
+
+
+def test_collections_are_also_pushed_to_the_exporter(tmp_path):
+    exporter = PrometheusTextfileExporter(str(tmp_path / "agent.prom"))
+    runtime = AgentRuntime(exporter, 3_600_000, self_metrics=False, pull=True)
+    runtime.meter("test").create_observable_gauge("test.value", callbacks=[lambda _: [Observation(2.0)]])
+    try:
+        runtime.reader.force_flush()
+        assert (tmp_path / "agent.prom").read_bytes() == runtime.exposition.body()[0]
+        assert b"test_value 2.0\n" in runtime.exposition.body()[0]
+    finally:
+        runtime.shutdown()
+
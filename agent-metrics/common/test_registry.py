@@ -0,0 +1,71 @@
+import threading
+
+from common.registry import Registry
+
+
+def _cluster(ip):
+    return {"domain": "UMU", "cluster": "UMU", "node_ip": ip}
+
+
+def test_add_rejects_duplicates():
+    registry = Registry(lambda c: c["node_ip"])
+    assert registry.add(_cluster("10.0.0.1"))
+    assert not registry.add(_cluster("10.0.0.1"))
+    assert len(registry) == 1
+    assert "10.0.0.1" in registry
+
+
+def test_bulk_add_and_remove():
+    registry = Registry(lambda c: c["node_ip"])
+    registry.add(_cluster("10.0.0.0"))
+    added = registry.add_many([_cluster(f"10.0.0.{i}") for i in range(100)])
+    assert len(added) == 99
+    removed = registry.remove_many([f"10.0.0.{i}" for i in range(50)] + ["192.168.0.1"])
+    assert len(removed) == 50
+    assert len(registry) == 50
+    assert registry.get("10.0.0.75")["node_ip"] == "10.0.0.75"
+
+
+def test_remove_returns_item_or_none():
+    registry = Registry(lambda loc: (loc["lat"], loc["lon"]))
+    registry.add({"lat": "1", "lon": "2"})
+    assert registry.remove(("1", "2")) == {"lat": "1", "lon": "2"}
+    assert registry.remove(("1", "2")) is None
+
+
+def test_snapshot_is_immutable_and_reused():
+    registry = Registry(lambda c: c["node_ip"])
+    registry.add(_cluster("10.0.0.1"))
+    first = registry.snapshot()
+    assert registry.snapshot() is first
+    registry.add(_cluster("10.0.0.2"))
+    second = registry.snapshot()
+    assert len(first) == 1 and len(second) == 2
+    assert isinstance(second, tuple)
+
+
+def test_snapshot_during_concurrent_writes():
+    registry = Registry(lambda c: c["node_ip"])
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            registry.add(_cluster(str(i)))
+            registry.remove(str(i - 10))
+            i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            try:
+                for cluster in registry.snapshot():
+                    assert "node_ip" in cluster
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
@@ -0,0 +1,65 @@
+import sys
+
+import pytest
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+from common import runtime as runtime_module
+from common.runtime import AgentRuntime, current, load_plugins
+
+PLUGIN = '''
+from opentelemetry.metrics import Observation
+from common.runtime import current
+
+meter = current().meter("{name}")
+meter.create_observable_gauge("{name}.value", callbacks=[lambda _: [Observation({value})]])
+'''
+
+
+class RecordingExporter(MetricExporter):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        self.batches.append({
+            metric.name: point.value
+            for resource in metrics_data.resource_metrics for scope in resource.scope_metrics for metric in scope.metrics
+            for point in metric.data.data_points
+        })
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10_000):
+        return True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        pass
+
+
+@pytest.fixture
+def plugins(tmp_path, monkeypatch):
+    for name, value in (("plugin_one", 1.0), ("plugin_two", 2.0), ("plugin_three", 3.0)):
+        (tmp_path / f"runtime_{name}.py").write_text(PLUGIN.format(name=name, value=value))
+    monkeypatch.setattr(runtime_module, "_current", None)
+    yield {name: (str(tmp_path), f"runtime_{name}") for name in ("plugin_one", "plugin_two", "plugin_three")}
+    for name in ("plugin_one", "plugin_two", "plugin_three"):
+        sys.modules.pop(f"runtime_{name}", None)
+
+
+def test_enabled_collectors_share_one_export(plugins):
+    exporter = RecordingExporter()
+    runtime = AgentRuntime(exporter, 3_600_000, self_metrics=False)
+    runtime_module._current = runtime
+    try:
+        modules = load_plugins(["plugin_one", "plugin_two"], plugins)
+        assert current() is runtime
+        assert set(modules) == {"plugin_one", "plugin_two"}
+        assert "runtime_plugin_three" not in sys.modules
+        runtime.reader.force_flush()
+    finally:
+        runtime.shutdown()
+    assert exporter.batches[0] == {"plugin_one.value": 1.0, "plugin_two.value": 2.0}
+
+
+def test_unknown_collector_is_rejected(plugins):
+    with pytest.raises(ValueError, match="plugin_four"):
+        load_plugins(["plugin_four"], plugins)
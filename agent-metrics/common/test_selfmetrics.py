@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+from common import profiler
+from common.runtime import AgentRuntime
+
+
+class RecordingExporter(MetricExporter):
+    def __init__(self, result=MetricExportResult.SUCCESS):
+        super().__init__()
+        self.result = result
+        self.batches = []
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        self.batches.append({
+            metric.name: metric.data.data_points
+            for resource in metrics_data.resource_metrics for scope in resource.scope_metrics for metric in scope.metrics
+        })
+        return self.result
+
+    def force_flush(self, timeout_millis=10_000):
+        return True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        pass
+
+
+def test_callbacks_exports_and_registries_are_measured():
+    exporter = RecordingExporter()
+    runtime = AgentRuntime(exporter, 3_600_000)
+    meter = runtime.meter("test")
+
+    def slow_callback(_):
+        time.sleep(0.02)
+        yield Observation(1.0)
+
+    meter.create_observable_gauge("test.value", callbacks=[slow_callback])
+    runtime.self_metrics.watch_registry("test", [1, 2, 3])
+    runtime.self_metrics.record_probe("10.0.0.1", 0.004)
+    try:
+        runtime.reader.force_flush()
+        runtime.reader.force_flush()
+    finally:
+        runtime.shutdown()
+    first, second = exporter.batches[:2]
+    assert first["test.value"][0].value == 1.0
+    [callback] = [point for point in first["fluidos.agent.callback.duration"] if point.attributes["instrument"] == "test.value"]
+    assert callback.count == 1 and callback.sum >= 20
+    [probe] = first["fluidos.agent.probe.duration"]
+    assert dict(probe.attributes) == {"agent": "agent", "target": "10.0.0.1", "ok": True} and probe.sum == pytest.approx(4)
+    assert first["fluidos.agent.registry.size"][0].value == 3
+    assert first["fluidos.agent.flush.pending"][0].value == 0
+    # The first export is measured in the next one
+    assert second["fluidos.agent.export.duration"][0].count == 1
+    assert all(point.attributes["agent"] == "agent" for name, points in second.items() if name.startswith("fluidos.agent.") for point in points)
+    assert "fluidos.agent.export.failures" not in second
+
+
+def test_failed_exports_are_counted():
+    exporter = RecordingExporter(MetricExportResult.FAILURE)
+    runtime = AgentRuntime(exporter, 3_600_000)
+    try:
+        runtime.reader.force_flush()
+        runtime.reader.force_flush()
+    finally:
+        runtime.shutdown()
+    assert exporter.batches[1]["fluidos.agent.export.failures"][0].value == 1
+
+
+def test_disabled_self_metrics_add_nothing():
+    exporter = RecordingExporter()
+    runtime = AgentRuntime(exporter, 3_600_000, self_metrics=False)
+    runtime.meter("test").create_observable_gauge("test.value", callbacks=[lambda _: [Observation(1.0)]])
+    runtime.self_metrics.record_probe("10.0.0.1", 0.004)
+    try:
+        runtime.reader.force_flush()
+        runtime.reader.force_flush()
+    finally:
+        runtime.shutdown()
+    assert set(exporter.batches[1]) == {"test.value"}
+
+
+def test_profile_samples_other_threads_one_at_a_time():
+    stop = threading.Event()
+
+    def busy_loop_for_profile():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop_for_profile, name="busy")
+    worker.start()
+    results = {}
+    second = threading.Thread(target=lambda: results.update(stacks=profiler.sample(0.2, 0.005)))
+    second.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(profiler.ProfilerBusy):
+            profiler.sample(0.1)
+        second.join()
+    finally:
+        stop.set()
+        worker.join()
+    busy = sum(count for stack, count in results["stacks"].items() if stack.startswith("busy;") and "busy_loop_for_profile" in stack)
+    assert busy >= 10
+    assert "busy_loop_for_profile" in profiler.format_collapsed(results["stacks"])
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from common.sharding import Shard, owner, parse_members
+
+KEYS = [f"10.0.{i // 256}.{i % 256}" for i in range(5000)]
+
+
+def test_parse_members():
+    assert parse_members(" a, b,,c ") == ["a", "b", "c"]
+    assert parse_members(None) == []
+
+
+def test_disabled_shard_owns_everything():
+    shard = Shard([], "a")
+    assert not shard.enabled
+    assert all(shard.owns(key) for key in KEYS[:100])
+
+
+def test_replicas_split_targets_evenly_without_overlap():
+    members = ["a", "b", "c", "d"]
+    shards = [Shard(members, member) for member in members]
+    counts = [sum(shard.owns(key) for key in KEYS) for shard in shards]
+    assert sum(counts) == len(KEYS)
+    assert all(abs(count - len(KEYS) / 4) < len(KEYS) * 0.05 for count in counts)
+
+
+def test_join_and_leave_move_few_targets():
+    before = {key: owner(key, ["a", "b", "c", "d"]) for key in KEYS}
+    joined = {key: owner(key, ["a", "b", "c", "d", "e"]) for key in KEYS}
+    moved = [key for key in KEYS if before[key] != joined[key]]
+    # Only keys won by the new member move, about 1/5 of them
+    assert all(joined[key] == "e" for key in moved)
+    assert len(moved) < len(KEYS) * 0.25
+
+    left = {key: owner(key, ["a", "b", "d"]) for key in KEYS}
+    moved = [key for key in KEYS if before[key] != left[key]]
+    assert all(before[key] == "c" for key in moved)
+
+
+def test_tuple_keys_and_select():
+    shard = Shard(["a", "b"], "a")
+    snapshot = tuple({"lat": str(i), "lon": "2"} for i in range(100))
+    selected = shard.select(snapshot, lambda loc: (loc["lat"], loc["lon"]))
+    assert 0 < len(selected) < 100
+    assert shard.select(snapshot, lambda loc: (loc["lat"], loc["lon"])) is selected
+    shard.set_members(["a"])
+    assert len(shard.select(snapshot, lambda loc: (loc["lat"], loc["lon"]))) == 100
+
+
+def test_self_must_be_a_member():
+    with pytest.raises(ValueError):
+        Shard(["a", "b"], "c")
+
+
+def test_assignment_is_identical_across_processes():
+    script = (
+        "from common.sharding import owner\n"
+        "print(''.join(owner(f'10.0.0.{i}', ['a', 'b', 'c']) for i in range(256)))\n"
+    )
+    root = Path(__file__).resolve().parent.parent
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", script], cwd=root, capture_output=True, text=True,
+            env={"PYTHONHASHSEED": str(seed)}, check=True,
+        ).stdout
+        for seed in range(3)
+    }
+    assert len(outputs) == 1
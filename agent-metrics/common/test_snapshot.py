@@ -0,0 +1,56 @@
+import numpy as np
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from common.snapshot import CycleSnapshot
+
+NAMES = ["a", "b", "c"]
+
+
+def _counting_source():
+    state = {"cycle": 0}
+
+    def read():
+        state["cycle"] += 1
+        base = state["cycle"] * 100
+        attributes = [{"device": "d0"}, {"device": "d1"}]
+        return attributes, np.array([[base + 0, base + 1, base + 2], [base + 10, base + 11, base + 12]])
+
+    return read
+
+
+def test_each_gauge_reports_its_own_slot_once_per_read():
+    snapshot = CycleSnapshot(_counting_source(), NAMES)
+    observations = {name: snapshot.observe(name) for name in NAMES}
+    assert snapshot.reads == 1
+    assert [o.value for o in observations["b"]] == [101, 111]
+    assert [o.attributes["device"] for o in observations["c"]] == ["d0", "d1"]
+    # Asking again for a reported slot starts the next cycle
+    assert [o.value for o in snapshot.observe("a")] == [200, 210]
+    assert snapshot.reads == 2
+
+
+def test_sdk_collection_reads_source_once_per_cycle():
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    snapshot = CycleSnapshot(_counting_source(), NAMES)
+    snapshot.create_gauges(meter, [(name, f"metric {name}", "1") for name in NAMES])
+
+    for cycle in (1, 2, 3):
+        data = reader.get_metrics_data()
+        points = {
+            metric.name: sorted(point.value for point in metric.data.data_points)
+            for metric in data.resource_metrics[0].scope_metrics[0].metrics
+        }
+        assert snapshot.reads == cycle
+        assert points == {
+            "a": [cycle * 100, cycle * 100 + 10],
+            "b": [cycle * 100 + 1, cycle * 100 + 11],
+            "c": [cycle * 100 + 2, cycle * 100 + 12],
+        }
+
+
+def test_nan_values_are_left_out():
+    snapshot = CycleSnapshot(lambda: ([{"device": "d0"}, {"device": "d1"}], [[1.0, np.nan, 3.0], [4.0, 5.0, 6.0]]), NAMES)
+    assert [o.attributes["device"] for o in snapshot.observe("b")] == ["d1"]
+    assert len(snapshot.observe("a")) == 2
@@ -0,0 +1,88 @@
+import os
+import time
+
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+from common.otlp import create_sender
+from common.otlp_sink import OTLPSink
+from common.spool import DiskSpool, SpoolingExporter
+
+
+def drain(spool, max_bytes=1 << 20):
+    records = []
+    while len(spool):
+        batch, position = spool.peek(max_bytes)
+        records += batch
+        spool.commit(position)
+    return records
+
+
+def test_fifo_across_segments_and_restarts(tmp_path):
+    spool = DiskSpool(str(tmp_path), max_bytes=1 << 20, segment_bytes=100)
+    for i in range(20):
+        spool.append(b"record%02d" % i)
+    assert len(spool) == 20 and len(os.listdir(tmp_path)) > 2
+    batch, position = spool.peek(40)
+    assert batch == [b"record00", b"record01", b"record02", b"record03", b"record04"]
+    spool.commit(position)
+    spool.close()
+
+    spool = DiskSpool(str(tmp_path), max_bytes=1 << 20, segment_bytes=100)
+    assert len(spool) == 15
+    assert drain(spool) == [b"record%02d" % i for i in range(5, 20)]
+    # Sent segments are deleted
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".log")]) == 1
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append(b"complete")
+    spool.close()
+    with open(tmp_path / "0000000000000000.log", "ab") as segment:
+        segment.write(b"\x00\x00\x00\x10partial")
+    spool = DiskSpool(str(tmp_path))
+    spool.append(b"next")
+    assert drain(spool) == [b"complete", b"next"]
+
+
+def test_full_spool_drops_the_oldest(tmp_path):
+    spool = DiskSpool(str(tmp_path), max_bytes=400, segment_bytes=100)
+    for i in range(100):
+        spool.append(b"x" * 42)
+    assert spool.size <= 400
+    assert spool.dropped + len(spool) == 100
+    assert spool.dropped > 80
+
+
+def test_collector_outage_is_replayed(tmp_path):
+    sink = OTLPSink().start()
+    sink.enabled = False
+    exporter = SpoolingExporter(
+        OTLPMetricExporter(endpoint=sink.grpc_endpoint, insecure=True, timeout=0.5),
+        DiskSpool(str(tmp_path)), create_sender(sink.grpc_endpoint, "grpc"), retry_s=0.1,
+    )
+    reader = PeriodicExportingMetricReader(exporter, 3600 * 1000)
+    provider = MeterProvider(metric_readers=[reader])
+    counter = provider.get_meter("test").create_counter("requests")
+    try:
+        for _ in range(5):
+            counter.add(1)
+            reader.force_flush()
+        assert exporter.spooled == 5 and sink.data_points == 0
+        sink.enabled = True
+        assert sink.wait_for_points(5)
+        deadline = time.monotonic() + 5
+        while len(exporter.spool) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert exporter.replayed == 5 and len(exporter.spool) == 0
+        # Replayed batches are merged into fewer requests
+        assert sink.request_count < 5
+        counter.add(1)
+        reader.force_flush()
+        assert sink.wait_for_points(6)
+        assert exporter.spooled == 5
+    finally:
+        provider.shutdown()
+        sink.stop()
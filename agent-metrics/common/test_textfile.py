@@ -0,0 +1,103 @@
+import os
+
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from common.exposition import ExpositionRenderer, format_labels, metric_name
+from common.textfile import PrometheusTextfileExporter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _collect(values, histogram_values=()):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    meter.create_observable_gauge(
+        "node.fluidos.latency", callbacks=[lambda _: [Observation(v, {"to_node": ip}) for ip, v in values.items()]],
+        description="Network latency", unit="ms",
+    )
+    histogram = meter.create_histogram("probe.duration")
+    for value in histogram_values:
+        histogram.record(value)
+    return reader.get_metrics_data()
+
+
+def test_names_and_label_escaping():
+    assert metric_name("node.fluidos.carbon_forecast") == "node_fluidos_carbon_forecast"
+    assert format_labels((("container.id", 'a"b\\c\n'),)) == '{container_id="a\\"b\\\\c\\n"}'
+
+
+def test_render_reuses_unchanged_lines():
+    renderer = ExpositionRenderer()
+    payload, changed = renderer.render(_collect({"10.0.0.1": 1.5, "10.0.0.2": 2.0}))
+    assert changed
+    assert b"# TYPE node_fluidos_latency gauge\n" in payload
+    assert b'node_fluidos_latency{to_node="10.0.0.1"} 1.5\n' in payload
+    again, changed = renderer.render(_collect({"10.0.0.1": 1.5, "10.0.0.2": 2.0}))
+    assert not changed and again == payload
+    _, changed = renderer.render(_collect({"10.0.0.1": 1.5}))
+    assert changed
+
+
+def test_render_histogram():
+    payload, _ = ExpositionRenderer().render(_collect({}, [3, 30]))
+    assert b"# TYPE probe_duration histogram\n" in payload
+    assert b'probe_duration_bucket{le="+Inf"} 2\n' in payload
+    assert b"probe_duration_count 2\n" in payload
+
+
+def test_size_cap_drops_what_does_not_fit():
+    renderer = ExpositionRenderer(max_bytes=200)
+    payload, _ = renderer.render(_collect({f"10.0.0.{i}": float(i) for i in range(50)}, [1]))
+    assert len(payload) <= 200
+    assert renderer.truncated
+
+
+def test_textfile_is_written_atomically_only_on_change(tmp_path):
+    path = tmp_path / "fluidos_latency.prom"
+    exporter = PrometheusTextfileExporter(str(path))
+    exporter.export(_collect({"10.0.0.1": 1.5}))
+    exporter.export(_collect({"10.0.0.1": 1.5}))
+    assert exporter.writes == 1 and exporter.skipped == 1
+    assert b'to_node="10.0.0.1"} 1.5' in path.read_bytes()
+    exporter.export(_collect({"10.0.0.1": 2.5}))
+    assert exporter.writes == 2
+    assert b"} 2.5" in path.read_bytes()
+    assert os.listdir(tmp_path) == ["fluidos_latency.prom"]
+
+
+def test_volatile_metrics_alone_do_not_rewrite_the_file(tmp_path):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    state = {"latency": 1.5, "age": 0.0}
+    meter.create_observable_gauge("node.fluidos.latency", callbacks=[lambda _: [Observation(state["latency"])]])
+    meter.create_observable_gauge("node.fluidos.latency_age", callbacks=[lambda _: [Observation(state["age"])]])
+    export_duration = meter.create_histogram("fluidos.agent.export.duration")
+    path = tmp_path / "fluidos_latency.prom"
+    clock = FakeClock()
+    exporter = PrometheusTextfileExporter(str(path), heartbeat_s=60, clock=clock)
+    for cycle in range(3):
+        state["age"] = float(cycle)
+        export_duration.record(cycle)
+        exporter.export(reader.get_metrics_data())
+    assert exporter.writes == 1 and exporter.skipped == 2
+    state["latency"] = 2.5
+    exporter.export(reader.get_metrics_data())
+    assert exporter.writes == 2
+    assert b"node_fluidos_latency_age 2.0\n" in path.read_bytes()
+    # Nothing but volatile values changed for heartbeat_s: rewritten anyway
+    state["age"] = 90.0
+    clock.now = 59
+    exporter.export(reader.get_metrics_data())
+    assert exporter.writes == 2
+    clock.now = 60
+    exporter.export(reader.get_metrics_data())
+    assert exporter.writes == 3
+    assert b"node_fluidos_latency_age 90.0\n" in path.read_bytes()
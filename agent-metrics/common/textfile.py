@@ -0,0 +1,59 @@
+import logging
+import os
+import time
+
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+from common.exposition import ExpositionRenderer
+
+TEXTFILE_DIR = "/var/lib/node_exporter/textfile_collector"
+# Change every cycle whatever the targets do, so they alone do not get the file rewritten
+VOLATILE_METRICS = ("node.fluidos.latency_age", "fluidos.agent.")
+
+
+class PrometheusTextfileExporter(MetricExporter):
+    """Writes metrics for node_exporter's textfile collector instead of pushing them over OTLP.
+
+    The file is written to a temporary name in the same directory and renamed over
+    the target, so node_exporter never reads a partial file, and it is only rewritten
+    when a series value changed, changes to the `volatile` metrics aside: those are
+    written with the other metrics but are not a reason to rewrite the file on their
+    own. The file is still rewritten every heartbeat_s, so the volatile values in it are
+    never older than that. Unchanged series reuse their rendered lines.
+    """
+
+    def __init__(self, path, max_bytes=4 * 1024 * 1024, preferred_temporality=None, preferred_aggregation=None,
+                 volatile=VOLATILE_METRICS, heartbeat_s=60.0, clock=time.monotonic):
+        super().__init__(preferred_temporality=preferred_temporality, preferred_aggregation=preferred_aggregation)
+        self.path = path
+        self.renderer = ExpositionRenderer(max_bytes, volatile)
+        self.heartbeat_s = heartbeat_s
+        self.clock = clock
+        self.writes = 0
+        self.skipped = 0
+        self._written_at = float("-inf")
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        payload, changed = self.renderer.render(metrics_data)
+        now = self.clock()
+        if not changed and now - self._written_at < self.heartbeat_s and os.path.exists(self.path):
+            self.skipped += 1
+            return MetricExportResult.SUCCESS
+        # node_exporter only reads *.prom, so the temporary file is never collected
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                tmp_file.write(payload)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error writing {self.path}: {e}")
+            return MetricExportResult.FAILURE
+        self.writes += 1
+        self._written_at = now
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10_000):
+        return True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        pass
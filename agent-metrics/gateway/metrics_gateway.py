@@ -0,0 +1,106 @@
+from fastapi import FastAPI, HTTPException
+from dotenv import load_dotenv
+import math
+import os
+import sys
+import logging
+import requests
+from window_cache import WindowCache
+
+# Shared agent modules live next to this directory (copied to /app/common in the image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.promquery import PrometheusQueryClient, PrometheusQueryError
+
+
+load_dotenv()
+
+# Initialize FastAPI app
+app = FastAPI()
+
+# Initialize logger
+logging.basicConfig(level=logging.INFO)
+
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://127.0.0.1:9090")
+# Results are shared by every caller within one scrape interval, Prometheus has nothing newer before that
+SCRAPE_INTERVAL_S = float(os.getenv("SCRAPE_INTERVAL_S", "10"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+MAX_RANGE_POINTS = int(os.getenv("MAX_RANGE_POINTS", "100000"))
+
+# Named queries, one series per node (instance) or per registered target
+QUERIES = {
+    "node_cpu": '100 * (1 - avg by (instance) (rate(node_cpu_seconds_total{mode="idle"}[2m])))',
+    "node_memory": "100 * (1 - node_memory_MemAvailable_bytes / node_memory_MemTotal_bytes)",
+    "latency": os.getenv("LATENCY_QUERY", "node_fluidos_latency"),
+    "carbon": os.getenv("CARBON_QUERY", "node_fluidos_carbon"),
+}
+
+prometheus = PrometheusQueryClient(PROMETHEUS_URL)
+cache = WindowCache(SCRAPE_INTERVAL_S, CACHE_MAX_ENTRIES)
+
+
+def _expression(name):
+    if name not in QUERIES:
+        raise HTTPException(status_code=404, detail=f"Unknown query {name}, available: {', '.join(QUERIES)}")
+    return QUERIES[name]
+
+
+def _cached(key, loader):
+    try:
+        return cache.get(key, loader)
+    except (PrometheusQueryError, requests.RequestException) as e:
+        logging.error(f"Prometheus query {key} failed: {e}")
+        raise HTTPException(status_code=502, detail=f"Prometheus query failed: {e}")
+
+
+def _number(value):
+    # JSON has no NaN, missing samples become null
+    return None if math.isnan(value) else value
+
+
+@app.get('/metrics/')
+def list_queries():
+    return {"queries": QUERIES, "scrape_interval_s": SCRAPE_INTERVAL_S}
+
+
+@app.get('/metrics/{name}')
+def get_metric(name: str):
+    expression = _expression(name)
+
+    def load(window):
+        return {
+            "name": name,
+            "time": window,
+            "result": [{"labels": labels, "value": _number(value)} for labels, value in prometheus.query(expression, at=window)],
+        }
+
+    return _cached((name,), load)
+
+
+@app.get('/metrics/{name}/range')
+def get_metric_range(name: str, duration_s: float = 3600, step_s: float = 60):
+    expression = _expression(name)
+    if duration_s <= 0 or step_s <= 0 or duration_s / step_s > MAX_RANGE_POINTS:
+        raise HTTPException(status_code=400, detail=f"duration_s and step_s must be positive, at most {MAX_RANGE_POINTS} points")
+
+    def load(window):
+        result = prometheus.query_range(expression, window - duration_s, window, step_s)
+        return {
+            "name": name,
+            "timestamps": result.timestamps.tolist(),
+            "series": [
+                {"labels": labels, "values": [_number(value) for value in row]}
+                for labels, row in zip(result.labels, result.values.tolist())
+            ],
+        }
+
+    return _cached((name, duration_s, step_s), load)
+
+
+@app.get('/cache/')
+def cache_stats():
+    return {"entries": len(cache), "hits": cache.hits, "prometheus_queries": cache.loads}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8002)
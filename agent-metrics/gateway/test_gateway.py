@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.stub_prometheus import StubPrometheus
+
+import metrics_gateway
+from common.promquery import PrometheusQueryClient
+from window_cache import WindowCache
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    server = StubPrometheus(series=3).start()
+    monkeypatch.setattr(metrics_gateway, "prometheus", PrometheusQueryClient(server.url))
+    monkeypatch.setattr(metrics_gateway, "cache", WindowCache(3600))
+    yield TestClient(metrics_gateway.app), server
+    server.stop()
+
+
+def test_named_queries(gateway):
+    client, server = gateway
+    assert set(client.get("/metrics/").json()["queries"]) == {"node_cpu", "node_memory", "latency", "carbon"}
+    body = client.get("/metrics/node_cpu").json()
+    assert len(body["result"]) == 3
+    assert server.instant_queries[0][0] == metrics_gateway.QUERIES["node_cpu"]
+    assert client.get("/metrics/unknown").status_code == 404
+
+
+def test_range_query(gateway):
+    client, server = gateway
+    body = client.get("/metrics/carbon/range", params={"duration_s": 600, "step_s": 60}).json()
+    assert len(body["timestamps"]) == 11
+    assert [len(series["values"]) for series in body["series"]] == [11] * 3
+    assert client.get("/metrics/carbon/range", params={"step_s": 0}).status_code == 400
+
+
+def test_polling_callers_share_one_query_per_window(gateway):
+    client, server = gateway
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(client.get("/metrics/latency").json())) for _ in range(30)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(responses) == 30 and all(r == responses[0] for r in responses)
+    assert len(server.instant_queries) == 1
+    assert client.get("/cache/").json()["prometheus_queries"] == 1
+
+
+def test_prometheus_errors(gateway, monkeypatch):
+    client, server = gateway
+    monkeypatch.setattr(metrics_gateway, "prometheus", PrometheusQueryClient(server.url + "/missing"))
+    assert client.get("/metrics/node_memory").status_code == 502
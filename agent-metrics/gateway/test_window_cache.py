@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from window_cache import WindowCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_one_load_per_window():
+    clock = FakeClock(1003)
+    cache = WindowCache(10, clock=clock)
+    windows = []
+    loader = lambda window: windows.append(window) or len(windows)
+    assert cache.get("cpu", loader) == 1
+    clock.now = 1009.9
+    assert cache.get("cpu", loader) == 1
+    clock.now = 1010
+    assert cache.get("cpu", loader) == 2
+    assert windows == [1000, 1010]
+    assert (cache.hits, cache.loads) == (1, 2)
+
+
+def test_concurrent_misses_share_one_load():
+    cache = WindowCache(60)
+    calls = []
+
+    def loader(window):
+        calls.append(window)
+        time.sleep(0.2)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("cpu", loader))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 20
+    assert len(calls) == 1
+
+
+def test_lru_bound_and_failures_not_cached():
+    cache = WindowCache(10, max_entries=2, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        cache.get(key, lambda window: key)
+    assert len(cache) == 2
+
+    def failing(window):
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        cache.get("d", failing)
+    assert cache.get("d", lambda window: "up") == "up"
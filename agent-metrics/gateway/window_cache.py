@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class WindowCache:
+    """Bounded LRU cache of results that hold for one time window.
+
+    Time is cut into windows of window_s seconds aligned to the epoch (the scrape
+    interval), and a result is cached for the window it was loaded in, so every caller
+    asking for the same key within a window shares one load. Concurrent misses for the
+    same key wait for the load already running. Failed loads are not cached.
+    """
+
+    def __init__(self, window_s, max_entries=1024, clock=time.time):
+        self.window_s = window_s
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.loads = 0
+        self._entries = OrderedDict()  # (key, window start) -> value
+        self._in_flight = {}  # (key, window start) -> Future
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def window(self):
+        """Start of the current window."""
+        now = self.clock()
+        return now - now % self.window_s
+
+    def get(self, key, loader):
+        """Value of key for the current window, calling loader(window start) on a miss."""
+        window = self.window()
+        slot = (key, window)
+        with self._lock:
+            if slot in self._entries:
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return self._entries[slot]
+            future = self._in_flight.get(slot)
+            leader = future is None
+            if leader:
+                future = self._in_flight[slot] = Future()
+                self.loads += 1
+            else:
+                self.hits += 1
+        if leader:
+            try:
+                value = loader(window)
+            except Exception as e:
+                with self._lock:
+                    self._in_flight.pop(slot, None)
+                future.set_exception(e)
+                raise
+            with self._lock:
+                self._entries[slot] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._in_flight.pop(slot, None)
+            future.set_result(value)
+        return future.result()
@@ -1,16 +1,25 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from typing import List, Dict
-from opentelemetry import metrics
 from opentelemetry.metrics import Observation, CallbackOptions
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.resources import SERVICE_NAME, SERVICE_NAMESPACE, SERVICE_VERSION, Resource
+import math
 import time
 import os
-import subprocess
-import threading
+import sys
 from dotenv import load_dotenv
+import probe
+from scheduler import ProbeScheduler
+from sketch import SUMMARY_STATS
+
+# Shared agent modules live next to this directory (copied to /app/common in the image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.registry import Registry
+from common.sharding import Shard
+from common.snapshot import CycleSnapshot
+from common.runtime import AgentRuntime, current, install
+from common import profiler
+from common.profiler import format_collapsed
+from common.pull import CONTENT_TYPE
 
 load_dotenv()
 
@@ -22,53 +31,73 @@ app = FastAPI()
 #ip_list = []
 ip_list = ["10.208.99.106"]
 #cluster_list = [{"domain": "UMU", "cluster": "UMU", "node_ip": "10.208.99.106"}]
-cluster_list = []
+# Remote clusters indexed by node_ip, callbacks iterate over cluster_registry.snapshot()
+cluster_registry = Registry(lambda cluster: cluster['node_ip'])
+# With SHARD_MEMBERS set, each replica only probes the clusters it owns (SHARD_ID, default hostname)
+shard = Shard.from_env()
 SOURCE_IP = os.getenv("SOURCE_IP", "Unknown")
 CLUSTER = os.getenv("CLUSTER", "Unknown")
-COLLECTOR_ENDPOINT = os.getenv("COLLECTOR_ENDPOINT")
-INTERVAL_MS = os.getenv("INTERVAL_MS")
-
-# Function to perform a ping and return the average latency
-def ping_node(node_ip):
-    try:
-        print(f"Ping to {node_ip}.")
-        # Run the ping command
-        result = subprocess.run(["ping", "-c", "4", node_ip], capture_output=True, text=True)
-        # Parse the output for average latency
-        if result.returncode == 0:
-            output = result.stdout
-            # Extract the average latency value from the ping output
-            avg_latency = float(output.split("/")[-3])  # Parse the avg time from the output
-            return avg_latency
-        else:
-            print(f"Ping to {node_ip} failed.")
-            return None
-    except Exception as e:
-        print(f"Error pinging {node_ip}: {e}")
-        return None
+INTERVAL_MS = os.getenv("INTERVAL_MS", "30000")
+
+# Background prober, targets are measured on their own interval and the callback reads the cache
+PROBE_INTERVAL_S = float(os.getenv("PROBE_INTERVAL_S", int(INTERVAL_MS) / 1000))
+# Stable links back off up to PROBE_MAX_INTERVAL_S, all targets share PROBE_BUDGET_PER_S (0 for no limit)
+PROBE_MAX_INTERVAL_S = float(os.getenv("PROBE_MAX_INTERVAL_S", 4 * PROBE_INTERVAL_S))
+PROBE_BUDGET_PER_S = float(os.getenv("PROBE_BUDGET_PER_S", "0"))
+PROBE_JITTER = float(os.getenv("PROBE_JITTER", "0.1"))
+PROBE_START_JITTER_S = float(os.getenv("PROBE_START_JITTER_S", PROBE_INTERVAL_S))
+PROBE_CHANGE_REL = float(os.getenv("PROBE_CHANGE_REL", "0.2"))
+PROBE_CHANGE_ABS_MS = float(os.getenv("PROBE_CHANGE_ABS_MS", "1"))
+MAX_RESULT_AGE_S = float(os.getenv("MAX_RESULT_AGE_S", PROBE_MAX_INTERVAL_S + 2 * PROBE_INTERVAL_S))
+# ?wait=true waits this long for the first probe of new clusters before flushing
+FIRST_PROBE_WAIT_S = float(os.getenv("FIRST_PROBE_WAIT_S", probe.PROBE_COUNT * probe.PROBE_TIMEOUT_S + 1))
+scheduler = ProbeScheduler(
+    PROBE_INTERVAL_S, max_interval_s=PROBE_MAX_INTERVAL_S, budget_per_s=PROBE_BUDGET_PER_S, jitter=PROBE_JITTER,
+    start_jitter_s=PROBE_START_JITTER_S, change_rel=PROBE_CHANGE_REL, change_abs_ms=PROBE_CHANGE_ABS_MS,
+)
+scheduler.start()
 
 # Callback to provide the current latency between nodes
 def get_current_latency(_: CallbackOptions):
-    for cluster_remote in cluster_list:
-        latency = ping_node(cluster_remote["node_ip"])
+    now = time.time()
+    for cluster_remote in shard.select(cluster_registry.snapshot(), cluster_registry.key):
+        result = scheduler.latest(cluster_remote["node_ip"])
+        # Skip targets never measured or whose last good measurement is too old
+        if result is None or result.age(now) > MAX_RESULT_AGE_S:
+            continue
         attributes = {"from_node": CLUSTER, "to_cluster": cluster_remote["cluster"], "from_node": SOURCE_IP, "to_node": cluster_remote["node_ip"]}
-        if latency is not None:
-            yield Observation(latency, attributes)
-
-# OpenTelemetry resource definition
-resource = Resource(attributes={
-    SERVICE_NAME: "cluster-monitor",
-    SERVICE_NAMESPACE: "fluidos",
-    SERVICE_VERSION: "1.0.0"
-})
-
-
-
-# Initialization for OpenTelemetry Metric Exporting
-metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=COLLECTOR_ENDPOINT, insecure=True), int(INTERVAL_MS))
-provider = MeterProvider(metric_readers=[metric_reader], resource=resource)
-metrics.set_meter_provider(provider)
-meter = metrics.get_meter("cluster-monitor", "1.0.0")
+        yield Observation(result.value, attributes)
+
+# Seconds since each target was last measured successfully, exported even once too old for node.fluidos.latency
+def get_measurement_age(_: CallbackOptions):
+    now = time.time()
+    for cluster_remote in shard.select(cluster_registry.snapshot(), cluster_registry.key):
+        result = scheduler.latest(cluster_remote["node_ip"])
+        if result is None:
+            continue
+        attributes = {"from_node": CLUSTER, "to_cluster": cluster_remote["cluster"], "from_node": SOURCE_IP, "to_node": cluster_remote["node_ip"]}
+        yield Observation(result.age(now), attributes)
+
+# Distribution of every attempt over the last SKETCH_WINDOW_S, read once per cycle for the five gauges
+def get_latency_summaries():
+    attributes, rows = [], []
+    now = time.time()
+    for cluster_remote in shard.select(cluster_registry.snapshot(), cluster_registry.key):
+        summary = scheduler.summary(cluster_remote["node_ip"], now)
+        if summary is None:
+            continue
+        attributes.append({"from_node": CLUSTER, "to_cluster": cluster_remote["cluster"], "from_node": SOURCE_IP, "to_node": cluster_remote["node_ip"]})
+        # Stats missing when every attempt was lost are NaN, which the snapshot leaves out
+        rows.append([summary.get(stat, math.nan) for stat in SUMMARY_STATS])
+    return attributes, rows
+
+# Exporter, reader and MeterProvider, shared with the other collectors when hosted by agent_runtime.py
+runtime = current() or install(AgentRuntime.from_env("fluidos_latency.prom", "latency"))
+metric_exporter, metric_reader, provider, flusher = runtime.exporter, runtime.reader, runtime.provider, runtime.flusher
+meter = runtime.meter("cluster-monitor", "1.0.0")
+# The agent's own metrics: probe durations per target and the number of registered clusters
+scheduler.on_probe = runtime.self_metrics.record_probe
+runtime.self_metrics.watch_registry("latency", cluster_registry)
 
 # Create an observable gauge for latency
 latency_gauge = meter.create_observable_gauge(
@@ -78,32 +107,118 @@ latency_gauge = meter.create_observable_gauge(
     callbacks=[get_current_latency],
 )
 
+latency_age_gauge = meter.create_observable_gauge(
+    name="node.fluidos.latency_age",
+    description="Seconds since the latency to the node was last measured",
+    unit="s",
+    callbacks=[get_measurement_age],
+)
+
+latency_summary = CycleSnapshot(get_latency_summaries, [f"node.fluidos.latency_{stat}" for stat in SUMMARY_STATS])
+latency_summary.create_gauges(meter, [
+    ("node.fluidos.latency_p50", "Median round trip time over the sketch window", "ms"),
+    ("node.fluidos.latency_p99", "99th percentile round trip time over the sketch window", "ms"),
+    ("node.fluidos.latency_max", "Highest round trip time over the sketch window", "ms"),
+    ("node.fluidos.latency_jitter", "Smoothed difference between consecutive round trip times (RFC 3550)", "ms"),
+    ("node.fluidos.latency_loss_ratio", "Share of probe attempts lost over the sketch window", "1"),
+])
+
+
 
+def _validate_cluster(new_cluster: Dict):
+    if not isinstance(new_cluster, dict) or not new_cluster.get('node_ip'):
+        raise HTTPException(status_code=400, detail="Bad Format")
 
 @app.post("/cluster/")
-def add_cluster(new_cluster: Dict):
-    for cluster_remote in cluster_list:
-        print(new_cluster)
-        if new_cluster['node_ip'] == cluster_remote['node_ip']:
-            raise HTTPException(status_code=400, detail="IP already exists in the list.")
-    cluster_list.append(new_cluster)
-    thread = threading.Thread(target=metric_reader.force_flush)
-    thread.start()
-    return {"message": f"IP {new_cluster['node_ip']} added to the ping list."}
+def add_cluster(new_cluster: Dict, wait: bool = False):
+    _validate_cluster(new_cluster)
+    if not cluster_registry.add(new_cluster):
+        raise HTTPException(status_code=400, detail="IP already exists in the list.")
+    if shard.owns(new_cluster['node_ip']):
+        scheduler.add_target(new_cluster['node_ip'], new_cluster.get('probe_interval_s'))
+    response = {"message": f"IP {new_cluster['node_ip']} added to the ping list."}
+    if wait:
+        scheduler.wait_probed([new_cluster['node_ip']], FIRST_PROBE_WAIT_S)
+    flushed = flusher.request(wait=wait)
+    if wait:
+        response["flushed"] = bool(flushed)
+    return response
+
+@app.post("/clusters/")
+def add_clusters(new_clusters: List[Dict], wait: bool = False):
+    for new_cluster in new_clusters:
+        _validate_cluster(new_cluster)
+    added = cluster_registry.add_many(new_clusters)
+    for new_cluster in added:
+        if shard.owns(new_cluster['node_ip']):
+            scheduler.add_target(new_cluster['node_ip'], new_cluster.get('probe_interval_s'))
+    response = {"added": len(added), "skipped": len(new_clusters) - len(added)}
+    if added:
+        if wait:
+            scheduler.wait_probed([new_cluster['node_ip'] for new_cluster in added], FIRST_PROBE_WAIT_S)
+        flushed = flusher.request(wait=wait)
+        if wait:
+            response["flushed"] = bool(flushed)
+    return response
 
 @app.get("/clusters/")
 def list_ips():
-    return cluster_list
+    return list(cluster_registry.snapshot())
 
 @app.delete("/cluster/")
 def remove_ip(ip: str):
-    for cluster_remote in cluster_list:
-        if cluster_remote['node_ip'] == ip:
-            cluster_list.remove(cluster_remote)
-        return {"message": f"IP {ip} removed from the ping list."}
-    else:
+    if cluster_registry.remove(ip) is None:
         raise HTTPException(status_code=404, detail="IP not found in the list.")
-
+    scheduler.remove_target(ip)
+    return {"message": f"IP {ip} removed from the ping list."}
+
+@app.delete("/clusters/")
+def remove_ips(ips: List[str]):
+    removed = cluster_registry.remove_many(ips)
+    for cluster_remote in removed:
+        scheduler.remove_target(cluster_remote['node_ip'])
+    return {"removed": len(removed), "not_found": len(ips) - len(removed)}
+
+@app.get("/shard/")
+def get_shard():
+    owned = shard.select(cluster_registry.snapshot(), cluster_registry.key)
+    return {"self": shard.self_id, "members": list(shard.members), "owned": len(owned), "total": len(cluster_registry)}
+
+@app.put("/shard/")
+def set_shard_members(members: List[str]):
+    try:
+        shard.set_members(members)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Start probing clusters this replica gained and stop the ones it lost
+    for cluster_remote in cluster_registry.snapshot():
+        ip = cluster_remote['node_ip']
+        if shard.owns(ip) and ip not in scheduler:
+            scheduler.add_target(ip, cluster_remote.get('probe_interval_s'))
+        elif not shard.owns(ip) and ip in scheduler:
+            scheduler.remove_target(ip)
+    return get_shard()
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+def get_profile(seconds: float = 5, interval_ms: float = 10):
+    # Stacks of every thread sampled while the request lasts, in collapsed (flamegraph) format
+    if not 0 < seconds <= 60 or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 60] and interval_ms at least 1")
+    try:
+        return format_collapsed(profiler.sample(seconds, interval_ms / 1000))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/metrics")
+def get_metrics(request: Request):
+    # Exposition rendered at the last collection, scrapes never run the callbacks
+    if runtime.exposition is None:
+        raise HTTPException(status_code=404, detail="Pull mode is off, set EXPORT_MODE=pull or PULL_METRICS=true")
+    body, encoding = runtime.exposition.body(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=CONTENT_TYPE, headers=headers)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import os
+import socket
+import struct
+import time
+
+# Probe configuration
+PROBE_METHOD = os.getenv("PROBE_METHOD", "auto")  # auto, icmp or tcp
+PROBE_COUNT = int(os.getenv("PROBE_COUNT", "4"))
+PROBE_TIMEOUT_S = float(os.getenv("PROBE_TIMEOUT_S", "1.0"))
+PROBE_TCP_PORT = int(os.getenv("PROBE_TCP_PORT", "22"))
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "256"))
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+@functools.lru_cache(maxsize=None)
+def icmp_available():
+    """Unprivileged ICMP needs the gid to be inside net.ipv4.ping_group_range.
+
+    Checked once per process, "auto" probes would otherwise open a socket each time.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return False
+    sock.close()
+    return True
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(seq):
+    payload = struct.pack("!d", time.perf_counter())
+    # The kernel rewrites the identifier with the socket's port for ping sockets
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, 0, seq) + payload
+
+
+async def _icmp_rtt(loop, node_ip, seq, timeout):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, (node_ip, 0))
+        start = time.perf_counter()
+        await loop.sock_sendall(sock, _echo_request(seq))
+        deadline = start + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            packet = await asyncio.wait_for(loop.sock_recv(sock, 1024), remaining)
+            # Ping sockets deliver the ICMP message without the IP header
+            icmp_type, _, _, _, reply_seq = struct.unpack("!BBHHH", packet[:8])
+            if icmp_type == ICMP_ECHO_REPLY and reply_seq == seq:
+                return (time.perf_counter() - start) * 1000
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        sock.close()
+
+
+async def _tcp_rtt(node_ip, port, timeout):
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(node_ip, port), timeout)
+    except ConnectionRefusedError:
+        # A RST still completes a full round trip to the host
+        return (time.perf_counter() - start) * 1000
+    except (asyncio.TimeoutError, OSError):
+        return None
+    rtt = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), timeout)
+    except (asyncio.TimeoutError, OSError):
+        pass  # the measurement is taken, only the transport's cleanup failed
+    return rtt
+
+
+async def probe_samples(node_ip, method=None, count=None, timeout=None, port=None):
+    """Return the round trip time in ms of each of `count` attempts, None for the ones lost."""
+    method = method or PROBE_METHOD
+    count = count or PROBE_COUNT
+    timeout = timeout or PROBE_TIMEOUT_S
+    port = port or PROBE_TCP_PORT
+    if method == "auto":
+        method = "icmp" if icmp_available() else "tcp"
+
+    loop = asyncio.get_running_loop()
+    samples = []
+    for seq in range(count):
+        if method == "icmp":
+            samples.append(await _icmp_rtt(loop, node_ip, seq, timeout))
+        else:
+            samples.append(await _tcp_rtt(node_ip, port, timeout))
+    return samples
+
+
+def mean_rtt(samples):
+    received = [rtt for rtt in samples if rtt is not None]
+    return sum(received) / len(received) if received else None
+
+
+async def probe(node_ip, method=None, count=None, timeout=None, port=None):
+    """Return the average round trip time to node_ip in ms, or None if every attempt failed."""
+    return mean_rtt(await probe_samples(node_ip, method, count, timeout, port))
+
+
+async def probe_all(node_ips, concurrency=None, **kwargs):
+    """Probe every target at the same time, at most `concurrency` in flight.
+
+    The cycle takes as long as the slowest target rather than the sum of all of them.
+    """
+    semaphore = asyncio.Semaphore(concurrency or PROBE_CONCURRENCY)
+    if kwargs.get("method", PROBE_METHOD) == "auto":
+        kwargs["method"] = "icmp" if icmp_available() else "tcp"
+
+    async def bounded(node_ip):
+        async with semaphore:
+            return await probe(node_ip, **kwargs)
+
+    results = await asyncio.gather(*(bounded(ip) for ip in node_ips))
+    return dict(zip(node_ips, results))
+
+
+def probe_targets(node_ips, **kwargs):
+    """Synchronous entry point for code running outside an event loop."""
+    if not node_ips:
+        return {}
+    return asyncio.run(probe_all(list(node_ips), **kwargs))
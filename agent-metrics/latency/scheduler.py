@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import probe
+from sketch import LatencySketch
+
+
+class ProbeResult(NamedTuple):
+    value: Optional[float]  # last successful latency in ms
+    timestamp: float  # time.time() of the last successful probe
+    last_attempt: float  # time.time() of the last probe, successful or not
+
+    def age(self, now=None):
+        return (now or time.time()) - self.timestamp
+
+
+class ProbeScheduler:
+    """Probes targets in a background thread and keeps the latest result per target.
+
+    Collection callbacks only read the cache, so an export never waits on the network
+    and two collections can never probe the same target twice at once. Every attempt
+    also goes into the target's fixed-size LatencySketch, read with summary().
+    `probe_fn` returns either one latency or a list of attempts (None when lost).
+
+    Targets without an interval of their own adapt: each result within change_rel (or
+    change_abs_ms) of the previous one doubles the interval up to max_interval_s, while a
+    change, a lost attempt or a failure brings it back to default_interval_s. With
+    budget_per_s set, at most that many probes start per second and the targets that are
+    the most intervals overdue go first. Intervals are stretched by a random factor within
+    +-jitter and the first probes of the targets added before start() are spread over
+    start_jitter_s, so agents do not fall in step; targets added later are probed right away.
+    `on_probe(node_ip, duration_s, ok)` is called after every probe when set.
+    """
+
+    def __init__(self, default_interval_s, concurrency=None, probe_fn=None, tick_s=0.1, max_interval_s=None,
+                 budget_per_s=None, jitter=0.0, start_jitter_s=0.0, change_rel=0.2, change_abs_ms=1.0, on_probe=None):
+        self.default_interval_s = default_interval_s
+        self.concurrency = concurrency or probe.PROBE_CONCURRENCY
+        self.probe_fn = probe_fn or probe.probe_samples
+        self.tick_s = tick_s
+        self.max_interval_s = max(max_interval_s or default_interval_s, default_interval_s)
+        self.budget_per_s = budget_per_s
+        self.jitter = jitter
+        self.start_jitter_s = start_jitter_s
+        self.change_rel = change_rel
+        self.change_abs_ms = change_abs_ms
+        self.on_probe = on_probe
+        self.probes = 0
+        self._targets = {}  # node_ip -> fixed interval in seconds, None to adapt
+        self._intervals = {}  # node_ip -> current interval in seconds
+        self._next_due = {}
+        self._results = {}
+        self._sketches = {}
+        self._probed = set()  # targets probed at least once
+        self._lock = threading.Lock()
+        self._probed_cond = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __contains__(self, node_ip):
+        return node_ip in self._targets
+
+    def add_target(self, node_ip, interval_s=None):
+        with self._lock:
+            self._targets[node_ip] = interval_s
+            self._intervals[node_ip] = interval_s or self.default_interval_s
+            # Only spread the targets known at startup, one registered at runtime is wanted now
+            start_jitter_s = self.start_jitter_s if self._thread is None else 0.0
+            self._next_due[node_ip] = time.monotonic() + random.uniform(0, start_jitter_s)
+            self._sketches.setdefault(node_ip, LatencySketch())
+
+    def remove_target(self, node_ip):
+        with self._lock:
+            self._targets.pop(node_ip, None)
+            self._intervals.pop(node_ip, None)
+            self._next_due.pop(node_ip, None)
+            self._results.pop(node_ip, None)
+            self._sketches.pop(node_ip, None)
+            self._probed.discard(node_ip)
+
+    def wait_probed(self, node_ips, timeout_s):
+        """Block until every target in node_ips was probed at least once (or removed); False on timeout."""
+        with self._probed_cond:
+            return self._probed_cond.wait_for(
+                lambda: all(ip in self._probed or ip not in self._targets for ip in node_ips), timeout_s)
+
+    def latest(self, node_ip):
+        return self._results.get(node_ip)
+
+    def interval(self, node_ip):
+        """Seconds until the target's next probe after the last one finished, None for unknown targets."""
+        return self._intervals.get(node_ip)
+
+    def summary(self, node_ip, now=None):
+        """p50/p99/max/jitter/loss_ratio of the target over the sketch window, or None."""
+        with self._lock:
+            sketch = self._sketches.get(node_ip)
+            return sketch.summary(now) if sketch is not None else None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=asyncio.run, args=(self._run(),), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _probe_one(self, semaphore, node_ip):
+        try:
+            async with semaphore:
+                start = time.perf_counter()
+                samples = await self.probe_fn(node_ip)
+        except Exception as e:
+            logging.warning(f"Probe of {node_ip} failed: {e}")
+            samples = None
+        if not isinstance(samples, list):
+            samples = [samples]
+        value = probe.mean_rtt(samples)
+        if self.on_probe is not None:
+            self.on_probe(node_ip, time.perf_counter() - start, value is not None)
+        now = time.time()
+        with self._lock:
+            if node_ip not in self._targets:
+                return
+            self._sketches[node_ip].record(samples, now)
+            self._probed.add(node_ip)
+            self._probed_cond.notify_all()
+            previous = self._results.get(node_ip)
+            if value is not None:
+                self._results[node_ip] = ProbeResult(value, now, now)
+            elif previous is not None:
+                self._results[node_ip] = previous._replace(last_attempt=now)
+            interval = self._targets[node_ip]
+            if interval is None:
+                stable = previous is not None and value is not None and None not in samples and (
+                    abs(value - previous.value) <= max(self.change_abs_ms, self.change_rel * previous.value))
+                interval = min(2 * self._intervals[node_ip], self.max_interval_s) if stable else self.default_interval_s
+            self._intervals[node_ip] = interval
+            self._next_due[node_ip] = time.monotonic() + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = {}
+        burst = max(self.budget_per_s or 0, 1.0)
+        tokens, last = burst, time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [ip for ip, next_due in self._next_due.items() if next_due <= now and ip not in in_flight]
+                if self.budget_per_s:
+                    tokens = min(tokens + (now - last) * self.budget_per_s, burst)
+                    # Most intervals overdue first, so volatile targets stay ahead without starving the others
+                    due.sort(key=lambda ip: (self._next_due[ip] - now) / self._intervals[ip])
+                    due = due[:int(tokens)]
+                    tokens -= len(due)
+                last = now
+                for ip in due:
+                    self._next_due[ip] = math.inf  # rescheduled when the probe finishes
+                self.probes += len(due)
+            for ip in due:
+                task = asyncio.create_task(self._probe_one(semaphore, ip))
+                in_flight[ip] = task
+                task.add_done_callback(lambda _, ip=ip: in_flight.pop(ip, None))
+            await asyncio.sleep(self.tick_s)
+        for task in list(in_flight.values()):
+            task.cancel()
@@ -0,0 +1,95 @@
+import math
+import os
+import time
+
+import numpy as np
+
+# Latency distribution per target over a sliding window
+SKETCH_WINDOW_S = float(os.getenv("SKETCH_WINDOW_S", "300"))
+SKETCH_SLOTS = int(os.getenv("SKETCH_SLOTS", "5"))
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.02"))
+
+SUMMARY_STATS = ("p50", "p99", "max", "jitter", "loss_ratio")
+
+
+class LatencySketch:
+    """Fixed-size latency histogram of one target over a sliding window.
+
+    Samples go into logarithmic buckets (as in DDSketch), so any quantile is known to
+    within relative_accuracy, between min_ms and max_ms, whatever the number of samples.
+    The window is split into `slots` sub-windows that are reset as they expire, and
+    summary() merges them with one array sum. Jitter is the RFC 3550 smoothed difference
+    between consecutive successful samples; failed attempts (None) count as lost.
+    """
+
+    def __init__(self, window_s=None, slots=None, relative_accuracy=None, min_ms=0.01, max_ms=60_000.0):
+        self.slots = slots or SKETCH_SLOTS
+        self.slot_s = (window_s or SKETCH_WINDOW_S) / self.slots
+        accuracy = relative_accuracy or SKETCH_RELATIVE_ACCURACY
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_ms = min_ms
+        self._offset = math.floor(math.log(min_ms) / self._log_gamma)
+        buckets = math.ceil(math.log(max_ms) / self._log_gamma) - self._offset + 1
+        self._counts = np.zeros((self.slots, buckets), dtype=np.uint32)
+        self._max = np.zeros(self.slots)
+        self._sent = np.zeros(self.slots, dtype=np.int64)
+        self._lost = np.zeros(self.slots, dtype=np.int64)
+        self._epochs = np.full(self.slots, -1, dtype=np.int64)  # which sub-window each slot holds
+        self.jitter = 0.0
+        self._previous = None
+
+    @property
+    def nbytes(self):
+        return self._counts.nbytes + self._max.nbytes + self._sent.nbytes + self._lost.nbytes + self._epochs.nbytes
+
+    def _slot(self, now):
+        epoch = int(now // self.slot_s)
+        slot = epoch % self.slots
+        if self._epochs[slot] != epoch:
+            self._counts[slot] = 0
+            self._max[slot] = 0
+            self._sent[slot] = self._lost[slot] = 0
+            self._epochs[slot] = epoch
+        return slot
+
+    def _bucket(self, value):
+        index = math.ceil(math.log(max(value, self.min_ms)) / self._log_gamma) - self._offset
+        return min(index, self._counts.shape[1] - 1)
+
+    def record(self, samples, now=None):
+        slot = self._slot(now or time.time())
+        for value in samples:
+            self._sent[slot] += 1
+            if value is None:
+                self._lost[slot] += 1
+                continue
+            self._counts[slot, self._bucket(value)] += 1
+            self._max[slot] = max(self._max[slot], value)
+            if self._previous is not None:
+                self.jitter += (abs(value - self._previous) - self.jitter) / 16
+            self._previous = value
+
+    def summary(self, now=None):
+        """{p50, p99, max, jitter, loss_ratio} over the window, or None when nothing was probed in it.
+
+        When every attempt in the window was lost only loss_ratio is known and returned.
+        """
+        live = self._epochs > int((now or time.time()) // self.slot_s) - self.slots
+        sent = int(self._sent[live].sum())
+        if not sent:
+            return None
+        counts = self._counts[live].sum(axis=0)
+        total = int(counts.sum())
+        stats = {"loss_ratio": float(self._lost[live].sum()) / sent}
+        if not total:
+            return stats
+        stats["jitter"] = self.jitter
+        stats["max"] = float(self._max[live].max())
+        cumulative = np.cumsum(counts)
+        for name, q in (("p50", 0.5), ("p99", 0.99)):
+            # Nearest rank, so p99 of a few samples is their maximum rather than an interpolation
+            index = int(np.searchsorted(cumulative, math.ceil(q * total)))
+            # Middle of the bucket, within relative_accuracy of every value in it but possibly above the max
+            stats[name] = min(2 * self.gamma ** (index + self._offset) / (self.gamma + 1), stats["max"])
+        return stats
@@ -34,6 +34,19 @@ def test_list_clusters_after_delete():
         for cluster in clusters
     ), "Deleted cluster still found in the list"
 
+def test_add_clusters_bulk():
+    clusters = [{"domain": "UMU", "cluster": "UMU", "node_ip": f"10.208.100.{i}"} for i in range(200)]
+    response = requests.post(f"{BASE_URL}/clusters/", json=clusters)
+    assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+    assert response.json()["added"] + response.json()["skipped"] == 200
+
+def test_delete_clusters_bulk():
+    ips = [f"10.208.100.{i}" for i in range(200)]
+    response = requests.delete(f"{BASE_URL}/clusters/", json=ips)
+    assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+    response = requests.get(f"{BASE_URL}/clusters/")
+    assert not any(cluster["node_ip"] in ips for cluster in response.json()), "Bulk deleted cluster still found in the list"
+
 if __name__ == "__main__":
     # Run the tests
     test_add_cluster_2()
@@ -0,0 +1,83 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+import probe
+
+
+def _listening_socket():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(64)
+    return server
+
+
+def test_tcp_probe_open_port():
+    server = _listening_socket()
+    try:
+        port = server.getsockname()[1]
+        latency = asyncio.run(probe.probe("127.0.0.1", method="tcp", count=2, timeout=1, port=port))
+        assert latency is not None and latency >= 0
+    finally:
+        server.close()
+
+
+def test_tcp_probe_refused_port_still_measures():
+    server = _listening_socket()
+    port = server.getsockname()[1]
+    server.close()
+    latency = asyncio.run(probe.probe("127.0.0.1", method="tcp", count=1, timeout=1, port=port))
+    assert latency is not None
+
+
+def test_icmp_probe_loopback():
+    if not probe.icmp_available():
+        pytest.skip("ICMP sockets not permitted")
+    latency = asyncio.run(probe.probe("127.0.0.1", method="icmp", count=2, timeout=1))
+    assert latency is not None
+
+
+def test_probe_all_is_bounded_by_slowest_target(monkeypatch):
+    async def slow_probe(node_ip, **kwargs):
+        await asyncio.sleep(0.2)
+        return 1.0
+
+    monkeypatch.setattr(probe, "probe", slow_probe)
+    targets = [f"10.0.0.{i}" for i in range(50)]
+    start = time.perf_counter()
+    results = probe.probe_targets(targets, concurrency=50, method="tcp")
+    elapsed = time.perf_counter() - start
+    assert len(results) == 50
+    assert elapsed < 1.0
+
+
+def test_probe_all_respects_concurrency(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def counting_probe(node_ip, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return 1.0
+
+    monkeypatch.setattr(probe, "probe", counting_probe)
+    probe.probe_targets([f"10.0.0.{i}" for i in range(40)], concurrency=5, method="tcp")
+    assert peak == 5
+
+
+def test_icmp_availability_is_checked_once(monkeypatch):
+    opened = []
+    real_socket = socket.socket
+    probe.icmp_available.cache_clear()
+    monkeypatch.setattr(probe.socket, "socket", lambda *args: opened.append(args) or real_socket())
+    try:
+        for _ in range(3):
+            probe.icmp_available()
+        assert len(opened) == 1
+    finally:
+        probe.icmp_available.cache_clear()
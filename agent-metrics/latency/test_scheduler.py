@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+from scheduler import ProbeScheduler
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_scheduler_fills_cache_in_background():
+    async def fake_probe(node_ip):
+        return 12.5
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=fake_probe, tick_s=0.01)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1") is not None)
+        result = scheduler.latest("10.0.0.1")
+        assert result.value == 12.5
+        assert result.age() < 1
+    finally:
+        scheduler.stop()
+
+
+def test_each_target_has_its_own_interval():
+    calls = {"fast": 0, "slow": 0}
+
+    async def counting_probe(node_ip):
+        calls[node_ip] += 1
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=counting_probe, tick_s=0.01)
+    scheduler.add_target("fast", interval_s=0.05)
+    scheduler.add_target("slow")
+    scheduler.start()
+    try:
+        time.sleep(0.5)
+    finally:
+        scheduler.stop()
+    assert calls["slow"] == 1
+    assert calls["fast"] >= 4
+
+
+def test_failed_probe_keeps_last_value_and_ages():
+    values = iter([5.0, None, None, None])
+
+    async def flaky_probe(node_ip):
+        return next(values, None)
+
+    scheduler = ProbeScheduler(default_interval_s=0.05, probe_fn=flaky_probe, tick_s=0.01)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1") is not None)
+        time.sleep(0.3)
+        result = scheduler.latest("10.0.0.1")
+    finally:
+        scheduler.stop()
+    assert result.value == 5.0
+    assert result.last_attempt > result.timestamp
+    assert result.age() >= 0.2
+
+
+def test_slow_probe_is_not_started_twice():
+    started = []
+
+    async def slow_probe(node_ip):
+        started.append(node_ip)
+        await asyncio.sleep(0.3)
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=0.01, probe_fn=slow_probe, tick_s=0.01)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        time.sleep(0.2)
+    finally:
+        scheduler.stop()
+    assert started == ["10.0.0.1"]
+
+
+def test_removed_target_is_dropped_from_cache():
+    async def fake_probe(node_ip):
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=fake_probe, tick_s=0.01)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1") is not None)
+        scheduler.remove_target("10.0.0.1")
+        assert scheduler.latest("10.0.0.1") is None
+    finally:
+        scheduler.stop()
+
+
+def test_every_attempt_goes_into_the_sketch():
+    async def lossy_probe(node_ip):
+        return [10.0, None, 30.0, 20.0]
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=lossy_probe, tick_s=0.01)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1") is not None)
+    finally:
+        scheduler.stop()
+    assert scheduler.latest("10.0.0.1").value == 20.0
+    summary = scheduler.summary("10.0.0.1")
+    assert summary["loss_ratio"] == 0.25
+    assert abs(summary["max"] - 30.0) < 1e-9 and abs(summary["p50"] / 20.0 - 1) < 0.02
+    assert scheduler.summary("unknown") is None
+
+
+def test_stable_target_backs_off_and_snaps_back_on_change():
+    values = {"10.0.0.1": 10.0}
+
+    async def probe_fn(node_ip):
+        return values[node_ip]
+
+    scheduler = ProbeScheduler(default_interval_s=0.02, probe_fn=probe_fn, tick_s=0.005, max_interval_s=0.16)
+    scheduler.add_target("10.0.0.1")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.interval("10.0.0.1") == 0.16)
+        values["10.0.0.1"] = 30.0
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1").value == 30.0)
+        assert scheduler.interval("10.0.0.1") == 0.02
+        values["10.0.0.1"] = None
+        assert _wait_for(lambda: scheduler.latest("10.0.0.1").last_attempt > scheduler.latest("10.0.0.1").timestamp)
+        assert scheduler.interval("10.0.0.1") == 0.02
+    finally:
+        scheduler.stop()
+
+
+def test_budget_caps_probe_rate_and_serves_every_target():
+    probed = set()
+
+    async def probe_fn(node_ip):
+        probed.add(node_ip)
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=0.01, probe_fn=probe_fn, tick_s=0.01, budget_per_s=50)
+    for i in range(20):
+        scheduler.add_target(f"10.0.0.{i}")
+    scheduler.start()
+    try:
+        time.sleep(1.0)
+    finally:
+        scheduler.stop()
+    # One second of budget plus the initial burst, where unlimited would be about 100 probes per target
+    assert scheduler.probes <= 2 * 50 + 1
+    assert len(probed) == 20
+
+
+def test_first_probes_are_spread_over_start_jitter():
+    started = []
+
+    async def probe_fn(node_ip):
+        started.append(time.monotonic())
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=probe_fn, tick_s=0.005, start_jitter_s=0.4)
+    for i in range(20):
+        scheduler.add_target(f"10.0.0.{i}")
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: len(started) == 20)
+    finally:
+        scheduler.stop()
+    assert max(started) - min(started) > 0.1
+
+
+def test_targets_added_after_start_are_probed_right_away():
+    async def probe_fn(node_ip):
+        return 1.0
+
+    scheduler = ProbeScheduler(default_interval_s=60, probe_fn=probe_fn, tick_s=0.005, start_jitter_s=60)
+    scheduler.start()
+    try:
+        scheduler.add_target("10.0.0.1")
+        assert scheduler.wait_probed(["10.0.0.1"], 2)
+        assert scheduler.latest("10.0.0.1").value == 1.0
+    finally:
+        scheduler.stop()
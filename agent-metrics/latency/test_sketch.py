@@ -0,0 +1,43 @@
+import numpy as np
+
+from sketch import LatencySketch
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(mean=2.0, sigma=0.8, size=20000)
+    sketch = LatencySketch(window_s=300, slots=5, relative_accuracy=0.02)
+    for chunk in np.array_split(samples, 200):
+        sketch.record(chunk.tolist(), now=1000)
+    summary = sketch.summary(now=1000)
+    for name, q in (("p50", 50), ("p99", 99)):
+        assert abs(summary[name] / np.percentile(samples, q) - 1) < 0.03
+    assert summary["max"] == samples.max()
+    assert summary["loss_ratio"] == 0
+
+
+def test_memory_does_not_grow_with_samples():
+    sketch = LatencySketch()
+    size = sketch.nbytes
+    sketch.record([5.0] * 100000, now=1000)
+    assert sketch.nbytes == size < 16 * 1024
+
+
+def test_loss_jitter_and_window():
+    sketch = LatencySketch(window_s=100, slots=5)
+    sketch.record([10.0, None, 12.0, None], now=1000)
+    summary = sketch.summary(now=1000)
+    assert summary["loss_ratio"] == 0.5
+    assert summary["jitter"] == 2.0 / 16
+    # Only lost attempts in the window: nothing but the loss ratio is known
+    sketch.record([None], now=1090)
+    assert sketch.summary(now=1090)["loss_ratio"] == 0.6
+    assert sketch.summary(now=1110) == {"loss_ratio": 1.0}
+    assert sketch.summary(now=1300) is None
+
+
+def test_quantiles_never_exceed_max():
+    sketch = LatencySketch()
+    sketch.record([0.626], now=1000)
+    summary = sketch.summary(now=1000)
+    assert summary["p50"] <= summary["max"] and summary["p99"] <= summary["max"] == 0.626
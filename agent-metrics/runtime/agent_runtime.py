@@ -0,0 +1,55 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from dotenv import load_dotenv
+import os
+import sys
+import logging
+
+# Shared agent modules live next to this directory
+AGENT_METRICS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(AGENT_METRICS)
+from common.pull import CONTENT_TYPE
+from common.runtime import AgentRuntime, install, load_plugins
+
+
+load_dotenv()
+
+# Initialize logger
+logging.basicConfig(level=logging.INFO)
+
+# Collectors this process hosts, only their modules (and dependencies) are imported
+COLLECTORS = [name.strip() for name in os.getenv("COLLECTORS", "latency,carbon").split(",") if name.strip()]
+PLUGINS = {
+    "latency": (os.path.join(AGENT_METRICS, "latency"), "metric_latency"),
+    "carbon": (os.path.join(AGENT_METRICS, "carbon"), "metrics_carbon"),
+    "battery": (os.path.join(AGENT_METRICS, "..", "simulated_data"), "energy_data"),
+}
+
+# One exporter, reader and MeterProvider for every collector, installed before they are imported
+runtime = install(AgentRuntime.from_env("fluidos_agent.prom", "runtime"))
+collectors = load_plugins(COLLECTORS, PLUGINS)
+
+# Each collector's own API is served under /<name>/, e.g. POST /latency/cluster/
+app = FastAPI()
+for name, module in collectors.items():
+    if hasattr(module, "app"):
+        app.mount(f"/{name}", module.app)
+
+@app.get("/collectors/")
+def list_collectors():
+    return {name: {"api": f"/{name}/" if hasattr(module, "app") else None} for name, module in collectors.items()}
+
+@app.get("/metrics")
+def get_metrics(request: Request):
+    # Every collector's metrics, rendered once per collection
+    if runtime.exposition is None:
+        raise HTTPException(status_code=404, detail="Pull mode is off, set EXPORT_MODE=pull or PULL_METRICS=true")
+    body, encoding = runtime.exposition.body(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=CONTENT_TYPE, headers=headers)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8003)
@@ -1,4 +1,19 @@
-from prometheus_api_client import PrometheusConnect
-prom = PrometheusConnect(url ="http://127.0.0.1:46405/", disable_ssl=True)
+import os
+import sys
+import time
 
-print(prom.custom_query(query="sum (rate (container_cpu_usage_seconds_total[2m])) / avg (machine_cpu_cores) * 100"))
\ No newline at end of file
+import numpy as np
+
+# The query client is shared with the agents
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-metrics"))
+from common.promquery import PrometheusQueryClient
+
+prom = PrometheusQueryClient(url="http://127.0.0.1:46405/")
+query = "sum (rate (container_cpu_usage_seconds_total[2m])) / avg (machine_cpu_cores) * 100"
+
+print(prom.query(query))
+
+# Last week of CPU utilisation at 30s resolution, fetched in parallel chunks
+end = time.time()
+result = prom.query_range(query, start=end - 7 * 24 * 3600, end=end, step=30)
+print(f"{len(result.timestamps)} points, mean {np.nanmean(result.values):.2f}%, max {np.nanmax(result.values):.2f}%")
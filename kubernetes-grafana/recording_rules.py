@@ -0,0 +1,471 @@
+"""Recording-rule generator for the Grafana dashboard.
+
+Parses every panel query of a dashboard, finds the aggregations Prometheus recomputes
+from raw cAdvisor, node-exporter and kube-state-metrics series on each refresh (range
+functions such as rate(), regex matchers, or the same aggregation in several panels),
+and turns each into a recording rule. Dashboard variables cannot appear in a rule, so
+their label matchers move to the dashboard side: the rule keeps those labels in its
+`by` clause and the panel re-aggregates the stored series with the variable's matcher.
+
+    python kubernetes-grafana/recording_rules.py                    # write rules and dashboard
+    python kubernetes-grafana/recording_rules.py --dry-run          # only print the rules
+
+The rules replace the "grafana recording rules" group in the prometheus.rules section of
+kubernetes-prometheus/config-map.yaml, the rewritten dashboard goes to grafana-recorded.json.
+"""
+import argparse
+import copy
+import json
+import os
+import re
+from typing import NamedTuple, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(ROOT, "kubernetes-grafana", "grafana.json")
+DASHBOARD_OUT = os.path.join(ROOT, "kubernetes-grafana", "grafana-recorded.json")
+PROMETHEUS_CONFIG_MAP = os.path.join(ROOT, "kubernetes-prometheus", "config-map.yaml")
+GROUP_NAME = "grafana recording rules"
+
+AGGREGATIONS = {"sum", "min", "max", "avg", "count", "stddev", "stdvar", "group", "topk", "bottomk", "quantile", "count_values"}
+# Aggregations whose results can be aggregated again with the given operator
+REAGGREGATE = {"sum": "sum", "min": "min", "max": "max", "count": "sum", "group": "group"}
+RANGE_FUNCTIONS = {"rate", "irate", "increase", "delta", "idelta", "deriv", "changes", "resets"}
+BINARY_PRECEDENCE = [("or",), ("and", "unless"), ("==", "!=", "<=", "<", ">=", ">"), ("+", "-"), ("*", "/", "%", "atan2"), ("^",)]
+_VARIABLE = re.compile(r"\$(\w+|\{[^}]+\})")
+_TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<duration>\[[^\]]*\])
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)
+    | (?P<op>=~|!~|==|!=|<=|>=|[-+*/%^<>=(){},])
+    )""", re.VERBOSE)
+
+
+class PromQLError(ValueError):
+    pass
+
+
+# PromQL syntax tree, just enough of the language for dashboard queries
+
+class Number(NamedTuple):
+    text: str
+
+
+class Selector(NamedTuple):
+    name: str
+    matchers: Tuple[Tuple[str, str, str], ...]  # (label, operator, value)
+    range: Optional[str] = None  # "1m" for a range vector
+
+
+class Call(NamedTuple):
+    func: str
+    args: tuple
+
+
+class Aggregation(NamedTuple):
+    op: str
+    expr: object
+    grouping: Tuple[str, ...] = ()
+    without: bool = False
+    param: object = None
+
+
+class Binary(NamedTuple):
+    op: str
+    lhs: object
+    rhs: object
+    modifier: str = ""  # e.g. "bool" or "on (node)"
+
+
+class Unary(NamedTuple):
+    op: str
+    expr: object
+
+
+class Paren(NamedTuple):
+    expr: object
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise PromQLError(f"Unexpected {text[position:position + 20]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _unquote(token):
+    return re.sub(r"\\(.)", r"\1", token[1:-1])
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        kind, token = self.next()
+        if token != value:
+            raise PromQLError(f"Expected {value!r}, got {token!r}")
+
+    def parse(self):
+        expr = self.binary(0)
+        if self.peek()[0] is not None:
+            raise PromQLError(f"Unexpected {self.peek()[1]!r}")
+        return expr
+
+    def binary(self, level):
+        if level == len(BINARY_PRECEDENCE):
+            return self.unary()
+        lhs = self.binary(level + 1)
+        while self.peek()[1] in BINARY_PRECEDENCE[level]:
+            op = self.next()[1]
+            modifier = self.modifier()
+            # ^ is right associative
+            rhs = self.binary(level) if op == "^" else self.binary(level + 1)
+            lhs = Binary(op, lhs, rhs, modifier)
+        return lhs
+
+    def modifier(self):
+        words = []
+        while self.peek()[1] in ("bool", "on", "ignoring", "group_left", "group_right"):
+            word = self.next()[1]
+            if self.peek()[1] == "(":
+                word += " (" + ", ".join(self.labels()) + ")"
+            words.append(word)
+        return " ".join(words)
+
+    def unary(self):
+        if self.peek()[1] in ("-", "+"):
+            return Unary(self.next()[1], self.unary())
+        return self.primary()
+
+    def labels(self):
+        self.expect("(")
+        labels = []
+        while self.peek()[1] != ")":
+            kind, label = self.next()
+            if kind != "name":
+                raise PromQLError(f"Expected a label name, got {label!r}")
+            labels.append(label)
+            if self.peek()[1] == ",":
+                self.next()
+        self.expect(")")
+        return tuple(labels)
+
+    def primary(self):
+        kind, token = self.next()
+        if kind == "number":
+            return Number(token)
+        if token == "(":
+            expr = self.binary(0)
+            self.expect(")")
+            return self.range_suffix(Paren(expr))
+        if token == "{":
+            return self.range_suffix(Selector("", self.matchers()))
+        if kind != "name":
+            raise PromQLError(f"Unexpected {token!r}")
+        if token in AGGREGATIONS and self.peek()[1] in ("(", "by", "without"):
+            return self.aggregation(token)
+        if self.peek()[1] == "(":
+            self.next()
+            args = []
+            while self.peek()[1] != ")":
+                args.append(self.binary(0))
+                if self.peek()[1] == ",":
+                    self.next()
+            self.expect(")")
+            return Call(token, tuple(args))
+        matchers = ()
+        if self.peek()[1] == "{":
+            self.next()
+            matchers = self.matchers()
+        return self.range_suffix(Selector(token, matchers))
+
+    def range_suffix(self, expr):
+        if self.peek()[0] == "duration":
+            if not isinstance(expr, Selector):
+                raise PromQLError("Subqueries are not supported")
+            expr = expr._replace(range=self.next()[1][1:-1].strip())
+        return expr
+
+    def matchers(self):
+        matchers = []
+        while self.peek()[1] != "}":
+            label = self.next()[1]
+            op = self.next()[1]
+            kind, value = self.next()
+            if op not in ("=", "!=", "=~", "!~") or kind != "string":
+                raise PromQLError(f"Bad label matcher {label}{op}{value}")
+            matchers.append((label, op, _unquote(value)))
+            if self.peek()[1] == ",":
+                self.next()
+        self.expect("}")
+        return tuple(matchers)
+
+    def aggregation(self, op):
+        grouping, without = (), False
+        if self.peek()[1] in ("by", "without"):
+            without = self.next()[1] == "without"
+            grouping = self.labels()
+        self.expect("(")
+        param = None
+        expr = self.binary(0)
+        if self.peek()[1] == ",":
+            self.next()
+            param, expr = expr, self.binary(0)
+        self.expect(")")
+        if self.peek()[1] in ("by", "without"):
+            without = self.next()[1] == "without"
+            grouping = self.labels()
+        return Aggregation(op, expr, grouping, without, param)
+
+
+def parse(text):
+    return _Parser(text).parse()
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def format_expr(expr):
+    """Canonical PromQL text, equal for equivalent spellings of the same expression."""
+    if isinstance(expr, Number):
+        return expr.text
+    if isinstance(expr, Selector):
+        matchers = ",".join(f"{label}{op}{_quote(value)}" for label, op, value in expr.matchers)
+        text = expr.name + ("{" + matchers + "}" if matchers or not expr.name else "")
+        return text + (f"[{expr.range}]" if expr.range else "")
+    if isinstance(expr, Call):
+        return f"{expr.func}(" + ", ".join(format_expr(arg) for arg in expr.args) + ")"
+    if isinstance(expr, Aggregation):
+        grouping = f" {'without' if expr.without else 'by'} ({', '.join(expr.grouping)})" if expr.grouping or expr.without else ""
+        param = format_expr(expr.param) + ", " if expr.param is not None else ""
+        return f"{expr.op}{grouping} ({param}{format_expr(expr.expr)})"
+    if isinstance(expr, Binary):
+        op = f"{expr.op} {expr.modifier}" if expr.modifier else expr.op
+        return f"{format_expr(expr.lhs)} {op} {format_expr(expr.rhs)}"
+    if isinstance(expr, Unary):
+        return f"{expr.op}{format_expr(expr.expr)}"
+    if isinstance(expr, Paren):
+        return f"({format_expr(expr.expr)})"
+    raise TypeError(f"Not a PromQL node: {expr!r}")
+
+
+def _children(expr):
+    if isinstance(expr, (Aggregation, Unary, Paren)):
+        return [expr.expr]
+    if isinstance(expr, Binary):
+        return [expr.lhs, expr.rhs]
+    if isinstance(expr, Call):
+        return list(expr.args)
+    return []
+
+
+def _selectors(expr):
+    if isinstance(expr, Selector):
+        yield expr
+    for child in _children(expr):
+        yield from _selectors(child)
+
+
+def _is_variable(value):
+    return _VARIABLE.search(value) is not None
+
+
+def _strip(expr):
+    """Expression without its outer parentheses."""
+    while isinstance(expr, Paren):
+        expr = expr.expr
+    return expr
+
+
+def _source(expr):
+    """(selector, range function or None) when expr is a selector, optionally inside one range function."""
+    expr = _strip(expr)
+    if isinstance(expr, Selector) and not expr.range:
+        return expr, None
+    if isinstance(expr, Call) and expr.func in RANGE_FUNCTIONS and len(expr.args) == 1:
+        selector = _strip(expr.args[0])
+        if isinstance(selector, Selector) and selector.range and not _is_variable(selector.range):
+            return selector, expr.func
+    return None
+
+
+class Candidate(NamedTuple):
+    rule_expr: str  # what Prometheus records
+    record_labels: Tuple[str, ...]  # labels kept in the stored series
+    variable_matchers: tuple  # matchers the dashboard applies to the stored series
+    expensive: bool
+
+
+def candidate(expr):
+    """Recording-rule candidate for an aggregation node, or None if it cannot be precomputed."""
+    if not isinstance(expr, Aggregation) or expr.param is not None or expr.without:
+        return None
+    source = _source(expr.expr)
+    if source is None or not source[0].name:
+        return None
+    selector, func = source
+    static = tuple(m for m in selector.matchers if not _is_variable(m[2]))
+    variable = tuple(m for m in selector.matchers if _is_variable(m[2]))
+    if variable and expr.op not in REAGGREGATE:
+        return None
+    labels = tuple(expr.grouping) + tuple(label for label, _, _ in variable if label not in expr.grouping)
+    inner = selector._replace(matchers=static)
+    if func is not None:
+        inner = Call(func, (inner,))
+    rule_expr = format_expr(Aggregation(expr.op, inner, labels))
+    # Regex matchers, including the dashboard variables', are evaluated against every raw series on each refresh
+    expensive = func is not None or any(op in ("=~", "!~") for _, op, _ in selector.matchers)
+    return Candidate(rule_expr, labels, variable, expensive)
+
+
+def rule_name(expr):
+    """level:metric:operations name, following the Prometheus naming convention."""
+    aggregation = _strip(parse(expr))
+    selector, func = _source(aggregation.expr)
+    level = "_".join(aggregation.grouping)
+    operations = aggregation.op + (f"_{func}{selector.range}" if func else "")
+    return f"{level}:{selector.name}:{operations}"
+
+
+def _walk(expr):
+    yield expr
+    for child in _children(expr):
+        yield from _walk(child)
+
+
+def dashboard_queries(dashboard):
+    """Every query target of the dashboard's panels, including panels nested in rows."""
+    def panels(items):
+        for panel in items:
+            yield panel
+            yield from panels(panel.get("panels", []))
+    for panel in panels(dashboard.get("panels", [])):
+        for target in panel.get("targets", []):
+            if target.get("expr"):
+                yield panel, target
+
+
+def plan(dashboard, min_uses=2):
+    """Recording rules, as {rule expression: name}, for the dashboard's costly or repeated aggregations."""
+    uses = {}
+    expensive = {}
+    for _, target in dashboard_queries(dashboard):
+        for node in _walk(parse(target["expr"])):
+            found = candidate(node)
+            if found is not None:
+                uses[found.rule_expr] = uses.get(found.rule_expr, 0) + 1
+                expensive[found.rule_expr] = found.expensive
+    rules = {}
+    names = set()
+    for expr in sorted(uses):
+        if expensive[expr] or uses[expr] >= min_uses:
+            name = base = rule_name(expr)
+            suffix = 2
+            while name in names:
+                name, suffix = f"{base}_{suffix}", suffix + 1
+            names.add(name)
+            rules[expr] = name
+    return rules
+
+
+def rewrite(expr, rules):
+    """expr with every aggregation that has a rule replaced by a lookup of the recorded series."""
+    found = candidate(expr)
+    if found is not None and found.rule_expr in rules:
+        stored = Selector(rules[found.rule_expr], found.variable_matchers)
+        if not found.variable_matchers:
+            return stored
+        return Aggregation(REAGGREGATE[expr.op], stored, expr.grouping)
+    if isinstance(expr, (Aggregation, Unary, Paren)):
+        return expr._replace(expr=rewrite(expr.expr, rules))
+    if isinstance(expr, Binary):
+        return expr._replace(lhs=rewrite(expr.lhs, rules), rhs=rewrite(expr.rhs, rules))
+    if isinstance(expr, Call):
+        return expr._replace(args=tuple(rewrite(arg, rules) for arg in expr.args))
+    return expr
+
+
+def rewrite_dashboard(dashboard, rules):
+    dashboard = copy.deepcopy(dashboard)
+    for _, target in dashboard_queries(dashboard):
+        rewritten = format_expr(rewrite(parse(target["expr"]), rules))
+        if rewritten != format_expr(parse(target["expr"])):
+            target["expr"] = rewritten
+    return dashboard
+
+
+def rules_group(rules, indent="    "):
+    """The recording rules as a Prometheus rule group, indented for the config map's block literal."""
+    lines = [f"- name: {GROUP_NAME}", "  rules:"]
+    for expr, name in sorted(rules.items(), key=lambda item: item[1]):
+        lines.append(f"  - record: {name}")
+        lines.append("    expr: '" + expr.replace("'", "''") + "'")
+    return "".join(f"{indent}{line}\n" for line in lines)
+
+
+def update_config_map(text, group):
+    """Replace (or add) the generated rule group in the prometheus.rules section of the config map."""
+    start = text.index("  prometheus.rules: |-\n") + len("  prometheus.rules: |-\n")
+    end = re.compile(r"^  \S", re.MULTILINE).search(text, start)
+    end = end.start() if end else len(text)
+    section = text[start:end]
+    existing = re.search(rf"^    - name: {GROUP_NAME}\n(?:     .*\n|\s*\n)*", section, re.MULTILINE)
+    if existing:
+        section = section[:existing.start()] + group + section[existing.end():]
+    else:
+        section = section.rstrip("\n") + "\n" + group
+    return text[:start] + section + text[end:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Prometheus recording rules for the Grafana dashboard")
+    parser.add_argument("--dashboard", default=DASHBOARD)
+    parser.add_argument("--dashboard-out", default=DASHBOARD_OUT)
+    parser.add_argument("--config-map", default=PROMETHEUS_CONFIG_MAP)
+    parser.add_argument("--min-uses", type=int, default=2, help="record cheap aggregations used at least this often")
+    parser.add_argument("--dry-run", action="store_true", help="print the rule group without writing files")
+    args = parser.parse_args(argv)
+
+    with open(args.dashboard) as dashboard_file:
+        dashboard = json.load(dashboard_file)
+    rules = plan(dashboard, args.min_uses)
+    group = rules_group(rules)
+    print(group, end="")
+    if args.dry_run:
+        return rules
+
+    # Keep the config map's line endings (CRLF in this repo)
+    with open(args.config_map, newline="") as config_map_file:
+        config_map = config_map_file.read()
+    newline = "\r\n" if "\r\n" in config_map else "\n"
+    config_map = update_config_map(config_map.replace("\r\n", "\n"), group)
+    with open(args.config_map, "w", newline="") as config_map_file:
+        config_map_file.write(config_map.replace("\n", newline))
+    with open(args.dashboard_out, "w") as dashboard_file:
+        json.dump(rewrite_dashboard(dashboard, rules), dashboard_file, indent=2)
+        dashboard_file.write("\n")
+    return rules
+
+
+if __name__ == "__main__":
+    main()
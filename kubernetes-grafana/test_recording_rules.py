@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+
+import recording_rules
+from recording_rules import PromQLError, format_expr, parse, plan, rewrite, rewrite_dashboard, rules_group, update_config_map
+
+CPU = 'sum (rate (container_cpu_usage_seconds_total{pod_name=~"^$Deployment.*$", kubernetes_io_hostname=~"^$Node$"}[2m])) / avg (machine_cpu_cores) * 100'
+
+
+def dashboard(*exprs):
+    return {"panels": [{"title": "row", "panels": [{"title": f"panel{i}", "targets": [{"refId": "A", "expr": expr}]} for i, expr in enumerate(exprs)]}]}
+
+
+def test_parse_and_format():
+    assert format_expr(parse(CPU)) == (
+        'sum (rate(container_cpu_usage_seconds_total{pod_name=~"^$Deployment.*$",kubernetes_io_hostname=~"^$Node$"}[2m]))'
+        " / avg (machine_cpu_cores) * 100"
+    )
+    assert format_expr(parse("sum by (a) (x)")) == format_expr(parse("sum(x) by (a)"))
+    assert format_expr(parse("- sum(x) or vector(0)")) == "-sum (x) or vector(0)"
+    assert format_expr(parse("a / on (node) group_left b")) == "a / on (node) group_left b"
+    with pytest.raises(PromQLError):
+        parse("sum(x")
+
+
+def test_variable_matchers_move_to_the_dashboard():
+    rules = plan(dashboard(CPU))
+    assert rules == {
+        "sum by (pod_name, kubernetes_io_hostname) (rate(container_cpu_usage_seconds_total[2m]))":
+            "pod_name_kubernetes_io_hostname:container_cpu_usage_seconds_total:sum_rate2m",
+    }
+    assert format_expr(rewrite(parse(CPU), rules)) == (
+        'sum (pod_name_kubernetes_io_hostname:container_cpu_usage_seconds_total:sum_rate2m{pod_name=~"^$Deployment.*$",kubernetes_io_hostname=~"^$Node$"})'
+        " / avg (machine_cpu_cores) * 100"
+    )
+
+
+def test_repeated_aggregations_are_recorded():
+    cheap = "avg(node_memory_MemTotal_bytes)"
+    assert plan(dashboard(cheap)) == {}
+    rules = plan(dashboard(cheap, cheap + " / 2"))
+    assert rules == {"avg (node_memory_MemTotal_bytes)": ":node_memory_MemTotal_bytes:avg"}
+    rewritten = rewrite_dashboard(dashboard(cheap, cheap + " / 2"), rules)
+    assert [panel["targets"][0]["expr"] for panel in rewritten["panels"][0]["panels"]] == [
+        ":node_memory_MemTotal_bytes:avg", ":node_memory_MemTotal_bytes:avg / 2",
+    ]
+
+
+def test_averages_with_variables_stay_raw():
+    expr = 'avg(machine_cpu_cores{kubernetes_io_hostname=~"^$Node$"})'
+    assert plan(dashboard(expr, expr)) == {}
+
+
+def test_update_config_map_replaces_the_generated_group():
+    text = "data:\n  prometheus.rules: |-\n    groups:\n    - name: demo alert\n      rules:\n      - alert: x\n  prometheus.yml: |-\n    global: {}\n"
+    group = rules_group({"sum by (a) (rate(x[1m]))": "a:x:sum_rate1m"})
+    once = update_config_map(text, group)
+    assert once.count("- name: grafana recording rules") == 1
+    assert update_config_map(once, group) == once
+    assert once.endswith("  prometheus.yml: |-\n    global: {}\n")
+    assert "- alert: x" in once
+
+
+def test_repo_dashboard_is_up_to_date():
+    with open(recording_rules.DASHBOARD) as dashboard_file:
+        rules = plan(json.load(dashboard_file))
+    with open(recording_rules.PROMETHEUS_CONFIG_MAP) as config_map_file:
+        config_map = config_map_file.read()
+    assert update_config_map(config_map, rules_group(rules)) == config_map
+    assert os.path.exists(recording_rules.DASHBOARD_OUT)
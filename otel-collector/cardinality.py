@@ -0,0 +1,298 @@
+"""Series-cardinality analyzer for Prometheus exposition text.
+
+Reads a scrape of the collector's Prometheus exporter (or any exposition text, plain
+or gzipped, one or several scrapes concatenated) line by line and reports the number
+of series per metric family and the number of distinct values per label. Distinct
+counts are exact for small sets and switch to HyperLogLog sketches above that, so
+memory depends on the number of metric and label names, not on the size of the dump.
+
+    curl -s http://<collector>:8090/metrics > scrape.prom
+    python otel-collector/cardinality.py scrape.prom
+    python otel-collector/cardinality.py --json big-dump.prom.gz
+
+High-cardinality labels are flagged and the report ends with collector config that
+would drop them (and the largest metric families, if asked to).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+
+COLLECTOR_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config-map.yaml")
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"')
+_SUFFIXES = {"histogram": ("_bucket", "_sum", "_count"), "summary": ("_sum", "_count"), "counter": ("_total",)}
+
+
+def _hash(value):
+    # Stable across runs, unlike hash() which is salted per process
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class DistinctCounter:
+    """Distinct count, exact up to exact_limit values and a HyperLogLog estimate above.
+
+    The sketch uses 2**precision one-byte registers (standard error 1.04 / sqrt(2**precision)).
+    """
+
+    def __init__(self, precision=12, exact_limit=128):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self._exact = set()
+        self._registers = None
+
+    def add(self, value):
+        self.add_hash(_hash(value))
+
+    def add_hash(self, value_hash):
+        """Add a value by its 64-bit hash, for callers counting the same value in several counters."""
+        if self._registers is None:
+            self._exact.add(value_hash)
+            if len(self._exact) > self.exact_limit:
+                self._registers = bytearray(1 << self.precision)
+                for exact_hash in self._exact:
+                    self._add_hash(exact_hash)
+                self._exact = None
+        else:
+            self._add_hash(value_hash)
+
+    def _add_hash(self, value_hash):
+        bits = 64 - self.precision
+        index = value_hash >> bits
+        rank = bits - (value_hash & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    @property
+    def exact(self):
+        return self._registers is None
+
+    def count(self):
+        if self._registers is None:
+            return len(self._exact)
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+
+def parse_series(line):
+    """(metric name, series text, [(label, value)]) of a sample line, or None for comments and blank lines."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    brace = line.find("{")
+    if brace == -1:
+        name = line.split(None, 1)[0]
+        return name, name, []
+    end = line.rfind("}")
+    return line[:brace].strip(), line[:end + 1], _LABEL.findall(line[brace + 1:end])
+
+
+class CardinalityAnalyzer:
+    """Streams exposition lines and keeps one distinct counter per family, per label and per (family, label)."""
+
+    def __init__(self, series_precision=12, label_precision=10):
+        self.series_precision = series_precision
+        self.label_precision = label_precision
+        self.lines = 0
+        self.samples = 0
+        self.families = {}  # family -> {"series": counter, "labels": {label: values counter}}
+        self.labels = {}  # label -> {"values": counter, "series": counter, "families": set}
+        self._types = {}  # metric family -> TYPE
+        self._total = DistinctCounter(series_precision)
+
+    def _family(self, name):
+        # Histogram, summary and counter samples belong to the family named in # TYPE
+        for suffix in ("_bucket", "_sum", "_count", "_total"):
+            if name.endswith(suffix):
+                family = name[: -len(suffix)]
+                if suffix in _SUFFIXES.get(self._types.get(family), ()):
+                    return family
+        return name
+
+    def feed_line(self, line):
+        self.lines += 1
+        if line.startswith("# TYPE "):
+            parts = line.split()
+            if len(parts) >= 4:
+                self._types[parts[2]] = parts[3]
+            return
+        parsed = parse_series(line)
+        if parsed is None:
+            return
+        name, series, labels = parsed
+        self.samples += 1
+        family = self._family(name)
+        # Exporters write the labels of a series in the same order every scrape, so its text identifies it
+        series_hash = _hash(series)
+        self._total.add_hash(series_hash)
+        stats = self.families.get(family)
+        if stats is None:
+            stats = self.families[family] = {"series": DistinctCounter(self.series_precision), "labels": {}}
+        stats["series"].add_hash(series_hash)
+        family_labels = stats["labels"]
+        for label, value in labels:
+            value_hash = _hash(value)
+            values = family_labels.get(label)
+            if values is None:
+                values = family_labels[label] = DistinctCounter(self.label_precision)
+            values.add_hash(value_hash)
+            label_stats = self.labels.get(label)
+            if label_stats is None:
+                label_stats = self.labels[label] = {
+                    "values": DistinctCounter(self.label_precision),
+                    "series": DistinctCounter(self.series_precision),
+                    "families": set(),
+                }
+            label_stats["values"].add_hash(value_hash)
+            label_stats["series"].add_hash(series_hash)
+            label_stats["families"].add(family)
+
+    def feed(self, lines):
+        for line in lines:
+            self.feed_line(line)
+        return self
+
+    def report(self, top=20, max_values=500, unique_ratio=0.5, max_series=10000):
+        """Series per family and values per label, with the labels and families worth dropping.
+
+        A label is flagged when it has more than max_values distinct values, or when nearly
+        every series has its own value (values / series >= unique_ratio, with at least 50
+        values), which is what identifiers such as container ids, pod uids and IPs look like.
+        """
+        total = self._total.count()
+        families = sorted(
+            ({"family": family, "series": stats["series"].count(), "labels": {label: counter.count() for label, counter in stats["labels"].items()}}
+             for family, stats in self.families.items()),
+            key=lambda item: -item["series"],
+        )
+        labels = []
+        for label, stats in self.labels.items():
+            values, series = stats["values"].count(), stats["series"].count()
+            labels.append({
+                "label": label,
+                "values": values,
+                "series": series,
+                "families": len(stats["families"]),
+                "high_cardinality": values > max_values or (values >= 50 and values >= unique_ratio * series),
+            })
+        labels.sort(key=lambda item: -item["values"])
+        return {
+            "lines": self.lines,
+            "samples": self.samples,
+            "series": total,
+            "exact": self._total.exact,
+            "families": families[:top],
+            "family_count": len(families),
+            "labels": labels[:top],
+            "high_cardinality_labels": [item for item in labels if item["high_cardinality"]],
+            "large_families": [item for item in families if item["series"] > max_series],
+        }
+
+
+def extra_metadata_labels(config_path):
+    """Attribute keys listed under extra_metadata_labels in a collector config (e.g. container.id)."""
+    if not config_path or not os.path.exists(config_path):
+        return []
+    keys = []
+    with open(config_path) as config_file:
+        lines = config_file.read().splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() == "extra_metadata_labels:":
+            indent = len(line) - len(line.lstrip())
+            for item in lines[i + 1:]:
+                if len(item) - len(item.lstrip()) <= indent or not item.strip().startswith("- "):
+                    break
+                keys.append(item.strip()[2:].strip().strip("\"'"))
+    return keys
+
+
+def _sanitize(key):
+    # Attribute keys become Prometheus label names with invalid characters replaced
+    return re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+def suggestions(report, collector_config=COLLECTOR_CONFIG, drop_families=False):
+    """Collector config (YAML text) that removes the flagged labels, and optionally the large families."""
+    flagged = [item["label"] for item in report["high_cardinality_labels"] if item["label"] not in ("le", "quantile")]
+    if not flagged and not (drop_families and report["large_families"]):
+        return ""
+    extra = {_sanitize(key): key for key in extra_metadata_labels(collector_config)}
+    lines = []
+    from_kubeletstats = [extra[label] for label in flagged if label in extra]
+    if from_kubeletstats:
+        lines += ["# kubeletstats receiver: stop adding these attributes", "extra_metadata_labels:  # remove " + ", ".join(from_kubeletstats)]
+    if flagged:
+        lines += ["# processors: drop the attributes before export, add to every metrics pipeline", "attributes/drop_high_cardinality:", "  actions:"]
+        for label in flagged:
+            lines += [f"    - key: {extra.get(label, label)}", "      action: delete"]
+        lines += [
+            "# prometheus receiver: drop the labels at scrape time, add to each scrape job",
+            "metric_relabel_configs:",
+            "  - action: labeldrop",
+            f"    regex: {'|'.join(flagged)}",
+        ]
+    if drop_families and report["large_families"]:
+        lines += ["# processors: exclude the largest metric families", "filter/large_families:", "  metrics:", "    exclude:", "      match_type: regexp", "      metric_names:"]
+        lines += [f'        - "^{re.escape(item["family"])}.*"' for item in report["large_families"]]
+    return "\n".join(lines) + "\n"
+
+
+def open_input(path):
+    """Text lines of a file, gzip if it ends in .gz, '-' for stdin."""
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace", buffering=1024 * 1024)
+
+
+def format_report(report):
+    lines = [f"{report['samples']} samples, {report['series']} series{'' if report['exact'] else ' (estimated)'} in {report['family_count']} metric families", ""]
+    lines.append(f"{'series':>10}  family (distinct values per label)")
+    for item in report["families"]:
+        label_counts = ", ".join(f"{label}={count}" for label, count in sorted(item["labels"].items(), key=lambda kv: -kv[1]))
+        lines.append(f"{item['series']:>10}  {item['family']} ({label_counts})")
+    lines += ["", f"{'values':>10} {'series':>10} {'families':>8}  label"]
+    for item in report["labels"]:
+        flag = "  <- high cardinality" if item["high_cardinality"] else ""
+        lines.append(f"{item['values']:>10} {item['series']:>10} {item['families']:>8}  {item['label']}{flag}")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Series cardinality of Prometheus exposition text")
+    parser.add_argument("paths", nargs="*", default=["-"], help="exposition files (.gz allowed), default stdin")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--max-values", type=int, default=500, help="flag labels with more distinct values than this")
+    parser.add_argument("--max-series", type=int, default=10000, help="report families with more series than this")
+    parser.add_argument("--drop-families", action="store_true", help="also suggest filtering out the large families")
+    parser.add_argument("--collector-config", default=COLLECTOR_CONFIG, help="used to map labels back to extra_metadata_labels")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    analyzer = CardinalityAnalyzer()
+    for path in args.paths:
+        with open_input(path) as lines:
+            analyzer.feed(lines)
+    report = analyzer.report(args.top, args.max_values, max_series=args.max_series)
+    report["suggested_config"] = suggestions(report, args.collector_config, args.drop_families)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+        if report["suggested_config"]:
+            print("Suggested collector config:\n")
+            print(report["suggested_config"])
+    return report
+
+
+if __name__ == "__main__":
+    main()
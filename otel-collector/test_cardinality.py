@@ -0,0 +1,73 @@
+import gzip
+
+import pytest
+
+from cardinality import CardinalityAnalyzer, DistinctCounter, extra_metadata_labels, main, parse_series, suggestions, COLLECTOR_CONFIG
+
+
+def scrape(pods=200, containers=3):
+    lines = ["# HELP container_cpu_usage_seconds_total CPU", "# TYPE container_cpu_usage_seconds_total counter"]
+    for pod in range(pods):
+        for container in range(containers):
+            lines.append(f'container_cpu_usage_seconds_total{{namespace="ns{pod % 4}",pod="pod{pod}",container_id="{pod:04x}{container:04x}"}} {pod}.5')
+    lines += ["# TYPE http_duration histogram"]
+    for le in ("0.1", "1", "+Inf"):
+        lines.append(f'http_duration_bucket{{route="/",le="{le}"}} 3')
+    lines += ['http_duration_sum{route="/"} 1.5', 'http_duration_count{route="/"} 3', "up 1", ""]
+    return [line + "\n" for line in lines]
+
+
+def test_parse_series():
+    assert parse_series('m{a="x,y",b="q\\"}"} 1 1700000000') == ("m", 'm{a="x,y",b="q\\"}"}', [("a", "x,y"), ("b", 'q\\"}')])
+    assert parse_series("up 1") == ("up", "up", [])
+    assert parse_series("# HELP up x") is None
+
+
+def test_distinct_counter_exact_then_estimated():
+    counter = DistinctCounter(exact_limit=100)
+    for i in range(100):
+        counter.add(f"v{i % 50}")
+    assert counter.exact and counter.count() == 50
+    for i in range(100000):
+        counter.add(f"v{i}")
+    assert not counter.exact
+    assert abs(counter.count() - 100000) / 100000 < 0.05
+
+
+def test_report_counts_families_and_labels():
+    report = CardinalityAnalyzer().feed(scrape()).report()
+    families = {item["family"]: item for item in report["families"]}
+    # Above the exact limit counts are HyperLogLog estimates
+    assert families["container_cpu_usage_seconds_total"]["series"] == pytest.approx(600, rel=0.02)
+    labels = families["container_cpu_usage_seconds_total"]["labels"]
+    assert labels["namespace"] == 4 and labels["pod"] == pytest.approx(200, rel=0.05) and labels["container_id"] == pytest.approx(600, rel=0.05)
+    assert families["http_duration"]["series"] == 5
+    assert report["samples"] == 606
+    # Every series has its own container_id, pods are shared by three series
+    assert [item["label"] for item in report["high_cardinality_labels"]] == ["container_id"]
+
+
+def test_repeated_scrapes_do_not_inflate_series():
+    report = CardinalityAnalyzer().feed(scrape() * 3).report()
+    assert report["samples"] == 3 * 606
+    assert report["series"] == pytest.approx(606, rel=0.02)
+
+
+def test_suggestions_map_back_to_extra_metadata_labels():
+    assert extra_metadata_labels(COLLECTOR_CONFIG) == ["container.id"]
+    report = CardinalityAnalyzer().feed(scrape()).report()
+    config = suggestions(report)
+    assert "extra_metadata_labels:  # remove container.id" in config
+    assert "- key: container.id" in config
+    assert "regex: container_id" in config
+    assert suggestions(CardinalityAnalyzer().feed(scrape(pods=2)).report()) == ""
+
+
+def test_gzip_dump(tmp_path, capsys):
+    path = tmp_path / "scrape.prom.gz"
+    with gzip.open(path, "wt") as dump:
+        dump.writelines(scrape())
+    report = main([str(path), "--max-series", "100", "--drop-families"])
+    assert report["series"] == pytest.approx(606, rel=0.02)
+    assert '- "^container_cpu_usage_seconds_total.*"' in report["suggested_config"]
+    assert "high cardinality" in capsys.readouterr().out
@@ -0,0 +1,33 @@
+import numpy as np
+
+# Battery metrics simulated by energy_data.py and the load generator.
+# Each entry is (name, description, unit, distribution), see parse_distribution.
+BATTERY_METRICS = [
+    ("battery_percentage", "Current battery level as a percentage.", "%", "uniform:0:100"),
+    ("battery_power_draw_watts", "Current power draw of the battery in watts.", "W", "uniform:10:30"),
+    ("battery_charge_rate_watts", "Rate at which the battery is charging in watts.", "W", "uniform:15:25"),
+    ("battery_discharge_rate_watts", "Rate at which the battery is discharging in watts.", "W", "uniform:5:15"),
+    ("battery_health_percent", "Current health of the battery as a percentage.", "%", "uniform:80:100"),
+    ("battery_voltage_volts", "Current voltage of the battery in volts.", "V", "uniform:3.0:4.2"),
+    ("battery_temperature_celsius", "Current temperature of the battery in Celsius.", "C", "uniform:20:40"),
+    ("battery_remaining_time_seconds", "Estimated remaining time of battery usage in seconds.", "s", "uniform:3600:14400"),  # 1 to 4 hours
+    ("battery_cycle_count", "Total number of charge cycles the battery has undergone.", "count", "randint:100:500"),
+]
+
+
+def parse_distribution(spec):
+    """Turn "uniform:lo:hi", "normal:mean:std", "randint:lo:hi", "exponential:scale" or
+    "constant:value" into a function drawing an array of values: sample(rng, size)."""
+    kind, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if kind == "uniform":
+        return lambda rng, size: rng.uniform(params[0], params[1], size)
+    if kind == "normal":
+        return lambda rng, size: rng.normal(params[0], params[1], size)
+    if kind == "randint":
+        return lambda rng, size: rng.integers(int(params[0]), int(params[1]) + 1, size)
+    if kind == "exponential":
+        return lambda rng, size: rng.exponential(params[0], size)
+    if kind == "constant":
+        return lambda rng, size: np.full(size, params[0])
+    raise ValueError(f"Unknown distribution {spec}")
@@ -1,12 +1,18 @@
-import random
+import os
+import sys
 import time
 import socket
+import numpy as np
 from opentelemetry import metrics
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.metrics import Observation, CallbackOptions
+from battery import BATTERY_METRICS, parse_distribution
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-metrics"))
+from common.snapshot import CycleSnapshot
+from common.runtime import current
 
 # Function to get the IP address of the current machine
 def get_instance_ip():
@@ -21,114 +27,49 @@ EXPORT_INTERVAL_SEC = 10  # Export interval in seconds
 # Get the IP address of the instance
 INSTANCE_IP = get_instance_ip()
 
-# Set up the OpenTelemetry MeterProvider with a gRPC exporter
-resource = Resource.create({
-    "service.name": "battery-monitoring-service",
-    "service.namespace": "example",
-    "service.version": "1.0.0"
-})
+# Hosted by agent_runtime.py the battery gauges share the runtime's MeterProvider and exporter
+runtime = current()
+if runtime is None:
+    # Set up the OpenTelemetry MeterProvider with a gRPC exporter
+    resource = Resource.create({
+        "service.name": "battery-monitoring-service",
+        "service.namespace": "example",
+        "service.version": "1.0.0"
+    })
+
+    # Create the OTLP Metric Exporter using gRPC protocol
+    metric_exporter = OTLPMetricExporter(endpoint=COLLECTOR_ENDPOINT, insecure=True)
 
-# Create the OTLP Metric Exporter using gRPC protocol
-metric_exporter = OTLPMetricExporter(endpoint=COLLECTOR_ENDPOINT, insecure=True)
+    # Create a Periodic Exporting Metric Reader to export metrics at a defined interval
+    metric_reader = PeriodicExportingMetricReader(metric_exporter, export_interval_millis=EXPORT_INTERVAL_SEC * 1000)
 
-# Create a Periodic Exporting Metric Reader to export metrics at a defined interval
-metric_reader = PeriodicExportingMetricReader(metric_exporter, export_interval_millis=EXPORT_INTERVAL_SEC * 1000)
+    # Initialize the MeterProvider with the metric reader and resource
+    provider = MeterProvider(metric_readers=[metric_reader], resource=resource)
 
-# Initialize the MeterProvider with the metric reader and resource
-provider = MeterProvider(metric_readers=[metric_reader], resource=resource)
+    # Set the global meter provider
+    metrics.set_meter_provider(provider)
 
-# Set the global meter provider
-metrics.set_meter_provider(provider)
+    # Get a meter from the global meter provider
+    meter = metrics.get_meter("battery_monitor", "1.0.0")
+else:
+    meter = runtime.meter("battery_monitor", "1.0.0")
 
-# Get a meter from the global meter provider
-meter = metrics.get_meter("battery_monitor", "1.0.0")
+# Draw all battery metrics once per collection cycle, every gauge reads its own slot
+samplers = [parse_distribution(spec) for *_, spec in BATTERY_METRICS]
+rng = np.random.default_rng()
 
-# Function to generate random battery metrics
-def get_battery_metrics(_: CallbackOptions):
+def get_battery_metrics():
     # Add 'instance' label with the IP address
     attributes = {"device": "battery0", "instance": INSTANCE_IP}
-    
-    # Generate random values for each metric within a reasonable range
-    battery_metrics = [
-        {"name": "battery_percentage", "description": "Current battery level as a percentage.", "unit": "%", "value": random.uniform(0, 100)},
-        {"name": "battery_power_draw_watts", "description": "Current power draw of the battery in watts.", "unit": "W", "value": random.uniform(10, 30)},
-        {"name": "battery_charge_rate_watts", "description": "Rate at which the battery is charging in watts.", "unit": "W", "value": random.uniform(15, 25)},
-        {"name": "battery_discharge_rate_watts", "description": "Rate at which the battery is discharging in watts.", "unit": "W", "value": random.uniform(5, 15)},
-        {"name": "battery_health_percent", "description": "Current health of the battery as a percentage.", "unit": "%", "value": random.uniform(80, 100)},
-        {"name": "battery_voltage_volts", "description": "Current voltage of the battery in volts.", "unit": "V", "value": random.uniform(3.0, 4.2)},
-        {"name": "battery_temperature_celsius", "description": "Current temperature of the battery in Celsius.", "unit": "C", "value": random.uniform(20, 40)},
-        {"name": "battery_remaining_time_seconds", "description": "Estimated remaining time of battery usage in seconds.", "unit": "s", "value": random.uniform(3600, 14400)},  # 1 to 4 hours
-        {"name": "battery_cycle_count", "description": "Total number of charge cycles the battery has undergone.", "unit": "count", "value": random.randint(100, 500)},
-    ]
+    values = [sample(rng, 1)[0] for sample in samplers]
+    return [attributes], [values]
 
-    # Yield each metric as an Observation
-    for metric in battery_metrics:
-        yield Observation(metric["value"], attributes)
+battery_snapshot = CycleSnapshot(get_battery_metrics, [name for name, *_ in BATTERY_METRICS])
 
 # Create observable gauges for each battery metric
-battery_percentage_gauge = meter.create_observable_gauge(
-    name="battery_percentage",
-    description="Current battery level as a percentage.",
-    unit="%",
-    callbacks=[get_battery_metrics],
-)
-
-battery_power_draw_watts_gauge = meter.create_observable_gauge(
-    name="battery_power_draw_watts",
-    description="Current power draw of the battery in watts.",
-    unit="W",
-    callbacks=[get_battery_metrics],
-)
-
-battery_charge_rate_watts_gauge = meter.create_observable_gauge(
-    name="battery_charge_rate_watts",
-    description="Rate at which the battery is charging in watts.",
-    unit="W",
-    callbacks=[get_battery_metrics],
-)
-
-battery_discharge_rate_watts_gauge = meter.create_observable_gauge(
-    name="battery_discharge_rate_watts",
-    description="Rate at which the battery is discharging in watts.",
-    unit="W",
-    callbacks=[get_battery_metrics],
-)
-
-battery_health_percent_gauge = meter.create_observable_gauge(
-    name="battery_health_percent",
-    description="Current health of the battery as a percentage.",
-    unit="%",
-    callbacks=[get_battery_metrics],
-)
-
-battery_voltage_volts_gauge = meter.create_observable_gauge(
-    name="battery_voltage_volts",
-    description="Current voltage of the battery in volts.",
-    unit="V",
-    callbacks=[get_battery_metrics],
-)
-
-battery_temperature_celsius_gauge = meter.create_observable_gauge(
-    name="battery_temperature_celsius",
-    description="Current temperature of the battery in Celsius.",
-    unit="C",
-    callbacks=[get_battery_metrics],
-)
-
-battery_remaining_time_seconds_gauge = meter.create_observable_gauge(
-    name="battery_remaining_time_seconds",
-    description="Estimated remaining time of battery usage in seconds.",
-    unit="s",
-    callbacks=[get_battery_metrics],
-)
-
-battery_cycle_count_gauge = meter.create_observable_gauge(
-    name="battery_cycle_count",
-    description="Total number of charge cycles the battery has undergone.",
-    unit="count",
-    callbacks=[get_battery_metrics],
-)
+battery_gauges = battery_snapshot.create_gauges(meter, [(name, description, unit) for name, description, unit, _ in BATTERY_METRICS])
 
-print("Sending battery metrics using gRPC to OTEL Collector...")
-while True:
-    time.sleep(EXPORT_INTERVAL_SEC)  # Wait for the next export interval
\ No newline at end of file
+if __name__ == "__main__":
+    print("Sending battery metrics using gRPC to OTEL Collector...")
+    while True:
+        time.sleep(EXPORT_INTERVAL_SEC)  # Wait for the next export interval
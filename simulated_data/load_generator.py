@@ -0,0 +1,173 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import grpc
+import numpy as np
+import requests
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2, metrics_service_pb2_grpc
+
+from battery import BATTERY_METRICS, parse_distribution
+
+# The local OTLP sink is shared with the agents
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-metrics"))
+from common.otlp_sink import OTLPSink
+
+
+def metric_catalog(metrics_per_device, distribution=None):
+    """(name, description, unit, distribution) for each metric, cycling over the battery metrics."""
+    catalog = []
+    for i in range(metrics_per_device):
+        name, description, unit, default = BATTERY_METRICS[i % len(BATTERY_METRICS)]
+        if i >= len(BATTERY_METRICS):
+            name = f"{name}_{i // len(BATTERY_METRICS)}"
+        catalog.append((name, description, unit, distribution or default))
+    return catalog
+
+
+def build_batch(devices, catalog, instance, label_cardinality=1, extra_labels=0):
+    """Build a reusable export request for a range of devices.
+
+    Returns the request and, per metric, the list of its data points, so each cycle
+    only has to write new values and timestamps into the same protobuf objects.
+    """
+    request = metrics_service_pb2.ExportMetricsServiceRequest()
+    resource_metrics = request.resource_metrics.add()
+    for key, value in (("service.name", "battery-monitoring-service"), ("service.namespace", "example"), ("service.version", "1.0.0")):
+        attribute = resource_metrics.resource.attributes.add()
+        attribute.key, attribute.value.string_value = key, value
+    scope_metrics = resource_metrics.scope_metrics.add()
+    scope_metrics.scope.name = "battery_monitor"
+
+    points = []
+    for name, description, unit, _ in catalog:
+        metric = scope_metrics.metrics.add()
+        metric.name, metric.description, metric.unit = name, description, unit
+        metric_points = []
+        for device in devices:
+            point = metric.gauge.data_points.add()
+            labels = {"device": f"battery{device}", "instance": instance, "rack": f"rack{device % label_cardinality}"}
+            for label in range(extra_labels):
+                labels[f"label{label}"] = f"value{(device // label_cardinality + label) % label_cardinality}"
+            for key, value in labels.items():
+                attribute = point.attributes.add()
+                attribute.key, attribute.value.string_value = key, value
+            metric_points.append(point)
+        points.append(metric_points)
+    return request, points
+
+
+def _sender(protocol, endpoint):
+    if protocol == "grpc":
+        target = endpoint.split("://", 1)[-1]
+        stub = metrics_service_pb2_grpc.MetricsServiceStub(grpc.insecure_channel(target))
+        return lambda request, data: stub.Export(request, timeout=10)
+    session = requests.Session()
+    headers = {"Content-Type": "application/x-protobuf"}
+    return lambda request, data: session.post(endpoint, data=data, headers=headers, timeout=10).raise_for_status()
+
+
+def run_worker(options, index, devices, rate):
+    """Send every device's metrics in batches at `rate` observations per second for the run duration."""
+    rng = np.random.default_rng(options["seed"] + index)
+    catalog = metric_catalog(options["metrics_per_device"], options["distribution"])
+    samplers = [parse_distribution(spec) for *_, spec in catalog]
+    devices_per_batch = max(1, options["batch_size"] // len(catalog))
+    batches = [
+        build_batch(devices[start:start + devices_per_batch], catalog, options["instance"], options["label_cardinality"], options["extra_labels"])
+        for start in range(0, len(devices), devices_per_batch)
+    ]
+    send = _sender(options["protocol"], options["endpoint"])
+
+    stats = {"data_points": 0, "requests": 0, "bytes": 0, "errors": 0}
+    start = time.perf_counter()
+    deadline = start + options["duration"]
+    while time.perf_counter() < deadline:
+        for request, points in batches:
+            size = len(points[0])
+            # One vectorized draw per metric for the whole batch
+            values = [sampler(rng, size).tolist() for sampler in samplers]
+            now = time.time_ns()
+            for metric_points, metric_values in zip(points, values):
+                for point, value in zip(metric_points, metric_values):
+                    point.as_double = value
+                    point.time_unix_nano = now
+            data = request.SerializeToString()
+            try:
+                send(request, data)
+                stats["data_points"] += size * len(points)
+                stats["requests"] += 1
+                stats["bytes"] += len(data)
+            except Exception:
+                stats["errors"] += 1
+            if rate:
+                ahead = start + stats["data_points"] / rate - time.perf_counter()
+                if ahead > 0:
+                    time.sleep(ahead)
+            if time.perf_counter() >= deadline:
+                break
+    stats["elapsed_s"] = time.perf_counter() - start
+    return stats
+
+
+def run(options):
+    """Spread the devices over a process pool and return the aggregated report."""
+    processes = max(1, min(options["processes"], options["devices"]))
+    shares = np.array_split(np.arange(options["devices"]), processes)
+    rate = options["rate"] / processes if options["rate"] else 0
+    # spawn keeps gRPC state of the parent (e.g. a local sink) out of the workers
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.starmap(run_worker, [(options, i, share.tolist(), rate) for i, share in enumerate(shares)])
+
+    elapsed = max(result["elapsed_s"] for result in results)
+    totals = {key: sum(result[key] for result in results) for key in ("data_points", "requests", "bytes", "errors")}
+    return {
+        "series": options["devices"] * options["metrics_per_device"],
+        "processes": processes,
+        "target_obs_per_s": options["rate"],
+        "achieved_obs_per_s": totals["data_points"] / elapsed if elapsed else 0,
+        "elapsed_s": elapsed,
+        **totals,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic battery telemetry load generator")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--metrics-per-device", type=int, default=len(BATTERY_METRICS))
+    parser.add_argument("--label-cardinality", type=int, default=10, help="distinct values of the rack (and extra) labels")
+    parser.add_argument("--extra-labels", type=int, default=0)
+    parser.add_argument("--distribution", help="override every metric's distribution, e.g. normal:50:10")
+    parser.add_argument("--rate", type=float, default=100000, help="target observations per second, 0 for unlimited")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=5000, help="data points per export request")
+    parser.add_argument("--protocol", choices=["grpc", "http"], default="grpc")
+    parser.add_argument("--endpoint", default=os.getenv("COLLECTOR_ENDPOINT"), help="collector endpoint, default COLLECTOR_ENDPOINT")
+    parser.add_argument("--local-sink", action="store_true", help="send to a local OTLP sink instead of a collector")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    options = vars(args)
+    options["instance"] = socket.gethostname()
+    sink = None
+    if args.local_sink or not args.endpoint:
+        sink = OTLPSink().start()
+        options["endpoint"] = sink.grpc_endpoint if args.protocol == "grpc" else sink.http_endpoint
+    try:
+        report = run(options)
+        if sink is not None:
+            report["sink"] = sink.stats()
+    finally:
+        if sink is not None:
+            sink.stop()
+    print(json.dumps(report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
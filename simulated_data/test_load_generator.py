@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import load_generator
+from common.otlp_sink import OTLPSink
+
+
+def test_parse_distribution():
+    rng = np.random.default_rng(0)
+    values = load_generator.parse_distribution("uniform:3.0:4.2")(rng, 1000)
+    assert values.shape == (1000,) and values.min() >= 3.0 and values.max() <= 4.2
+    counts = load_generator.parse_distribution("randint:100:500")(rng, 1000)
+    assert counts.min() >= 100 and counts.max() <= 500
+    assert (load_generator.parse_distribution("constant:7")(rng, 3) == 7).all()
+    with pytest.raises(ValueError):
+        load_generator.parse_distribution("zipf:2")
+
+
+def test_metric_catalog_cycles_battery_metrics():
+    catalog = load_generator.metric_catalog(20, "normal:0:1")
+    names = [name for name, *_ in catalog]
+    assert len(set(names)) == 20
+    assert names[9] == "battery_percentage_1"
+    assert all(spec == "normal:0:1" for *_, spec in catalog)
+
+
+def test_label_cardinality():
+    catalog = load_generator.metric_catalog(1)
+    request, points = load_generator.build_batch(range(100), catalog, "host", label_cardinality=5, extra_labels=2)
+    racks = {attr.value.string_value for point in points[0] for attr in point.attributes if attr.key == "rack"}
+    assert len(points[0]) == 100
+    assert racks == {f"rack{i}" for i in range(5)}
+
+
+@pytest.mark.parametrize("protocol", ["grpc", "http"])
+def test_worker_reaches_local_sink_at_target_rate(protocol):
+    sink = OTLPSink().start()
+    try:
+        options = {
+            "seed": 0, "metrics_per_device": 9, "distribution": None, "batch_size": 900, "instance": "host",
+            "label_cardinality": 10, "extra_labels": 0, "protocol": protocol, "duration": 1.0,
+            "endpoint": sink.grpc_endpoint if protocol == "grpc" else sink.http_endpoint,
+        }
+        stats = load_generator.run_worker(options, 0, list(range(200)), rate=5000)
+    finally:
+        sink.stop()
+    assert stats["errors"] == 0
+    assert sink.stats()["data_points"] == stats["data_points"]
+    assert 4000 <= stats["data_points"] / stats["elapsed_s"] <= 6500